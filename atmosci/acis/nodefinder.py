@@ -1,15 +1,58 @@
 
+import numpy as N
+
+from atmosci.acis.gridinfo import ACIS_GRID_DIMENSIONS, ACIS_NODE_SPACING
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-class AcisGridNodeFinder(object):
+OUT_OF_BOUNDS = '%d of %d points are outside the bounds of the ACIS %s grid'
+OUT_OF_BOUNDS += ' (%s, %s) to (%s, %s).'
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def roundHalfAway(values, precision=0):
+    """ Array version of Python 2's round(), which rounds halves away
+    from zero instead of to the nearest even number like N.around.
+    """
+    values = N.asarray(values, dtype=float)
+    if precision: values = values * (10.0 ** precision)
+    rounded = N.copysign(N.floor(N.absolute(values) + 0.5), values)
+    if precision: rounded /= 10.0 ** precision
+    return rounded
 
-    def __init__(self, region='conus'):
-        self.spacing = 0.041667
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class AcisGridNodeFinder(object):
+    """ Finds the ACIS grid node closest to lon/lat points by calculation.
+
+    Arguments:
+    ---------
+        region: name of ACIS region ('conus' or 'NE') or a region object
+        min_lon: optional longitude of the first grid column. Use this
+                 and min_lat for grids that are a subset of a region.
+        min_lat: optional latitude of the first grid row
+        dimensions: optional (rows, columns) tuple with the grid shape
+        spacing: optional distance between grid nodes in degrees
+    """
+
+    def __init__(self, region='conus', min_lon=None, min_lat=None,
+                       dimensions=None, spacing=None):
+        if spacing is None: self.spacing = 0.041667
+        else: self.spacing = spacing
         if isinstance(region, basestring):
             self._init_region_dimenasions_(region.lower())
         else: # assume it is a legit region object
             self._init_region_dimenasions_(region.name)
 
+        if min_lon is not None:
+            self.min_lon = float(min_lon)
+            self.abs_lon = abs(self.min_lon)
+        if min_lat is not None: self.min_lat = float(min_lat)
+        if dimensions is not None:
+            self.num_rows, self.num_columns = dimensions
+        self.max_lat = self.min_lat + ((self.num_rows-1) * self.spacing)
+        self.max_lon = self.min_lon + ((self.num_columns-1) * self.spacing)
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def __call__(self, lon, lat, precision):
@@ -18,38 +61,89 @@ class AcisGridNodeFinder(object):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def inBounds(self, lons, lats):
+        """ Returns a boolean array that is True for each lon/lat point
+        whose closest node is inside the grid.
+        """
+        half = self.spacing / 2.
+        lons = N.asarray(lons, dtype=float)
+        lats = N.asarray(lats, dtype=float)
+        return ( (lons >= self.min_lon - half) & (lons < self.max_lon + half)
+               & (lats >= self.min_lat - half) & (lats < self.max_lat + half) )
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def nearestNodeLon(self, lon, precision=3):
         spacing = self.spacing
-	diff = self.abs_lon + lon
-	offset = round(diff / spacing) * spacing
-	node_lon =  self.min_lon + offset
-	return round(node_lon, precision)
+        diff = self.abs_lon + lon
+        offset = round(diff / spacing) * spacing
+        node_lon =  self.min_lon + offset
+        return round(node_lon, precision)
+
+    def nearestNodeLons(self, lons, precision=3):
+        """ Array version of nearestNodeLon.
+        """
+        offsets = self._nodeOffsets(lons, self.min_lon)
+        offsets *= self.spacing
+        offsets += self.min_lon
+        return roundHalfAway(offsets, precision)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def nearestNodeLat(self, lat, precision=3):
         spacing = self.spacing
-	diff = lat - self.min_lat
-	offset = round(diff / spacing) * spacing
-	node_lat = self.min_lat + offset
-	return round(node_lat, precision)
-
-    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        diff = lat - self.min_lat
+        offset = round(diff / spacing) * spacing
+        node_lat = self.min_lat + offset
+        return round(node_lat, precision)
+
+    def nearestNodeLats(self, lats, precision=3):
+        """ Array version of nearestNodeLat.
+        """
+        offsets = self._nodeOffsets(lats, self.min_lat)
+        offsets *= self.spacing
+        offsets += self.min_lat
+        return roundHalfAway(offsets, precision)
+
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _checkBounds(self, lons, lats):
+        inside = self.inBounds(lons, lats)
+        if not inside.all():
+            info = (inside.size - N.count_nonzero(inside), inside.size,
+                    self.region, self.min_lon, self.min_lat, self.max_lon,
+                    self.max_lat)
+            raise ValueError, OUT_OF_BOUNDS % info
+
+    def _nodeOffsets(self, coords, minimum):
+        offsets = N.array(coords, dtype=float)
+        offsets -= minimum
+        offsets /= self.spacing
+        return roundHalfAway(offsets)
 
     def _init_region_dimenasions_(self, region):
         if region == 'ne':
             self.min_lat = 37.125
             self.min_lon =  -82.75
+            dimensions = ACIS_GRID_DIMENSIONS['NE']
+            self.region = 'NE'
         else: # default to continental US
-           self.min_lat = 24.0
-           self.min_lon = -125.0
+            self.min_lat = 24.0
+            self.min_lon = -125.0
+            dimensions = ACIS_GRID_DIMENSIONS['conus']
+            self.region = 'conus'
         self.abs_lon = abs(self.min_lon)
+        self.num_columns = dimensions['lon']
+        self.num_rows = dimensions['lat']
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 class AcisGridNodeIndexer(AcisGridNodeFinder):
 
     def __call__(self, lon, lat):
+        if isinstance(lon, (N.ndarray, list, tuple)):
+            return self.nearestNodes(lon, lat)
+        self._checkBounds(lon, lat)
         return self.nearestNode(lon, lat)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -63,3 +157,58 @@ class AcisGridNodeIndexer(AcisGridNodeFinder):
         if indexes_only: return y, x
         else: return y, x, near_lon, near_lat
 
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def nearestNodes(self, lons, lats, precision=3, indexes_only=True,
+                           check_bounds=True):
+        """ Array version of nearestNode. Returns arrays of y and x indexes
+        (plus arrays of node lons and lats when indexes_only is False)
+        with the same shape as the lons and lats arrays.
+
+        When check_bounds is True, ValueError is raised if any point is
+        outside the grid. Use inBounds() to filter points beforehand.
+        """
+        if check_bounds: self._checkBounds(lons, lats)
+        x = self._nodeOffsets(lons, self.min_lon).astype(N.int64)
+        y = self._nodeOffsets(lats, self.min_lat).astype(N.int64)
+        if indexes_only: return y, x
+
+        spacing = self.spacing
+        near_lons = roundHalfAway((x * spacing) + self.min_lon, precision)
+        near_lats = roundHalfAway((y * spacing) + self.min_lat, precision)
+        return y, x, near_lons, near_lats
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def acisGridNodeIndexer(lons, lats, spacing=ACIS_NODE_SPACING, tolerance=0.05):
+    """ Returns an AcisGridNodeIndexer for a grid with the lons and lats
+    passed when they are a regular ACIS grid (i.e. rows of constant
+    latitude and columns of constant longitude, increasing from index 0
+    in steps of the ACIS node spacing). Returns None for any other grid.
+
+    tolerance is the maximum allowable deviation from the ACIS grid as
+    a fraction of the node spacing.
+    """
+    if lons is None or lats is None or lons.ndim != 2: return None
+    if lons.shape[0] < 2 or lons.shape[1] < 2: return None
+    min_lon = float(lons[0,0])
+    min_lat = float(lats[0,0])
+    allowance = spacing * tolerance
+    # use the spacing in the file, it may have been stored with less
+    # precision than ACIS_NODE_SPACING
+    measured = (float(lons[0,-1]) - min_lon) / (lons.shape[1] - 1)
+    if not abs(measured - spacing) <= allowance: return None
+
+    steps = N.arange(max(lons.shape), dtype=float) * measured
+    errors = N.seterr(invalid='ignore')
+    try:
+        expected = steps[:lons.shape[1]] + min_lon
+        if not (N.absolute(lons - expected) <= allowance).all(): return None
+        expected = (steps[:lats.shape[0]] + min_lat).reshape(-1,1)
+        if not (N.absolute(lats - expected) <= allowance).all(): return None
+    finally:
+        N.seterr(**errors)
+
+    region = 'NE' if min_lon > -100. else 'conus'
+    return AcisGridNodeIndexer(region, min_lon, min_lat, lons.shape, measured)
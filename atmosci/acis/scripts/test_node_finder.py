@@ -2,6 +2,8 @@
 
 import os
 
+import numpy as N
+
 from atmosci.acis import ACIS_DIRPATH
 from atmosci.acis.nodefinder import AcisGridNodeIndexer
 
@@ -18,13 +20,13 @@ offset = spacing * 0.2
 
 node_indexer = AcisGridNodeIndexer('NE')
 
-for i in range(lat.shape[0]):
-    olat = lat[i,i] + offset
-    olon = lon[i,i] + offset
+diagonal = N.arange(min(lat.shape))
+olat = lat[diagonal,diagonal] + offset
+olon = lon[diagonal,diagonal] + offset
 
-    y, x, flon, flat = node_indexer(olon, olat, 3, False)
+y, x, flon, flat = node_indexer.nearestNodes(olon, olat, 3, False)
 
+for i in diagonal:
     print '\n'
-    print lat[i,i], olat, flat, y, lat[x, y]
-    print lon[i,i], olon, flon, x, lon[x, y]
-
+    print lat[i,i], olat[i], flat[i], y[i], lat[x[i], y[i]]
+    print lon[i,i], olon[i], flon[i], x[i], lon[x[i], y[i]]
@@ -3,6 +3,14 @@ import numpy as N
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+def missingMask(data_array, missing_value):
+    if N.isnan(missing_value):
+        if data_array.dtype.kind == 'f': return N.isnan(data_array)
+        return N.zeros(data_array.shape, dtype=bool)
+    return data_array == missing_value
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
 class BaseDetector(object):
 
     def __init__(self, data_type, missing_value):
@@ -27,6 +35,7 @@ class BaseDetector(object):
         self.isEqual = _isEqual
         self.isMissing = _isMissing
         self.countMissing = _countMissing
+        self._missing_value = missing_value
 
         self.detected = None
         self.filters = None
@@ -64,6 +73,15 @@ class BaseDetector(object):
 
     # - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - - -
 
+    def missingMask(self, data_array):
+        """ Vectorized version of isMissing ... returns a boolean array
+        with the same shape as data_array that is True wherever the
+        value is missing.
+        """
+        return missingMask(data_array, self._missing_value)
+
+    # - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - - -
+
     def applyFilters(self, filters):
         return None
 
@@ -4,6 +4,10 @@ from datetime import datetime
 
 import numpy as N
 from scipy.interpolate import UnivariateSpline
+try:
+    from scipy.interpolate import CubicSpline
+except ImportError: # older scipy, splines are fit one series at a time
+    CubicSpline = None
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -93,3 +97,88 @@ def interpolateExtremes(time_series_array, points_per_knot=5, smoothing=0,
 
     return min_value, min_index, max_value, max_index
 
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def interpolateExtremesArray(time_series_array, points_per_knot=5,
+                             smoothing=0, missing_value=None, axis=-1):
+    """ Batch version of interpolateExtremes. Interpolates the minimum
+    and maximum value and the time interval at which they occurred for
+    every time series in an array with a single call. All series are
+    evaluated on the same interpolation grid.
+
+    Arguments:
+        time_series_array = float array with time along axis
+                            e.g. (series, hours) or (hours, y, x)
+        points_per_knot = number of interpolated points per data node
+        smoothing = spline smoothing factor, the interpolating spline
+                    (smoothing=0) is evaluated for all series at once
+        missing_value = missing value indicator (NaN is always missing)
+        axis = index of the time axis in time_series_array
+
+    NOTE: The first and last nodes of each series are ignored when
+          looking for the min/max values (see interpolateExtremes).
+
+    WARNING: Series that contain missing values cannot be interpolated,
+             the simple min/max values are returned for them. Series
+             without any valid values return NaN and index -1.
+
+    Returns: min_value, min_index, max_value, max_index
+        each is an array with the shape of time_series_array minus
+        the time axis
+        min_index - index of time series node at or below min value
+        max_index - index of time series node at or above max value
+    """
+    if time_series_array.dtype.kind != 'f':
+        raise ValueError, 'Interpolation can only be done on float arrays'
+
+    data = N.rollaxis(time_series_array, axis, time_series_array.ndim)
+    out_shape = data.shape[:-1]
+    num_nodes = data.shape[-1]
+    data = data.reshape(-1, num_nodes)
+    num_series = data.shape[0]
+
+    min_value = N.empty(num_series, dtype=float)
+    max_value = N.empty(num_series, dtype=float)
+    min_index = N.empty(num_series, dtype=int)
+    max_index = N.empty(num_series, dtype=int)
+
+    invalid = ~N.isfinite(data)
+    if missing_value is not None: invalid |= data == missing_value
+    incomplete = invalid.any(axis=1)
+
+    # series with missing or invalid data ... simple min/max of usable nodes
+    if incomplete.any():
+        usable = N.where(invalid, N.nan, data)[incomplete,1:-1]
+        empty = N.isnan(usable).all(axis=1)
+        usable[empty] = 0.
+        min_index[incomplete] = N.where(empty, -1, N.nanargmin(usable,1) + 1)
+        max_index[incomplete] = N.where(empty, -1, N.nanargmax(usable,1) + 1)
+        min_value[incomplete] = N.where(empty, N.nan, N.nanmin(usable,1))
+        max_value[incomplete] = N.where(empty, N.nan, N.nanmax(usable,1))
+
+    # complete series ... interpolate all of them on the same fine grid
+    complete = ~incomplete
+    if complete.any():
+        knots = N.arange(num_nodes, dtype=float)
+        interp_points = N.arange(((num_nodes-1) * points_per_knot) + 1,
+                                 dtype=float) / points_per_knot
+        if smoothing == 0 and CubicSpline is not None:
+            spline = CubicSpline(knots, data[complete], axis=1)
+            interp_values = spline(interp_points)
+        else:
+            interp_values = N.array([ UnivariateSpline(knots, series,
+                                                       s=smoothing)(interp_points)
+                                      for series in data[complete] ])
+        # don't want to include first and last nodes or their interp points
+        usable = interp_values[:,points_per_knot:-points_per_knot]
+        min_pos = N.argmin(usable, axis=1) + points_per_knot
+        max_pos = N.argmax(usable, axis=1) + points_per_knot
+        rows = N.arange(usable.shape[0])
+        min_value[complete] = interp_values[rows, min_pos]
+        max_value[complete] = interp_values[rows, max_pos]
+        min_index[complete] = min_pos // points_per_knot
+        max_index[complete] = -(-max_pos // points_per_knot)
+
+    return ( min_value.reshape(out_shape), min_index.reshape(out_shape),
+             max_value.reshape(out_shape), max_index.reshape(out_shape) )
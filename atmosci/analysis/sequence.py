@@ -1,7 +1,7 @@
 
 import numpy as N
 
-from atmosci.analysis.base import BaseDetector
+from atmosci.analysis.base import BaseDetector, missingMask
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -11,6 +11,105 @@ GROUP_ERRMSG = "either 'groupSequences()' or call method must be run prior to '%
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+def sequenceRecordType(value_dtype, by_row=False):
+    record_type = [ ('value', N.dtype(value_dtype)), ('count','<i4'),
+                    ('end_index','<i8') ]
+    if by_row: record_type.insert(0, ('row','<i4'))
+    return N.dtype(record_type)
+
+def findSequences(data_array, missing_value=N.nan, tolerance=N.inf,
+                  min_count=2):
+    """ Vectorized run-length detection of sequences of equivalent values
+    in a 1D array or in each row of a 2D array, e.g. (stations, hours).
+
+    Arguments:
+        data_array = 1D or 2D numpy array, 2D arrays are processed row
+                     by row and runs never cross a row boundary
+        missing_value = value used for missing data, consecutive missing
+                        values are always treated as a sequence
+        tolerance = N.inf : values must be identical
+                    0 : integer portions of values must be identical
+                    any other value : max absolute difference between
+                                      each value and the first value
+                                      in the sequence
+        min_count = minimum number of values in a reported sequence
+
+    Returns: structured array of (value, count, end_index) records
+             ('row' field is prepended when data_array is 2D)
+        value - first value in the sequence
+        count - number of values in the sequence
+        end_index - index of the last value in the sequence
+    """
+    data_array = N.asarray(data_array)
+    by_row = data_array.ndim == 2
+    if by_row: rows = data_array
+    elif data_array.ndim == 1: rows = data_array.reshape(1,-1)
+    else:
+        errmsg = 'Sequences can only be detected in 1D or 2D arrays'
+        raise ValueError, errmsg
+    record_type = sequenceRecordType(data_array.dtype, by_row)
+    num_rows, num_values = rows.shape
+    if num_values == 0: return N.empty((0,), dtype=record_type)
+
+    missing = missingMask(rows, missing_value)
+    if not (N.isinf(tolerance) or tolerance == 0):
+        same = _sameAsRunStart(rows, missing, tolerance)
+    else:
+        # equality is transitive, so comparing consecutive values gives
+        # the same result as comparing each value to the first in its run
+        with N.errstate(invalid='ignore'):
+            if N.isinf(tolerance):
+                same = rows[:,1:] == rows[:,:-1]
+            else:
+                whole = N.trunc(rows)
+                same = whole[:,1:] == whole[:,:-1]
+        either_missing = missing[:,1:] | missing[:,:-1]
+        N.logical_and(same, ~either_missing, same)
+        N.logical_or(same, missing[:,1:] & missing[:,:-1], same)
+
+    # a new run starts at the beginning of each row and at every change
+    breaks = N.ones(rows.shape, dtype=bool)
+    breaks[:,1:] = ~same
+    starts = N.flatnonzero(breaks)
+    ends = N.append(starts[1:], breaks.size) - 1
+    counts = ends - starts + 1
+    keep = N.flatnonzero(counts >= min_count)
+    starts = starts[keep]
+    ends = ends[keep]
+
+    runs = N.empty((len(keep),), dtype=record_type)
+    runs['value'] = rows.ravel()[starts]
+    runs['count'] = counts[keep]
+    if by_row:
+        runs['row'] = ends // num_values
+        runs['end_index'] = ends % num_values
+    else: runs['end_index'] = ends
+    return runs
+
+def _sameAsRunStart(rows, missing, tolerance):
+    """ Returns a boolean array with one less column than rows that is
+    True where a value is within tolerance of the first value in the run
+    that precedes it. Each run start depends on where the previous run
+    ended, so columns are processed in order (all rows at once).
+    """
+    same = N.empty((rows.shape[0], rows.shape[1]-1), dtype=bool)
+    start = rows[:,0].astype(float)
+    start_missing = missing[:,0].copy()
+    with N.errstate(invalid='ignore'):
+        for indx in range(1, rows.shape[1]):
+            column = same[:,indx-1]
+            value_missing = missing[:,indx]
+            N.less_equal(N.fabs(rows[:,indx] - start), tolerance, column)
+            column &= ~(value_missing | start_missing)
+            column |= value_missing & start_missing
+            # values that are not equivalent start a new run
+            new_run = ~column
+            start[new_run] = rows[new_run,indx]
+            start_missing[new_run] = value_missing[new_run]
+    return same
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
 class SequenceDetector(BaseDetector):
 
     REPORT_FORMAT = '%s%%d occurences starting @ %%d = %%s'
@@ -21,6 +120,7 @@ class SequenceDetector(BaseDetector):
         BaseDetector.__init__(self, data_type, missing_value)
         self.detected = None
         self.filter_groups = None
+        self.runs = None
         self.statistics = None
 
         self.tolerance = tolerance
@@ -43,25 +143,24 @@ class SequenceDetector(BaseDetector):
     # - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - - -
 
     def _detect(self, data_array, start_index, end_index):
-        runs = [ ]
-        count = 1
-        indx = start_index
-        previous = data_array[0]
-
-        while indx < end_index:
-            value = data_array[indx]
-            if self.isMissing(previous) and self.isMissing(value):
-                count += 1
-            elif self._isEquivalent(value, previous):
-                count += 1
-            else:
-                if count > 1:
-                    runs.append( (previous, count, indx-1) )
-                previous = value
-                count = 1
-            indx += 1
-
-        return tuple(runs)
+        runs = self.detectRuns(data_array, start_index, end_index)
+        return tuple(runs.tolist())
+
+    def detectRuns(self, data_array, start_index=0, end_index=None):
+        """ Detect sequences in a 1D array or in every row of a 2D
+        (e.g. stations, hours) array in one call. Returns the runs as a
+        structured array (see findSequences).
+        """
+        data_array = N.asarray(data_array)
+        if end_index is None: end_index = data_array.shape[-1]
+        data_array = data_array[...,start_index:end_index]
+        if self.data_type == int and data_array.dtype.kind == 'f':
+            data_array = N.where(N.isfinite(data_array), data_array,
+                                 self._missing_value).astype(int)
+        runs = findSequences(data_array, self._missing_value, self.tolerance)
+        runs['end_index'] += start_index
+        self.runs = runs
+        return runs
 
     # - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - - -
 
@@ -77,7 +176,12 @@ class SequenceDetector(BaseDetector):
             if filters is not None:
                 for key_, filter_, label_, fmt_ in filters:
                     if key_ == 'missing': continue
-                    if filter_:
+                    if callable(filter_):
+                        # filter_ returns a boolean mask for an array of runs
+                        runs = self.runs[~self.missingMask(self.runs['value'])]
+                        runs = runs[filter_(runs)]
+                        if len(runs): filter_groups[key_] = tuple(runs.tolist())
+                    elif filter_:
                         runs = eval("[ run for run in valid %s]" % filter_)
                         if runs: filter_groups[key_] = tuple(runs)
                     else:
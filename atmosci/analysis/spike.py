@@ -3,7 +3,7 @@ import datetime
 
 import numpy as N
 
-from atmosci.analysis.base import BaseDetector
+from atmosci.analysis.base import BaseDetector, missingMask
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -13,6 +13,78 @@ SUPPORTED_ELEMENTS = ('temp','rhum','dewpt','srad','wdir','wspd')
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+def spikeRecordType(value_dtype, by_row=False):
+    value_dtype = N.dtype(value_dtype)
+    record_type = [ ('before', value_dtype), ('after', value_dtype),
+                    ('index','<i8'), ('value', value_dtype) ]
+    if by_row: record_type.insert(0, ('row','<i4'))
+    return N.dtype(record_type)
+
+def linearDifferences(values_1, values_2):
+    return values_2 - values_1
+
+def circularDifferences(angles_1, angles_2):
+    # positive angle is always clockwise
+    angles = angles_2 - angles_1
+    wrapped = N.fabs(angles) > 180
+    angles[wrapped & (angles_1 > angles_2)] += 360
+    angles[wrapped & (angles_1 <= angles_2)] -= 360
+    return angles
+
+def findSpikes(data_array, missing_value=N.nan, differences=linearDifferences):
+    """ Vectorized detection of spikes in a 1D array or in each row of
+    a 2D array, e.g. (stations, hours). A spike is a sequence of 3 values
+    where the middle value is either higher or lower than the other two
+    by at least 1 unit. Sequences that include a missing value are never
+    spikes.
+
+    Arguments:
+        data_array = 1D or 2D numpy array
+        missing_value = value used for missing data
+        differences = function that calculates the differences between
+                      two arrays of values (see circularDifferences)
+
+    Returns: structured array of (before, after, index, value) records
+             ('row' field is prepended when data_array is 2D)
+        before - difference between the spike and the previous value
+        after - difference between the next value and the spike
+        index - index of the spike value
+        value - spike value
+    """
+    data_array = N.asarray(data_array)
+    by_row = data_array.ndim == 2
+    if by_row: rows = data_array
+    elif data_array.ndim == 1: rows = data_array.reshape(1,-1)
+    else:
+        raise ValueError, 'Spikes can only be detected in 1D or 2D arrays'
+    record_type = spikeRecordType(data_array.dtype, by_row)
+    if rows.shape[1] < 3: return N.empty((0,), dtype=record_type)
+
+    previous = rows[:,:-2]
+    middle = rows[:,1:-1]
+    following = rows[:,2:]
+    diff_1_0 = differences(previous, middle)
+    diff_2_1 = differences(middle, following)
+
+    missing = missingMask(rows, missing_value)
+    is_spike = ~(missing[:,:-2] | missing[:,1:-1] | missing[:,2:])
+    with N.errstate(invalid='ignore'):
+        is_spike &= (middle != previous) & (middle != following)
+        is_spike &= (N.fabs(diff_1_0) >= 1) & (N.fabs(diff_2_1) >= 1)
+        # spike occurs when the sign of the differences is different
+        is_spike &= (diff_1_0 > 0) != (diff_2_1 > 0)
+    row_indexes, indexes = N.nonzero(is_spike)
+
+    spikes = N.empty((len(indexes),), dtype=record_type)
+    spikes['before'] = diff_1_0[row_indexes, indexes]
+    spikes['after'] = diff_2_1[row_indexes, indexes]
+    spikes['index'] = indexes + 1
+    spikes['value'] = middle[row_indexes, indexes]
+    if by_row: spikes['row'] = row_indexes
+    return spikes
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
 class SpikeDetector(BaseDetector):
 
     REPORT_FORMAT = '%s spike @ %%d : magnitude (%%d, %%d) : value = %%d'
@@ -27,19 +99,21 @@ class SpikeDetector(BaseDetector):
     def _detect(self, data_array, start_index, end_index):
         """ Detect all spikes in the data_array
         """
-        spikes = [ ]
-        start_seq = start_index
-        end_seq = start_index + 2
-
-        while end_seq < end_index:
-            spike = self._detectSpike(data_array[start_seq:end_seq+1])
-            if spike is not None:
-                spike_index = start_seq + 1
-                spikes.append((spike, spike_index, data_array[spike_index]))
-            start_seq += 1
-            end_seq += 1
-
-        return tuple(spikes)
+        spikes = self.detectSpikes(data_array, start_index, end_index)
+        return tuple([ ((spike[0],spike[1]), spike[2], spike[3])
+                       for spike in spikes.tolist() ])
+
+    def detectSpikes(self, data_array, start_index=0, end_index=None):
+        """ Detect spikes in a 1D array or in every row of a 2D
+        (e.g. stations, hours) array in one call. Returns the spikes as
+        a structured array (see findSpikes).
+        """
+        data_array = N.asarray(data_array)
+        if end_index is None: end_index = data_array.shape[-1]
+        data_array = data_array[...,start_index:end_index]
+        spikes = findSpikes(data_array, self._missing_value, self._differences)
+        spikes['index'] += start_index
+        return spikes
 
     def _detectSpike(self, spike):
         """ A spike is a spike of  3 values where the middle value is
@@ -76,6 +150,10 @@ class SpikeDetector(BaseDetector):
         # seems silly, but makes it much easier to build subclasses
         return two_values[1] - two_values[0]
 
+    def _differences(self, values_1, values_2):
+        # vectorized version of _difference
+        return linearDifferences(values_1, values_2)
+
     # - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - - -
 
     def applyFilters(self, filters=None):
@@ -171,3 +249,6 @@ class CircularAngleSpikeDetector(SpikeDetector):
             return (two_angles[1] + 360) - two_angles[0] 
         return two_angles[1] - (two_angles[0] + 360)
 
+    def _differences(self, angles_1, angles_2):
+        return circularDifferences(angles_1, angles_2)
+
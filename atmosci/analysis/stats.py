@@ -1,5 +1,5 @@
+import datetime
 
-from scipy.stats import stats as scipy_stats
 import numpy as N
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -16,35 +16,213 @@ EMPTY_STATS_RECORD = (N.nan, N.nan, N.nan, N.nan, N.nan, -32768, (0,0,0,0,0,0))
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+def validValueMask(numpy_array, missing_value=N.nan):
+    if numpy_array.dtype.kind == 'f':
+        valid = N.isfinite(numpy_array)
+        if N.isfinite(missing_value): valid &= numpy_array != missing_value
+        return valid
+    if N.isfinite(missing_value): return numpy_array != missing_value
+    return N.ones(numpy_array.shape, dtype=bool)
+
+def arrayMode(valid_values):
+    """ faster replacement for scipy.stats.mode on 1D arrays, returns
+    the same (array([mode,]), array([count,])) tuple
+    """
+    values, counts = N.unique(valid_values, return_counts=True)
+    indx = N.argmax(counts)
+    return N.array([values[indx],]), N.array([counts[indx],])
+
 def arrayStatistics(numpy_array, missing_value=N.nan):
-    if N.isfinite(missing_value):
-        valid_values = numpy_array[N.where(numpy_array!=missing_value)]
-        if numpy_array.dtype.kind == 'f':
-            valid_values = valid_values[N.where(N.isfinite(valid_values))]
-    else:
-        valid_values = numpy_array[N.where(N.isfinite(numpy_array))]
+    valid_values = numpy_array[validValueMask(numpy_array, missing_value)]
 
     if len(valid_values) > 0:
+        mean = N.mean(valid_values)
         statistics =  { 'min' : N.min(valid_values),
                         'max' : N.max(valid_values),
-                        'mean' : N.mean(valid_values),
-                        'stddev' : N.std(valid_values),
+                        'mean' : mean,
+                        'stddev' : N.sqrt(N.mean((valid_values - mean)**2)),
                         'median' : N.median(valid_values),
-                        'mode' : scipy_stats.mode(valid_values),
-                        'missing' : len(numpy_array) - len(valid_values),
+                        'mode' : arrayMode(valid_values),
+                        'missing' : numpy_array.size - len(valid_values),
                       }
     else:
         statistics =  { 'min' : missing_value, 'max' : missing_value,
                         'mean' : missing_value, 'stddev' : 0.0,
                         'median' : missing_value,
                         'mode' : ( N.array([missing_value,]),
-                                   N.array([len(numpy_array),]) ),
-                        'missing' : len(numpy_array),
+                                   N.array([numpy_array.size,]) ),
+                        'missing' : numpy_array.size,
                       }
     return statistics
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+class StatisticsAccumulator(object):
+    """ Streaming min, max, mean, stddev and count for data that is read
+    in chunks. Mean and variance are accumulated with Welford/Chan updates
+    so each chunk only needs to be read once. Accumulators for separate
+    chunks or time slices may be combined with merge().
+
+    When bins and value_range are given, a fixed-bin histogram is also
+    accumulated and used to estimate the median and mode. Values outside
+    value_range are counted as underflow and overflow, which are treated
+    as extra bins that extend to the minimum and maximum values.
+    """
+
+    def __init__(self, missing_value=N.nan, bins=None, value_range=None):
+        self.missing_value = missing_value
+        self.count = 0
+        self.missing = 0
+        self.min = N.inf
+        self.max = -N.inf
+        self.mean = 0.
+        self._m2 = 0.
+        if bins is not None:
+            if value_range is None:
+                errmsg = 'value_range is required for histogram statistics'
+                raise ValueError, errmsg
+            self.bin_edges = N.linspace(value_range[0], value_range[1],
+                                        bins+1)
+            self.histogram = N.zeros(bins, dtype='<i8')
+        else:
+            self.bin_edges = None
+            self.histogram = None
+        self.underflow = 0
+        self.overflow = 0
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def update(self, numpy_array):
+        numpy_array = N.asarray(numpy_array)
+        valid_values = numpy_array[validValueMask(numpy_array,
+                                                  self.missing_value)]
+        self.missing += numpy_array.size - len(valid_values)
+        count = len(valid_values)
+        if count == 0: return self
+
+        mean = N.mean(valid_values, dtype=float)
+        m2 = N.sum((valid_values - mean)**2, dtype=float)
+        self._combine(count, mean, m2, valid_values.min(),
+                      valid_values.max())
+        if self.histogram is not None:
+            self.histogram += N.histogram(valid_values, self.bin_edges)[0]
+            self.underflow += N.count_nonzero(valid_values < self.bin_edges[0])
+            self.overflow += N.count_nonzero(valid_values > self.bin_edges[-1])
+        return self
+
+    def merge(self, other):
+        self.missing += other.missing
+        if other.count > 0:
+            self._combine(other.count, other.mean, other._m2, other.min,
+                          other.max)
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram += other.histogram
+            self.underflow += other.underflow
+            self.overflow += other.overflow
+        return self
+
+    def _combine(self, count, mean, m2, min_value, max_value):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + (delta**2 * self.count * count / total)
+        self.count = total
+        self.min = min(self.min, min_value)
+        self.max = max(self.max, max_value)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @property
+    def stddev(self):
+        if self.count == 0: return 0.0
+        return N.sqrt(self._m2 / self.count)
+
+    @property
+    def variance(self):
+        if self.count == 0: return 0.0
+        return self._m2 / self.count
+
+    def approxMedian(self):
+        if self.histogram is None or self.count == 0: return self.missing_value
+        histogram, edges = self._fullHistogram()
+        cumulative = N.cumsum(histogram)
+        half = self.count / 2.
+        indx = N.searchsorted(cumulative, half)
+        if indx >= len(histogram): return self.max
+        below = cumulative[indx] - histogram[indx]
+        fraction = (half - below) / float(histogram[indx])
+        lower = edges[indx]
+        median = lower + fraction * (edges[indx+1] - lower)
+        return min(max(median, self.min), self.max)
+
+    def approxMode(self):
+        if self.histogram is None or self.count == 0:
+            return N.array([self.missing_value,]), N.array([self.missing,])
+        histogram, edges = self._fullHistogram()
+        # underflow and overflow bins are wider than the others,
+        # so the mode is the bin with the highest density
+        widths = N.diff(edges)
+        with N.errstate(divide='ignore', invalid='ignore'):
+            density = N.where(widths > 0, histogram / widths, histogram)
+        indx = N.argmax(density)
+        center = (edges[indx] + edges[indx+1]) / 2.
+        return N.array([center,]), N.array([histogram[indx],])
+
+    def _fullHistogram(self):
+        # histogram and bin edges with underflow and overflow bins that
+        # extend to the min and max values
+        histogram = N.concatenate(([self.underflow], self.histogram,
+                                   [self.overflow]))
+        edges = N.concatenate(([min(self.min, self.bin_edges[0])],
+                               self.bin_edges,
+                               [max(self.max, self.bin_edges[-1])]))
+        return histogram, edges
+
+    def statistics(self):
+        """ returns a dictionary with the same keys as arrayStatistics,
+        median and mode are None unless a histogram was accumulated
+        """
+        if self.count > 0:
+            statistics = { 'min' : self.min, 'max' : self.max,
+                           'mean' : self.mean, 'stddev' : self.stddev,
+                           'missing' : self.missing, 'coverage' : self.count,
+                         }
+        else:
+            missing_value = self.missing_value
+            statistics = { 'min' : missing_value, 'max' : missing_value,
+                           'mean' : missing_value, 'stddev' : 0.0,
+                           'missing' : self.missing, 'coverage' : 0,
+                         }
+        if self.histogram is not None:
+            statistics['median'] = self.approxMedian()
+            statistics['mode'] = self.approxMode()
+        else:
+            statistics['median'] = None
+            statistics['mode'] = None
+        return statistics
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def datasetStatistics(dataset, missing_value=N.nan, bins=None,
+                      value_range=None, chunk_size=None):
+    """ Calculate statistics for a large array or HDF5 dataset reading
+    each block of the first dimension exactly once. By default, blocks
+    match the dataset's chunk size along the first dimension.
+
+    Returns: StatisticsAccumulator
+    """
+    accumulator = StatisticsAccumulator(missing_value, bins, value_range)
+    if chunk_size is None:
+        chunks = getattr(dataset, 'chunks', None)
+        if chunks: chunk_size = chunks[0]
+        else: chunk_size = 1
+    num_rows = dataset.shape[0]
+    for start in range(0, num_rows, chunk_size):
+        accumulator.update(dataset[start:min(start+chunk_size, num_rows)])
+    return accumulator
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
 def emptyStatsDataset(num_records, descrip_field=None):
     if descrip_field is None:
         empty_record = EMPTY_STATS_RECORD
@@ -2,7 +2,7 @@
 import math
 import numpy as N
 
-from atmosci.units import convertUnits
+from atmosci.units import convertUnits, conversionFormula, UNIT_KEY_MAP
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #
@@ -120,19 +120,19 @@ vaporPressureFromTemp = tempToVaporPressure
 
 def dptFromRhum(rhum, temp, t_units='K'):
     rh_type, rh = asArray(rhum)
-    # saturation vapor pressure (sat_vp)
-    sat_vp = tempToVaporPressure(temp, t_units)
     if isinstance(rh, N.ndarray):
-        # actual vapor pressure (vp)
-        rh = filterRhum(rh, True)
-        vp = (rh * sat_vp) / 100.
-        # convert to Rhum and match imcoming units
-        return convertUnits(N.power((T0inv-(N.log(vp/E0)/LRv)),-1.0), t_units)
+        t = convertInPlace(N.array(temp, dtype=float), t_units, 'K')
+        dpt = dptFromRhumArray(rh, t, out=t)
+        # match imcoming units
+        return convertInPlace(dpt, 'K', t_units)
     else:
-        if rh <= 0: vp = N.nan
-        else: vp = (rh * sat_vp) / 100.
+        # saturation vapor pressure (sat_vp)
+        sat_vp = tempToVaporPressure(temp, t_units)
+        if rh <= 0: return N.nan
+        vp = (rh * sat_vp) / 100.
         # convert to Rhum and match imcoming units
-        return convertUnits(N.power((T0inv-(math.log(vp/E0)/LRv)),-1.0), t_units)
+        dpt = 1.0 / (T0inv - (math.log(vp/E0) / LRv))
+        return convertUnits(dpt, 'K', t_units)
 dewpointFromHumidityAndTemp = dptFromRhum # backwards compatibility
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -149,6 +149,10 @@ relativeHumidityFromDptAndTemp = rhumFromDpt # backwards compatible
 
 def rhumFromSpfh(spfh, temp, pressure, t_units='K', p_units='hPa'):
     # calcutate relative humidity from sepcific humidity, temp and pressure
+    if isinstance(spfh, N.ndarray) or isinstance(temp, N.ndarray):
+        t = convertInPlace(N.array(temp, dtype=float), t_units, 'K')
+        p = convertInPlace(N.array(pressure, dtype=float), p_units, 'hPa')
+        return rhumFromSpfhArray(spfh, t, p, out=t)
     e = spfhToVaporPressure(spfh, pressure, p_units)
     es = tempToVaporPressure(temp, t_units)
     return filterRhum((e/es) * 100.)
@@ -166,7 +170,7 @@ dewpointDepression = dptDepression # backwards compatibility
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def equivPotentialTemp(temp, dewpt, pressure, t_units='K', p_units='hpa'):
+def equivPotentialTemp(temp, dewpt, pressure, t_units='K', p_units='hPa'):
     """ calculate theta e (equivalent potential temperature)
     arguments:
         pressure in millibars (hectopascals)
@@ -180,14 +184,12 @@ def equivPotentialTemp(temp, dewpt, pressure, t_units='K', p_units='hpa'):
         dpt = convertUnits(dpt, t_units, 'K')
         p_type, p = asArray(pressure)
         p = convertUnits(p, p_units, 'hPa')
-        pt = t * N.power((1000./p), 0.286 )
-        mix_ratio = mixingRatio(p, t, dpt) / 1000.
-        ept = pt * N.exp( (0.00000250 * mix_ratio) / (1005. * t) )
+        ept = equivPotentialTempArray(t, dpt, p)
     else:
         dpt = convertUnits(dewpt, t_units, 'K')
         p = convertUnits(pressure, p_units, 'hPa')
         pt = t * math.pow((1000./p), 0.286)
-        mix_ratio = mixingRatio(p, t, d) / 1000.
+        mix_ratio = mixingRatio(p, dpt) / 1000.
         ept = pt * math.exp( (0.00000250 * mix_ratio) / (1005. * t) )
     return ept
 
@@ -221,31 +223,7 @@ def heatIndex(temp, rhum, t_units='F'):
     # sequence was input
     if isinstance(t, N.ndarray):
         rh_type, rh = asArray(rhum)
-        # only temps above 80 F may have an associated Heat Index
-        indexes = N.where(t >= 80.)
-        if len(indexes) > 0 and len(indexes[0]) > 0:
-            heat = N.array(t)
-            rh80 = rh[indexes]
-            rh80_sq = rh80 * rh80
-            t80 = t[indexes]
-            t80_sq = t80 * t80
-            heat[indexes] = ( -42.379 
-                + (2.04901523 * t80) + (10.14333127 * rh80)
-                + (-0.22475541 * t80 * rh80) + (-6.83783e-03 * t80_sq)
-                + (-5.481717e-02 * rh80_sq) + (1.22874e-03 * t80_sq * rh80)
-                + (8.5282e-04 * t80 * rh80_sq)
-                + (-1.99e-06 * t80_sq * rh80_sq) )
-            lh_indexes = N.where(rh < 13. & t >= 80. & t <= 112.)
-            if len(lh_indexes) > 0 and len(lh_indexes[0]) > 0:
-                heat[lh_indexes] -= ( ((13. - rh[lh_indexes]) / 4.)
-                    * N.sqrt((17. - N.absolute(t[lh_indexes] - 95.)) / 17.) )
-            hh_indexes = N.where(rh > 85. & t >= 80. & t <= 87.)
-            if len(hh_indexes) > 0 and len(hh_indexes[0]) > 0:
-                heat[hh_indexes] += ( ((rh[hh_indexes] - 85.) / 10.)
-                    * ((87. - t[hh_indexes]) / 5.) )
-            return heat
-        # all temps are below 80 F
-        else: return t
+        return heatIndexArray(t, rh)
 
     # assume we got a single value
     if (t < 80): return t
@@ -289,19 +267,20 @@ def potentialTemp(temp, pressure, t_units='K', p_units='hPa'):
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 def windChill(speed, temp, s_units='mph', t_units='F'):
+    """ calculate wind chill (degrees F) using the NWS formula. Wind
+    chill is only defined for temps <= 50 F and wind speeds >= 3 mph,
+    temp is returned for all other values.
+    """
     t_type, t = asArray(temp)
-    t = convertUnits(t, t_units, 'K')
+    t = convertUnits(t, t_units, 'F')
     s_type, spd = asArray(speed)
     spd = convertUnits(spd, s_units, 'mph')
     if isinstance(t, N.ndarray):
-        spd_factor = N.power(spd * 35.75, 0.16)
-        tspd_factor = N.power(t * spd * 0.4276, 0.16)
-    else:
-        spd_factor = math.pow(spd * 35.75, 0.16)
-        tspd_factor = math.pow(t * spd * 0.4276, 0.16)
+        return windChillArray(spd, t)
 
-    t_factor = t * 0.6215
-    return t_factor - spd_factor + tspd_factor + 35.74
+    if t > 50. or spd < 3.: return t
+    spd_factor = math.pow(spd, 0.16)
+    return 35.74 + (t * 0.6215) + (((t * 0.4275) - 35.75) * spd_factor)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -309,12 +288,11 @@ def windComponents(speed, wdir, s_units='m/s'):
     s_type, spd = asArray(speed)
     spd = convertUnits(spd, s_units, 'm/s')
     if isinstance(spd, N.ndarray):
-        d_type, wdir = asArray(directon)
-        u = spd * -N.sin(N.radians(wdir))
-        v = spd * -N.cos(N.radians(wdir))
+        d_type, wdir = asArray(wdir)
+        return windComponentsArray(spd, wdir)
     else:
-        u = spd * -math.sin(math.radians(direction))
-        v = spd * -math.cos(math.radians(direction))
+        u = spd * -math.sin(math.radians(wdir))
+        v = spd * -math.cos(math.radians(wdir))
     return u, v
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -325,8 +303,8 @@ def uWind(speed, direction, s_units='m/s'):
     s_type, spd = asArray(speed)
     spd = convertUnits(spd, s_units, 'm/s')
     if isinstance(spd, N.ndarray):
-        d_type, wdir = asArray(directon)
-        return spd * -N.sin(N.radians(wdir))
+        d_type, wdir = asArray(direction)
+        return uWindArray(spd, wdir)
     else: return spd * -math.sin(math.radians(direction))
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -337,9 +315,9 @@ def vWind(speed, wdir, s_units='m/s'):
     s_type, spd = asArray(speed)
     spd = convertUnits(spd, s_units, 'm/s')
     if isinstance(spd, N.ndarray):
-        d_type, wdir = asArray(directon)
-        return spd * -N.cos(N.radians(wdir))
-    else: return spd * -math.cos(math.radians(direction))
+        d_type, wdir = asArray(wdir)
+        return vWindArray(spd, wdir)
+    else: return spd * -math.cos(math.radians(wdir))
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -364,3 +342,318 @@ def windSpeed(u_comp, v_comp):
         if wdir > 0: return wdir
         return wdir + 360.0 
 
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# FUSED ARRAY KERNELS
+#
+# Each kernel evaluates a formula for arrays of identical shape using
+# in-place ufuncs, writing intermediate results into preallocated
+# scratch arrays and selecting nodes with boolean masks rather than
+# index tuples. Kernels never allocate full size temporaries when
+# out, scratch and masks are passed, so they may be called repeatedly
+# on blocks of a larger dataset using the same buffers. The number of
+# scratch and mask arrays each kernel needs is available from its
+# "scratch" and "masks" attributes.
+#
+# Input arrays are treated as read only and must already be in the
+# units listed in each kernel's docstring.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+TEMP_CONVERSIONS = { 'C_to_F' : (NINE_FIFTHS, 32.),
+                     'C_to_K' : (1., 273.15),
+                     'F_to_C' : (FIVE_NINTHS, -32. * FIVE_NINTHS),
+                     'F_to_K' : (FIVE_NINTHS, 273.15 - (32. * FIVE_NINTHS)),
+                     'K_to_C' : (1., -273.15),
+                     'K_to_F' : (NINE_FIFTHS, 32. - (273.15 * NINE_FIFTHS)),
+                   }
+
+def convertInPlace(data, from_units, to_units):
+    """ Converts a float array from one unit to another without creating
+    a new array. Conversions that cannot be done in place (there are
+    only a few) are copied back into data.
+    """
+    if from_units is None or to_units is None: return data
+    from_units = UNIT_KEY_MAP.get(from_units, from_units)
+    to_units = UNIT_KEY_MAP.get(to_units, to_units)
+    if from_units == to_units: return data
+
+    key = '%s_to_%s' % (from_units.upper(), to_units.upper())
+    if key in TEMP_CONVERSIONS:
+        scale, offset = TEMP_CONVERSIONS[key]
+        if scale != 1.: N.multiply(data, scale, data)
+        N.add(data, offset, data)
+        return data
+
+    operation, arg = conversionFormula(from_units, to_units)
+    if operation == '*': N.multiply(data, arg, data)
+    elif operation == '+': N.add(data, arg, data)
+    elif operation == '-': N.subtract(data, arg, data)
+    elif operation != '==':
+        data[...] = convertUnits(data, from_units, to_units)
+    return data
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def kernelBuffers(kernel, shape, dtype=float):
+    """ Allocates the scratch and mask arrays required by kernel for
+    arrays of shape. Returns tuple : (list of scratch, list of masks)
+    """
+    scratch = [N.empty(shape, dtype=dtype) for n in range(kernel.scratch)]
+    masks = [N.empty(shape, dtype=bool) for n in range(kernel.masks)]
+    return scratch, masks
+
+def _kernelArrays(kernel, like, out, scratch, masks):
+    if out is None: out = N.empty(like.shape, dtype=float)
+    if (kernel.scratch and scratch is None) or (kernel.masks and masks is None):
+        _scratch, _masks = kernelBuffers(kernel, like.shape, out.dtype)
+        if scratch is None: scratch = _scratch
+        if masks is None: masks = _masks
+    return out, scratch, masks
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def dptFromRhumArray(rhum, temp, out=None, scratch=None, masks=None):
+    """ Dew point from relative humidity.
+    rhum in percent, temp in degrees K, result in degrees K.
+
+    Uses the same saturation vapor pressure equation as dptFromRhum,
+    reduced algebraically to 1 / (1/T - ln(RH/100) / LRv) so that
+    vapor pressure never has to be stored. RH <= 0 produces NaN.
+    out may be the temp array.
+    """
+    out, scratch, masks = _kernelArrays(dptFromRhumArray, temp, out,
+                                        scratch, masks)
+    errors = N.seterr(divide='ignore', invalid='ignore')
+    try:
+        N.reciprocal(temp, scratch[0])
+        N.clip(rhum, -1., 100., out)
+        N.multiply(out, 0.01, out)
+        N.log(out, out) # RH <= 0 becomes NaN or -inf
+        N.multiply(out, -1. / LRv, out)
+        N.add(out, scratch[0], out)
+        N.reciprocal(out, out)
+        N.less_equal(rhum, 0., masks[0])
+        N.putmask(out, masks[0], N.nan)
+    finally:
+        N.seterr(**errors)
+    return out
+dptFromRhumArray.scratch = 1
+dptFromRhumArray.masks = 1
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def equivPotentialTempArray(temp, dewpt, pressure, out=None, scratch=None,
+                                  masks=None):
+    """ Equivalent potential temperature (theta e).
+    temp and dewpt in degrees K, pressure in hPa, result in degrees K.
+
+    Same equations as equivPotentialTemp and mixingRatio.
+    """
+    out, scratch, masks = _kernelArrays(equivPotentialTempArray, temp, out,
+                                        scratch, masks)
+    work = scratch[0]
+    errors = N.seterr(divide='ignore', invalid='ignore')
+    try:
+        # vapor pressure at dew point
+        N.reciprocal(dewpt, work)
+        N.multiply(work, -5420., work)
+        N.exp(work, work)
+        N.multiply(work, 0.0000000000253 / 100., work)
+        # mixing ratio (g/kg) / 1000
+        N.subtract(pressure, work, out)
+        N.divide(work, out, work)
+        # exponent
+        N.multiply(work, 0.622 * 0.00000250 / 1005., work)
+        N.divide(work, temp, work)
+        N.exp(work, work)
+        # potential temperature
+        N.divide(1000., pressure, out)
+        N.power(out, 0.286, out)
+        N.multiply(out, temp, out)
+        N.multiply(out, work, out)
+    finally:
+        N.seterr(**errors)
+    return out
+equivPotentialTempArray.scratch = 1
+equivPotentialTempArray.masks = 0
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def heatIndexArray(temp, rhum, out=None, scratch=None, masks=None):
+    """ Heat index using the NOAA regression equation and adjustments.
+    temp in degrees F, rhum in percent, result in degrees F.
+
+    Nodes where temp is below 80 F (or NaN) get temp. The regression
+    is evaluated as a quadratic in RH with coefficients in Horner form
+    so that it needs only two scratch arrays.
+    """
+    out, scratch, masks = _kernelArrays(heatIndexArray, temp, out,
+                                        scratch, masks)
+    f0, f1 = scratch
+    hot, adjust, limit = masks
+
+    errors = N.seterr(invalid='ignore')
+    try:
+        # c(T) * RH^2 + b(T) * RH + a(T)
+        N.multiply(temp, -1.99e-06, f0)
+        N.add(f0, 8.5282e-04, f0)
+        N.multiply(f0, temp, f0)
+        N.add(f0, -5.481717e-02, f0)
+        N.multiply(f0, rhum, f0)
+        N.multiply(temp, 1.22874e-03, f1)
+        N.add(f1, -0.22475541, f1)
+        N.multiply(f1, temp, f1)
+        N.add(f1, 10.14333127, f1)
+        N.add(f0, f1, f0)
+        N.multiply(f0, rhum, f0)
+        N.multiply(temp, -6.83783e-03, f1)
+        N.add(f1, 2.04901523, f1)
+        N.multiply(f1, temp, f1)
+        N.add(f1, -42.379, f1)
+        N.add(f0, f1, f0)
+
+        # only temps above 80 F may have an associated Heat Index
+        N.greater_equal(temp, 80., hot)
+        out[...] = temp
+        N.putmask(out, hot, f0)
+
+        # low humidity : rh < 13 and 80 <= t <= 112
+        N.less(rhum, 13., adjust)
+        N.logical_and(adjust, hot, adjust)
+        N.less_equal(temp, 112., limit)
+        N.logical_and(adjust, limit, adjust)
+        if adjust.any():
+            # ((13 - rh) / 4) * sqrt((17 - |t - 95|) / 17)
+            N.subtract(temp, 95., f0)
+            N.absolute(f0, f0)
+            N.subtract(17., f0, f0)
+            N.multiply(f0, 1. / 17., f0)
+            N.sqrt(f0, f0)
+            N.subtract(13., rhum, f1)
+            N.multiply(f1, 0.25, f1)
+            N.multiply(f0, f1, f0)
+            N.putmask(f0, ~adjust, 0.)
+            N.subtract(out, f0, out)
+
+        # high humidity : rh > 85 and 80 <= t <= 87
+        N.greater(rhum, 85., adjust)
+        N.logical_and(adjust, hot, adjust)
+        N.less_equal(temp, 87., limit)
+        N.logical_and(adjust, limit, adjust)
+        if adjust.any():
+            # ((rh - 85) / 10) * ((87 - t) / 5)
+            N.subtract(rhum, 85., f0)
+            N.multiply(f0, 0.1, f0)
+            N.subtract(87., temp, f1)
+            N.multiply(f1, 0.2, f1)
+            N.multiply(f0, f1, f0)
+            N.putmask(f0, ~adjust, 0.)
+            N.add(out, f0, out)
+    finally:
+        N.seterr(**errors)
+    return out
+heatIndexArray.scratch = 2
+heatIndexArray.masks = 3
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def rhumFromSpfhArray(spfh, temp, pressure, out=None, scratch=None,
+                            masks=None):
+    """ Relative humidity from specific humidity.
+    spfh in kg/kg, temp in degrees K, pressure in hPa, result in percent.
+
+    Same equations as rhumFromSpfh with vapor pressure and saturation
+    vapor pressure combined into a single exponential, so no scratch
+    arrays are needed. Results are constrained to 0 - 100 percent.
+    out may be the temp array.
+    """
+    out, scratch, masks = _kernelArrays(rhumFromSpfhArray, temp, out,
+                                        scratch, masks)
+    errors = N.seterr(divide='ignore', invalid='ignore')
+    try:
+        # (100 * p * q / (0.622 * E0)) * exp(LRv * (1/T - 1/T0))
+        N.reciprocal(temp, out)
+        N.subtract(out, T0inv, out)
+        N.multiply(out, LRv, out)
+        N.exp(out, out)
+        N.multiply(out, spfh, out)
+        N.multiply(out, pressure, out)
+        N.multiply(out, 100. / (0.622 * E0), out)
+        N.clip(out, 0., 100., out)
+    finally:
+        N.seterr(**errors)
+    return out
+rhumFromSpfhArray.scratch = 0
+rhumFromSpfhArray.masks = 0
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def windChillArray(speed, temp, out=None, scratch=None, masks=None):
+    """ Wind chill using the NWS formula.
+    speed in mph, temp in degrees F, result in degrees F.
+
+    Wind chill is only defined for temps <= 50 F and wind speeds of
+    at least 3 mph. All other nodes get temp.
+    """
+    out, scratch, masks = _kernelArrays(windChillArray, temp, out,
+                                        scratch, masks)
+    work = scratch[0]
+    valid, limit = masks
+    errors = N.seterr(invalid='ignore')
+    try:
+        # 35.74 + 0.6215 T + (0.4275 T - 35.75) V^0.16
+        N.power(speed, 0.16, work)
+        N.multiply(temp, 0.4275, out)
+        N.subtract(out, 35.75, out)
+        N.multiply(out, work, out)
+        N.multiply(temp, 0.6215, work)
+        N.add(out, work, out)
+        N.add(out, 35.74, out)
+
+        N.less_equal(temp, 50., valid)
+        N.greater_equal(speed, 3., limit)
+        N.logical_and(valid, limit, valid)
+        N.logical_not(valid, valid)
+        N.putmask(out, valid, temp)
+    finally:
+        N.seterr(**errors)
+    return out
+windChillArray.scratch = 1
+windChillArray.masks = 2
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def uWindArray(speed, wdir, out=None, scratch=None, masks=None):
+    """ U (zonal) wind component.
+    speed in any units, wdir in degrees, result in units of speed.
+    """
+    out, scratch, masks = _kernelArrays(uWindArray, speed, out,
+                                        scratch, masks)
+    N.radians(wdir, out)
+    N.sin(out, out)
+    N.multiply(out, speed, out)
+    return N.negative(out, out)
+uWindArray.scratch = 0
+uWindArray.masks = 0
+
+def vWindArray(speed, wdir, out=None, scratch=None, masks=None):
+    """ V (meridional) wind component.
+    speed in any units, wdir in degrees, result in units of speed.
+    """
+    out, scratch, masks = _kernelArrays(vWindArray, speed, out,
+                                        scratch, masks)
+    N.radians(wdir, out)
+    N.cos(out, out)
+    N.multiply(out, speed, out)
+    return N.negative(out, out)
+vWindArray.scratch = 0
+vWindArray.masks = 0
+
+def windComponentsArray(speed, wdir, u=None, v=None):
+    """ U and V wind components. Returns tuple : (u, v)
+    speed in any units, wdir in degrees, results in units of speed.
+    """
+    return uWindArray(speed, wdir, u), vWindArray(speed, wdir, v)
@@ -10,7 +10,7 @@ from atmosci.utils.timeutils import asDatetime, asDatetimeDate
 from atmosci.utils.timeutils import matchDateType
 
 from atmosci.hdf5.grid import Hdf5GridFileReader, Hdf5GridFileManager
-from atmosci.hdf5.grid import Hdf5GridFileBuilder
+from atmosci.hdf5.grid import Hdf5GridFileBuilder, windowIndex
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -102,12 +102,11 @@ class Hdf5DateGridReaderMixin:
 
     def dataSlice(self, dataset_path, start_date, end_date, min_lon, max_lon,
                          min_lat, max_lat, **kwargs):
-        min_y, min_x = self.ll2index(min_lon, min_lat)
-        max_y, max_x = self.ll2index(max_lon, max_lat)
+        window = self.bboxWindow((min_lon, min_lat, max_lon, max_lat))
         start, end = self.indexesForDates(dataset_path, start_date, end_date)
         dataset = self.getDataset(dataset_path)
-        data = \
-        self._slice3DDataset(dataset, start, end, min_y, max_y, min_x, max_x)
+        data = self._slice3DDataset(dataset, start, end, window.y0, window.y1,
+                                    window.x0, window.x1)
         return self._processDataOut(dataset_path, data, **kwargs)
     get3DSlice = dataSlice # backwards compatibility
 
@@ -178,72 +177,10 @@ class Hdf5DateGridReaderMixin:
    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def _slice3DDataset(self, dataset, start, end, min_y, max_y, min_x, max_x):
-        if end == start: # single date
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[start, min_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start, min_y, min_x:]
-            elif max_y < dataset.shape[1]:
-                if max_x == min_x:
-                    return dataset.value[start, min_y:max_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[start, min_y:, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start, min_y:, min_x:]
-        elif end < dataset.shape[0]:
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[start:end, min_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:end, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:end, min_y, min_x:]
-            elif max_y < dataset.shape[1]:
-                if max_x == min_x:
-                    return dataset.value[start:end, min_y:max_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:end, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:end, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[start:end, min_y:, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:end, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:end, min_y:, min_x:]
-        else: # end > dataset.shape[0] ... retrieve all dates to end of dataset
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[start:, min_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:, min_y, min_x:]
-            elif max_y < dataset.shape[1]:
-                if max_x == min_x:
-                    return dataset.value[start:, min_y:max_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[start:, min_y:, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:, min_y:, min_x:]
+        # only the hyperslab is read from the file ... end == start selects
+        # a single date and indexes past the end of an axis end there
+        return dataset[windowIndex(start, end), windowIndex(min_y, max_y),
+                       windowIndex(min_x, max_x)]
 
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
@@ -310,6 +247,20 @@ class Hdf5DateGridManagerMixin(Hdf5DateGridReaderMixin):
         return self._insertAtNodeByDateIndex(dataset_path, data, date_index,
                                              x, y, **kwargs)
 
+    def insertAtNodes(self, dataset_path, data, start_date, lons, lats,
+                            **kwargs):
+        """ Inserts data for a sequence of dates at each of many grid nodes
+        (e.g. corrected values for a network of stations). data must be
+        a 2D array with one row per lon/lat point. Node indexes for all
+        points are resolved together and the dataset is updated one
+        HDF5 chunk at a time. Returns the number of nodes updated.
+        """
+        date_index = self.indexForDate(dataset_path, start_date)
+        y, x = self.ll2indexes(lons, lats)
+        data_in = self._processDataIn(dataset_path, data, **kwargs)
+        return self._insertAtNodeIndexes(dataset_path, data_in, date_index,
+                                         y, x, **kwargs)
+
     def insert3DSlice(self, dataset_path, data, start_date, min_lon, max_lon,
                             min_lat, max_lat, **kwargs):
         min_y, min_x = self.ll2index(min_lon, min_lat)
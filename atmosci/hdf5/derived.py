@@ -0,0 +1,224 @@
+""" Derived (virtual) datasets computed on the fly from datasets that are
+stored in an Hdf5 file, e.g. heat index from temperature and relative
+humidity.
+
+Derived variables are evaluated block by block along the first axis of
+the input datasets using the fused kernels in atmosci.equations. Each
+block of every input is read directly into a preallocated buffer and
+the kernel writes its result directly into the output array, so the
+memory used for temporaries is bounded by the block size no matter how
+large the requested slice is.
+"""
+
+import numpy as N
+
+from atmosci.equations import convertInPlace, kernelBuffers
+from atmosci.equations import dptFromRhumArray, equivPotentialTempArray, \
+                              heatIndexArray, rhumFromSpfhArray, \
+                              uWindArray, vWindArray, windChillArray
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# maximum number of grid nodes in each input block buffer
+DEFAULT_BLOCK_NODES = 2**20
+
+DERIVED_VARIABLES = { }
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class DerivedVariable(object):
+    """ Definition of a derived variable.
+
+    Arguments:
+    ---------
+        name: name that readers will recognize as a virtual dataset
+        kernel: fused kernel function from atmosci.equations with the
+                signature kernel(*inputs, out=, scratch=, masks=)
+        inputs: sequence of (dataset name, units) tuples in the order
+                the kernel expects them. Input data is converted to
+                these units before it is passed to the kernel. Use
+                None for inputs that never need conversion.
+        units: units of the kernel's result
+        description: description of the variable (string)
+    """
+
+    def __init__(self, name, kernel, inputs, units, description=None):
+        self.description = description
+        self.inputs = tuple(inputs)
+        self.kernel = kernel
+        self.name = name
+        self.units = units
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @property
+    def input_names(self):
+        return tuple([name for name, units in self.inputs])
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def evaluate(self, sources, start=0, end=None, out=None, **kwargs):
+        """ Evaluates the variable for a range of indexes along the first
+        axis of the input datasets.
+
+        Arguments:
+        ---------
+            sources: sequence of DerivedInput, one for each of the
+                     variable's inputs, in the same order
+            start: first index along the first axis
+            end: index after the last one. None means the end of the
+                 shortest input.
+            out: optional float array to receive the result
+            kwargs: "units" = units for the result
+                    "block_size" = number of indexes along the first
+                                   axis to evaluate in each block
+
+        Returns:
+        -------
+            NumPy float array
+        """
+        if len(sources) != len(self.inputs):
+            errmsg = '"%s" requires %d inputs, %d were passed.'
+            raise ValueError, errmsg % (self.name, len(self.inputs),
+                                        len(sources))
+        if end is None: end = min([source.shape[0] for source in sources])
+        shape = (end - start,) + sources[0].shape[1:]
+        if out is None: out = N.empty(shape, dtype=float)
+        elif out.shape != shape:
+            errmsg = 'Shape of "out" array %s does not match %s.'
+            raise ValueError, errmsg % (str(out.shape), str(shape))
+
+        block_size = kwargs.get('block_size', None)
+        if block_size is None: block_size = sources[0].blockSize()
+        block_shape = (min(block_size, max(shape[0],1)),) + shape[1:]
+
+        # all buffers are allocated once and reused for every block
+        buffers = [N.empty(block_shape, dtype=float) for source in sources]
+        scratch, masks = kernelBuffers(self.kernel, block_shape)
+        missing = N.empty(block_shape, dtype=bool)
+
+        out_units = kwargs.get('units', None)
+        first = start
+        while first < end:
+            # keep reads aligned with the block (i.e. chunk) boundaries
+            last = min(first + block_size - (first % block_size), end)
+            size = last - first
+            inputs = [ ]
+            for indx, source in enumerate(sources):
+                data = buffers[indx][:size]
+                source.read(first, last, data, missing[:size])
+                inputs.append(convertInPlace(data, source.units,
+                                             self.inputs[indx][1]))
+            _masks = [mask[:size] for mask in masks]
+            _scratch = [buf[:size] for buf in scratch]
+            result = out[first-start:last-start]
+            self.kernel(*inputs, out=result, scratch=_scratch, masks=_masks)
+            convertInPlace(result, self.units, out_units)
+            first = last
+        return out
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class DerivedInput(object):
+    """ Reads blocks of an input dataset directly into float buffers.
+
+    Arguments:
+    ---------
+        dataset: h5py dataset or NumPy array
+        units: units of the data in the dataset
+        missing: value used for missing data in the dataset. Nodes with
+                 this value are set to NaN in each block.
+        unpack: function used to unpack raw data, if any
+        subset: optional tuple of slices and/or ints applied to the
+                remaining dimensions (e.g. the rows and columns of a
+                grid). Dimensions selected by an int are dropped.
+    """
+
+    def __init__(self, dataset, units=None, missing=None, unpack=None,
+                       subset=()):
+        self.dataset = dataset
+        # NaN is already the missing value in the float buffers
+        if missing is not None:
+            try:
+                if N.isnan(float(missing)): missing = None
+            except (TypeError, ValueError):
+                missing = None
+        self.missing = missing
+        self.subset = tuple(subset)
+        self.units = units
+        self.unpack = unpack
+
+        shape = [dataset.shape[0],]
+        for indx, size in enumerate(dataset.shape[1:]):
+            if indx >= len(self.subset): shape.append(size)
+            elif isinstance(self.subset[indx], slice):
+                shape.append(len(range(*self.subset[indx].indices(size))))
+        self.shape = tuple(shape)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def blockSize(self, max_nodes=DEFAULT_BLOCK_NODES):
+        """ Returns the number of indexes along the first axis to read
+        at a time. Blocks are whole multiples of the dataset's HDF5
+        chunks whenever possible.
+        """
+        nodes = max(int(N.prod(self.shape[1:])), 1)
+        size = max(max_nodes // nodes, 1)
+        chunks = getattr(self.dataset, 'chunks', None)
+        if chunks is not None and size > chunks[0]:
+            size -= size % chunks[0]
+        return size
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def read(self, first, last, out, mask):
+        """ Reads dataset[first:last] into out. mask is a bool array with
+        the same shape as out used to find missing values.
+        """
+        selection = (slice(first, last),) + self.subset
+        if self.unpack is not None:
+            out[...] = self.unpack(self.dataset[selection])
+        elif hasattr(self.dataset, 'read_direct'):
+            self.dataset.read_direct(out, source_sel=selection)
+        else: out[...] = self.dataset[selection]
+        if self.missing is not None:
+            N.equal(out, self.missing, mask)
+            N.putmask(out, mask, N.nan)
+        return out
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def derivedVariable(name):
+    return DERIVED_VARIABLES.get(name, None)
+
+def registerDerivedVariable(name, kernel, inputs, units, description=None):
+    variable = DerivedVariable(name, kernel, inputs, units, description)
+    DERIVED_VARIABLES[name] = variable
+    return variable
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# default derived variables
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+registerDerivedVariable('DPT', dptFromRhumArray,
+                        (('RHUM','%'), ('TMP','K')), 'K',
+                        'Dew point temperature')
+registerDerivedVariable('HEAT_INDEX', heatIndexArray,
+                        (('TMP','F'), ('RHUM','%')), 'F', 'Heat index')
+registerDerivedVariable('RHUM', rhumFromSpfhArray,
+                        (('SPFH','kg/kg'), ('TMP','K'), ('PRES','hPa')), '%',
+                        'Relative humidity')
+registerDerivedVariable('THETA_E', equivPotentialTempArray,
+                        (('TMP','K'), ('DPT','K'), ('PRES','hPa')), 'K',
+                        'Equivalent potential temperature')
+registerDerivedVariable('UGRD', uWindArray,
+                        (('WIND','m/s'), ('WDIR',None)), 'm/s',
+                        'U wind component')
+registerDerivedVariable('VGRD', vWindArray,
+                        (('WIND','m/s'), ('WDIR',None)), 'm/s',
+                        'V wind component')
+registerDerivedVariable('WIND_CHILL', windChillArray,
+                        (('WIND','mph'), ('TMP','F')), 'F', 'Wind chill')
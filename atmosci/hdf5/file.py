@@ -6,11 +6,17 @@ import datetime
 
 import h5py
 import numpy as N
-from atmosci.utils.data import safedict, dictToWhere, listToWhere
+from atmosci.utils.data import safedict, criteriaToRules, ruleDatasets, \
+                               rulesToMask
+from atmosci.utils.string import tupleFromString
 from atmosci.utils.timeutils import asDatetime
 from atmosci.utils.units import convertUnits
 
+from atmosci.hdf5.derived import DerivedInput, derivedVariable
+from atmosci.hdf5.lazy import LazyDataset
 from atmosci.hdf5.mixin import Hdf5DataReaderMixin, Hdf5DataWriterMixin
+from atmosci.hdf5.packing import datasetPacking, datasetRange, \
+                                 packDatasetInto, packingForRange
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -31,6 +37,7 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
         self._dataset_names = [ ]
         self._group_names = [ ]
         self._packers = { }
+        self._packings = { }
         self._unpackers = { }
 
         if not hasattr(self, '_access_authority'):
@@ -144,11 +151,14 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
 
     def getData(self, dataset_path, **kwargs):
         self.assertFileOpen()
+        if self.isDerivedDataset(dataset_path):
+            return self.getDerivedData(dataset_path, **kwargs)
+        if kwargs.get('lazy', False):
+            return self.lazyDataset(dataset_path, **kwargs)
         data = self._getData_(self.file, dataset_path, **kwargs)
         return self._processDataOut(dataset_path, data, **kwargs)
 
-    def getDataWhere(self, dataset_path, criteria=None, **kwatgs):
-        datasets = [ ]
+    def getDataWhere(self, dataset_path, criteria=None, **kwargs):
         if criteria:
             indexes = self._where(criteria)
             if indexes and len(indexes[0]) > 0:
@@ -158,6 +168,63 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
                 raise ValueError, errmsg % str(criteria)
         return self.getData(dataset_path, **kwargs)
 
+    def getDerivedData(self, dataset_path, start=0, end=None, **kwargs):
+        """ Computes a derived dataset (see atmosci.hdf5.derived) from the
+        datasets stored in the file, block by block along the first axis.
+        A single index along the first axis may be passed in kwargs as
+        "index". Units for the result may be passed as "units". A tuple
+        of indexes for the remaining axes (e.g. a grid reader's bounds)
+        may be passed as "subset".
+        """
+        variable = derivedVariable(dataset_path)
+        if variable is None:
+            errmsg = '"%s" is not a registered derived dataset.'
+            raise KeyError, errmsg % dataset_path
+        if 'indexes' in kwargs:
+            errmsg = '"indexes" is not supported for derived dataset "%s".'
+            raise ValueError, errmsg % dataset_path
+
+        index = kwargs.get('index', None)
+        if index is not None: start, end = int(index), int(index) + 1
+        subset = tuple(kwargs.get('subset', ()))
+        sources = [self._derivedInput(name, subset)
+                   for name in variable.input_names]
+        data = variable.evaluate(sources, start, end, **kwargs)
+        if index is not None: return data[0]
+        return data
+
+    def lazyDataset(self, dataset_path, **kwargs):
+        """ Returns a LazyDataset (see atmosci.hdf5.lazy) for a dataset.
+        Nothing is read from the file until the proxy is materialized.
+        "index" and "indexes" in kwargs select the same data as they do
+        in getData, except that indexes must be ints and (start, stop)
+        tuples. All other kwargs are applied when the data is read.
+        """
+        self.assertFileOpen()
+        proxy = LazyDataset(self, dataset_path, **kwargs)
+        if 'indexes' in kwargs:
+            key = [ ]
+            for indx in kwargs['indexes']:
+                if isinstance(indx, N.ndarray):
+                    errmsg = 'Coordinate arrays cannot be used as "indexes"'
+                    errmsg += ' for lazy reads of "%s".'
+                    raise ValueError, errmsg % dataset_path
+                if isinstance(indx, (tuple,list)): key.append(slice(*indx))
+                else: key.append(indx)
+            return proxy[tuple(key)]
+        elif 'index' in kwargs: return proxy[int(kwargs['index'])]
+        return proxy
+
+    def isDerivedDataset(self, dataset_path):
+        """ Returns True when dataset_path is not stored in the file but
+        can be derived from datasets that are.
+        """
+        variable = derivedVariable(dataset_path)
+        if variable is None or self.datasetExists(dataset_path): return False
+        for name in variable.input_names:
+            if not self.datasetExists(name): return False
+        return True
+
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -377,10 +444,10 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def registerDataPacker(dataset_path, function):
+    def registerDataPacker(self, dataset_path, function):
         self._packers[dataset_path] = function
 
-    def registerDataUnpacker(dataset_path, function):
+    def registerDataUnpacker(self, dataset_path, function):
         self._unpackers[dataset_path] = function
 
 
@@ -415,14 +482,35 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def _datasetPacking(self, dataset_path):
+        """ Returns the DataPacking declared by a dataset's attributes
+        or None when the dataset is not packed.
+        """
+        if dataset_path not in self._packings:
+            self._packings[dataset_path] = \
+                datasetPacking(self.getDataset(dataset_path))
+        return self._packings[dataset_path]
+
+    def _derivedInput(self, dataset_path, subset=()):
+        # unpacked data always uses NaN for missing values
+        if self._datasetPacking(dataset_path) is None:
+            missing = self.datasetAttribute(dataset_path, 'missing', None)
+        else: missing = None
+        return DerivedInput(self.getDataset(dataset_path),
+                            self.datasetAttribute(dataset_path, 'units', None),
+                            missing, self._getUnpacker(dataset_path), subset)
+
     def _processDataOut(self, dataset_path, data, **kwargs):
         if kwargs.get('raw', False): return data
         data = self._unpackData(dataset_path, data, **kwargs)
         return self._postUnpack(dataset_path, data, **kwargs)
 
     def _getUnpacker(self, dataset_path):
-        return self.unpackers.get(dataset_path,
-                                  self.unpackers.get('default', None))
+        unpack = self.unpackers.get(dataset_path, None)
+        if unpack is not None: return unpack
+        packing = self._datasetPacking(dataset_path)
+        if packing is not None: return packing.unpack
+        return self.unpackers.get('default', None)
 
     def _postUnpack(self, dataset_path, data, **kwargs):
         # check for units conversion
@@ -436,10 +524,14 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
         else:
             errmsg = '"%s" dataset has no attribute named "units"'
             raise AttributeError, errmsg % dataset_path
+        return data
 
     def _unpackData(self, dataset_path, data, **kwargs):
         unpack = self._getUnpacker(dataset_path)
-        if unpack is not None: return unpack(data)
+        if unpack is not None:
+            if getattr(unpack, 'accepts_options', False):
+                return unpack(data, **kwargs)
+            return unpack(data)
 
         # check for some common data conversion options
         out_missing = kwargs.get('missing',None)
@@ -464,35 +556,50 @@ class Hdf5FileReader(Hdf5DataReaderMixin, object):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def _where(self, criteria):
+    def iterWhere(self, criteria, chunk_size=None):
+        """ Generator that evaluates criteria one block of rows at a time
+        and yields the indexes of the entries in each block that meet
+        them. Only the rows in the current block of each dataset used
+        in the criteria are read, and datasets are not read at all when
+        earlier rules have already eliminated every row in the block.
+        """
+        rules = criteriaToRules(criteria)
+        if not rules: return
+
+        errmsg = 'Key for filter criteria is not a valid dataset name : %s'
+        dataset_names = self.dataset_names
+        datasets = { }
+        for key in ruleDatasets(rules):
+            if key not in dataset_names: raise KeyError, errmsg % key
+            datasets[key] = self.dataset(key)
+
+        num_rows = min([dataset.shape[0] for dataset in datasets.values()])
+        if chunk_size is None:
+            chunk_size = max([ dataset.chunks[0] if dataset.chunks
+                               else num_rows for dataset in datasets.values() ])
+        chunk_size = max(chunk_size, 1)
+
+        for start in range(0, num_rows, chunk_size):
+            end = min(start + chunk_size, num_rows)
+            block = { }
+            def getBlock(key):
+                if key not in block:
+                    block[key] = self._processDataOut(key,
+                                                      datasets[key][start:end])
+                return block[key]
+
+            mask = rulesToMask(rules, getBlock)
+            indexes = N.nonzero(mask)
+            if len(indexes[0]) > 0:
+                yield (indexes[0] + start,) + indexes[1:]
+
+    def _where(self, criteria, chunk_size=None):
         if criteria:
-            errmsg = 'Key for filter criteria is not a valid dataset name : %s'
-            where = None
-            constraint_data = { }
-            dataset_names = self.allDatasetNames()
-
-            if isinstance(criteria, dict):
-                for key, constraint in criteria.items():
-                    if constraint is None: continue
-                    if key in dataset_names:
-                        if key not in constraint_data:
-                            constraint_data[key] = self.getData(key)
-                    else: raise KeyError, errmsg % key
-                if constraint_data:
-                    where = dictToWhere(criteria)
-
-            elif isinstance(criteria, (list,tuple)):
-                for rule in criteria:
-                    key = rule[0]
-                    if key in dataset_names:
-                        if key not in constraint_data:
-                            constraint_data[key] = self.getData(key)
-                    else: raise KeyError, errmsg % key
-                if constraint_data:
-                    where = listToWhere(criteria)
-
-            if where is not None:
-                return eval(where, globals(), constraint_data)
+            indexes = list(self.iterWhere(criteria, chunk_size))
+            if indexes:
+                return tuple([ N.concatenate(axis_indexes)
+                               for axis_indexes in zip(*indexes) ])
+            return (N.array([], dtype=int),)
 
         return None
 
@@ -599,6 +706,7 @@ class Hdf5FileManager(Hdf5DataWriterMixin, Hdf5FileReader):
         if ('dtype' in _kwargs): del _kwargs['dtype']
         self._createEmptyDataset_(parent, name, shape, dtype, **_kwargs)
         self._registerDatasetName(dataset_path)
+        self._packings.pop(dataset_path, None)
         dataset = self._updateDataset_(parent, name, 
                       self._processDataIn(dataset_path, numpy_array, **kwargs), 
                       {}, update_timestamp=False, **kwargs)
@@ -609,7 +717,7 @@ class Hdf5FileManager(Hdf5DataWriterMixin, Hdf5FileReader):
         self.assertFileWritable()
         _kwargs = { }
         _kwargs.update(kwargs)
-        if 'fillvalue' is not None: _kwargs['fillvalue']  = fill_value
+        if fill_value is not None: _kwargs['fillvalue']  = fill_value
         name, parent = self._pathToNameAndParent(self.file, dataset_path)
         dataset = \
             self._createEmptyDataset_(parent, name, shape, dtype, **_kwargs)
@@ -632,6 +740,49 @@ class Hdf5FileManager(Hdf5DataWriterMixin, Hdf5FileReader):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def packDataset(self, dataset_path, mode, precision=None,
+                          scale_factor=None, add_offset=None):
+        """ Converts an existing floating point dataset to a packed
+        storage mode ('float32' or 'int16'). The dataset is rewritten
+        one block at a time with the same shape, chunks, compression and
+        attributes. When precision is None, the dataset's "precision"
+        attribute is used. When add_offset is None and the dataset's
+        values do not fit in int16 with an offset of 0, the middle of
+        their range is used. Raises ValueError when they can not fit.
+
+        NOTE: HDF5 does not reclaim the space used by the original data,
+              run h5repack (or build a new file) to shrink the file.
+        """
+        self.assertFileWritable()
+        dataset = self.getDataset(dataset_path)
+        if 'packing' in dataset.attrs:
+            errmsg = '"%s" dataset is already packed as %s.'
+            raise ValueError, errmsg % (dataset_path, dataset.attrs['packing'])
+        if dataset.dtype.kind != 'f':
+            errmsg = 'Cannot pack "%s" dataset with dtype %s.'
+            raise TypeError, errmsg % (dataset_path, str(dataset.dtype))
+
+        if precision is None:
+            precision = dataset.attrs.get('precision', None)
+        missing = dataset.attrs.get('missing', N.nan)
+        if isinstance(missing, basestring):
+            try:
+                missing = float(missing)
+            except ValueError:
+                missing = N.nan
+        min_value, max_value = datasetRange(dataset, missing)
+        packing = packingForRange(mode, min_value, max_value, precision,
+                                  scale_factor, add_offset, dataset_path)
+
+        name, parent = self._pathToNameAndParent(self.file, dataset_path)
+        key = self.hdfObjectKey(name)
+        temp_key = '%s__packed__' % key
+        packDatasetInto(dataset, parent, temp_key, packing, missing)
+        del parent[key]
+        parent.move(temp_key, key)
+        self._packings.pop(dataset_path, None)
+        return self.getDataset(dataset_path)
+
     def replaceDataset(self, dataset_path, data, attributes):
         self.deleteDataset(dataset_path)
         attributes['updated'] = self._timestamp_()
@@ -664,7 +815,11 @@ class Hdf5FileManager(Hdf5DataWriterMixin, Hdf5FileReader):
 
     def deleteDataset(self, dataset_path):
         self.assertFileWritable()
-        self._deleteDataset_(self.file, dataset_path, attr_name)
+        name, parent = self._pathToNameAndParent(self.file, dataset_path)
+        del parent[self.hdfObjectKey(name)]
+        self._dataset_names = tuple([path for path in self._dataset_names
+                                     if path != dataset_path])
+        self._packings.pop(dataset_path, None)
 
     def deleteDatasetAttribute(self, dataset_path, attr_name):
         self.assertFileWritable()
@@ -772,17 +927,38 @@ class Hdf5FileManager(Hdf5DataWriterMixin, Hdf5FileReader):
         return self._packData(dataset_path, data, **kwargs)
 
     def _getPacker(self, dataset_path):
-        return self.packers.get(dataset_path,
-                                self.packers.get('default', None))
+        pack = self.packers.get(dataset_path, None)
+        if pack is not None: return pack
+        packing = self._datasetPacking(dataset_path)
+        if packing is not None: return packing.pack
+        return self.packers.get('default', None)
 
     def _packData(self, dataset_path, data, **kwargs):
         pack = self._getPacker(dataset_path)
         if pack is None: return data
-        else: return pack(data)
+        if getattr(pack, 'accepts_options', False):
+            missing = kwargs.get('missing', None)
+            if missing is None: missing = self._unpackedMissing(dataset_path)
+            return pack(data, missing=missing)
+        return pack(data)
 
     def _prePack(self, dataset_path, data, **kwargs):
         return data
 
+    def _unpackedMissing(self, dataset_path):
+        # missing value for unpacked data is the 2nd item in "unpack"
+        unpack = self.datasetAttribute(dataset_path, 'unpack', None)
+        if unpack is None: return N.nan
+        if isinstance(unpack, basestring): unpack = tupleFromString(unpack)
+        if len(unpack) < 2: return N.nan
+        missing = unpack[1]
+        if isinstance(missing, basestring):
+            try:
+                missing = float(missing)
+            except ValueError: # i.e. 'N.nan' or 'None'
+                missing = N.nan
+        return missing
+
 
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
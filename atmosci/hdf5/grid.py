@@ -6,7 +6,20 @@ import math
 
 import numpy as N
 
+from atmosci.acis.nodefinder import acisGridNodeIndexer
+from atmosci.hdf5.derived import derivedVariable
 from atmosci.hdf5.file import Hdf5FileReader, Hdf5FileManager
+from atmosci.utils.windows import WINDOW_RECORD_DTYPE, GridWindow, \
+                                  gridWindowRegistry
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def windowIndex(first, last):
+    """ Returns the index that selects first thru last-1 along one axis
+    of a grid window, or just first when last == first.
+    """
+    if last == first: return first
+    return slice(first, last)
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -16,12 +29,21 @@ class Hdf5GridFileMixin:
 
     def getData(self, dataset_name, bounded=False, **kwargs):
         self.assertFileOpen()
+        if self.isDerivedDataset(dataset_name):
+            return self.getDerivedData(dataset_name, **kwargs)
+        if kwargs.get('lazy', False):
+            return self.lazyDataset(dataset_name, **kwargs)
         data = self._getData_(self.file, dataset_name, **kwargs)
         if kwargs.get('raw',False): return data
         return self._processDataOut(dataset_name, data, **kwargs)
 
     def getDataInBounds(self, dataset_name, **kwargs):
         self.assertFileOpen()
+        if self.isDerivedDataset(dataset_name):
+            ndims = len(self._derivedInputShape(dataset_name))
+            y_index, x_index = self._boundsIndexes(ndims)
+            return self._derivedDataInWindow(dataset_name, y_index, x_index,
+                                             **kwargs)
         dataset = self.getDataset(dataset_name)
         data = self._coordBoundsSubset(dataset)
         if kwargs.get('raw',False): return data
@@ -29,15 +51,37 @@ class Hdf5GridFileMixin:
 
     def get2DSlice(self, dataset_name, min_lon, max_lon, min_lat, max_lat,
                          **kwargs):
-        min_y, min_x = self.ll2index(min_lon, min_lat)
-        max_y, max_x = self.ll2index(max_lon, max_lat)
+        window = self.bboxWindow((min_lon, min_lat, max_lon, max_lat))
+        if self.isDerivedDataset(dataset_name):
+            return self._derivedDataInWindow(dataset_name,
+                        windowIndex(window.y0, window.y1),
+                        windowIndex(window.x0, window.x1), **kwargs)
         dataset = self.getDataset(dataset_name)
-        data = self._slice2DDataset(dataset, min_y, max_y, min_x, max_x)
+        data = self._slice2DDataset(dataset, window.y0, window.y1, window.x0,
+                                    window.x1)
         if kwargs.get('raw',False): return data
         return self._processDataOut(dataset_name, data, **kwargs)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def bboxWindow(self, bbox, tolerance=None):
+        """ Returns a GridWindow with the indexes of the nodes closest to
+        the corners of a bounding box (min_lon, min_lat, max_lon, max_lat)
+        or of a registered region when bbox is a region name.
+
+        Windows are cached for every file with the same lon/lat grids,
+        so the nodes are only searched for the first time a bbox is used.
+        """
+        if isinstance(bbox, basestring): return self.regionWindow(bbox)
+        windows = getattr(self, 'windows', None)
+        if windows is None: return self._bboxCornerWindow(bbox, tolerance)
+        if tolerance is None: kind = 'nodes'
+        else: kind = 'nodes %s' % repr(tolerance)
+        resolve = lambda bbox: self._bboxCornerWindow(bbox, tolerance)
+        return windows.bboxWindow(bbox, resolve, kind)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def distanceBetweenNodes(self, lon1, lat1, lon2, lat2):
         lon_diffs = lon1 - lon2
         lat_diffs = lat1 - lat2
@@ -91,10 +135,67 @@ class Hdf5GridFileMixin:
         """ Returns the indexes of the grid node that is closest to the
         lon/lat coordinate point.
         """
-        if hasattr(self, 'nodeIndexer'):
+        if getattr(self, 'nodeIndexer', None) is not None:
             return self.nodeIndexer(lon, lat)
         else: return self._indexOfClosestNode(lon, lat)
 
+    def ll2indexes(self, lons, lats):
+        """ Returns arrays with the indexes of the grid nodes that are
+        closest to each lon/lat coordinate point. All points are resolved
+        in a single call when the grid has a nodeIndexer.
+        """
+        lons = N.asarray(lons, dtype=float)
+        lats = N.asarray(lats, dtype=float)
+        if getattr(self, 'nodeIndexer', None) is not None:
+            return self.nodeIndexer(lons, lats)
+        y = N.empty(lons.shape, dtype=N.int64)
+        x = N.empty(lons.shape, dtype=N.int64)
+        for indx in range(lons.size):
+            y.flat[indx], x.flat[indx] = \
+                self._indexOfClosestNode(lons.flat[indx], lats.flat[indx])
+        return y, x
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def loadRegionWindows(self, group_path='windows'):
+        """ Loads the named regions saved in the file into the registry
+        of windows for the file's lon/lat grids. Returns a tuple with
+        the names of the regions that were loaded.
+        """
+        records = self.getDataset('%s.regions' % group_path)[()]
+        names = [ ]
+        for record in records:
+            if record['mask'] < 0: mask = None
+            else:
+                mask_path = '%s.mask_%d' % (group_path, record['mask'])
+                mask = self.getDataset(mask_path)[()].astype(bool)
+            bbox = tuple([float(record[key]) for key in
+                          ('min_lon', 'min_lat', 'max_lon', 'max_lat')])
+            window = tuple([int(record[key]) for key in ('y0','y1','x0','x1')])
+            self.windows.registerRegion(record['name'], bbox, window+(mask,))
+            names.append(record['name'])
+        self.windows.sources.add(self.filepath)
+        return tuple(names)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def regionWindow(self, name):
+        """ Returns the GridWindow for a registered region.
+        """
+        windows = getattr(self, 'windows', None)
+        if windows is None or name not in windows:
+            raise KeyError, '"%s" is not a registered region.' % name
+        return windows.regionWindow(name)
+
+    def registerRegion(self, name, bbox, tolerance=None):
+        """ Registers a region name for a bounding box (min_lon, min_lat,
+        max_lon, max_lat) and returns its GridWindow. Region names may be
+        used in place of a bbox in bboxWindow and setCoordinateBounds.
+        """
+        window = self._bboxCornerWindow(bbox, tolerance)
+        self.windows.registerRegion(name, bbox, window)
+        return window
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def setAreaMask(self, mask_name='mask'):
@@ -106,8 +207,12 @@ class Hdf5GridFileMixin:
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def setCoordinateBounds(self, point_or_bbox, tolerance=None):
+        window = None
         if isinstance(point_or_bbox, basestring):
-            point_or_bbox = eval(point_or_bbox)
+            windows = getattr(self, 'windows', None)
+            if windows is not None and point_or_bbox in windows:
+                point_or_bbox, window = windows.region(point_or_bbox)
+            else: point_or_bbox = eval(point_or_bbox)
 
         if len(point_or_bbox) == 2:
             self._coord_bounds = None
@@ -115,11 +220,10 @@ class Hdf5GridFileMixin:
             self._index_bounds = None
         elif len(point_or_bbox) == 4:
             self._coord_bounds = tuple(point_or_bbox)
-            lon, lat = point_or_bbox[:2]
-            y1, x1 = self._indexOfClosestNode(lon, lat, tolerance)
-            lon, lat = point_or_bbox[2:]
-            y2, x2 = self._indexOfClosestNode(lon, lat, tolerance)
-            self._index_bounds = (y1, x1, y2+1, x2+1)
+            if window is None:
+                window = self.bboxWindow(point_or_bbox, tolerance)
+            self._index_bounds = (window.y0, window.x0, window.y1+1,
+                                  window.x1+1)
             self._y = None
             self._x = None
         else:
@@ -168,27 +272,33 @@ class Hdf5GridFileMixin:
 
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
+    def _boundsIndexes(self, ndims):
+        """ Returns the y and x indexes that _coordBoundsSubset uses to
+        read a dataset with ndims dimensions.
+        """
+        if self._index_bounds is not None:
+            min_y, min_x, max_y, max_x = self._index_bounds
+            if ndims == 3:
+                return windowIndex(min_y, max_y), windowIndex(min_x, max_x)
+            return slice(min_y, max_y), slice(min_x, max_x)
+        elif self._x is not None:
+            return self._y, self._x
+        return slice(None), slice(None)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def _coordBoundsSubset(self, dataset):
         """ Returns a subset of a grid that is within the grid manager's
         lon/lat bounding box. Grid shape must be [y, x].
         """
         if self._index_bounds is not None:
             min_y, min_x, max_y, max_x = self._index_bounds
-
-            if max_y < dataset.shape[0]:
-                if max_x < dataset.shape[1]:
-                    return dataset.value[min_y:max_y, min_x:max_x]
-                else:
-                    return dataset.value[min_y:max_y, min_x:]
-            else:
-                if max_x < dataset.shape[1]:
-                    return dataset.value[min_y:, min_x:max_x]
-                else:
-                    return dataset.value[min_y:, min_x:]
+            # bounds past the edge of the grid end at the edge
+            return dataset[min_y:max_y, min_x:max_x]
 
         # asking for a single point
         elif self._x is not None:
-            return  dataset.value[self._y, self._x]
+            return  dataset[self._y, self._x]
 
         # asking for the whole dataset
         return dataset.value
@@ -196,6 +306,17 @@ class Hdf5GridFileMixin:
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def _bboxCornerWindow(self, bbox, tolerance=None):
+        if tolerance is None:
+            y0, x0 = self.ll2index(bbox[0], bbox[1])
+            y1, x1 = self.ll2index(bbox[2], bbox[3])
+        else:
+            y0, x0 = self._indexOfClosestNode(bbox[0], bbox[1], tolerance)
+            y1, x1 = self._indexOfClosestNode(bbox[2], bbox[3], tolerance)
+        return GridWindow(int(y0), int(y1), int(x0), int(x1), None)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def _indexOfClosestNode(self, target_lon, target_lat, tolerance=None):
         # "closeness" is dependent on the projection and grid spacing of
         # the data ... this implementation is decent for grids in the
@@ -297,28 +418,34 @@ class Hdf5GridFileMixin:
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def _derivedDataInWindow(self, dataset_name, y_index, x_index, **kwargs):
+        """ Computes a derived dataset for the same grid nodes that a read
+        of [..., y_index, x_index] returns from a stored dataset.
+        """
+        shape = self._derivedInputShape(dataset_name)
+        if len(shape) == 3:
+            return self.getDerivedData(dataset_name,
+                                       subset=(y_index, x_index), **kwargs)
+        # 2D grids are evaluated along the y axis
+        if isinstance(y_index, slice):
+            start, end, step = y_index.indices(shape[0])
+            return self.getDerivedData(dataset_name, start, end,
+                                       subset=(x_index,), **kwargs)
+        return self.getDerivedData(dataset_name, index=y_index,
+                                   subset=(x_index,), **kwargs)
+
+    def _derivedInputShape(self, dataset_name):
+        # derived datasets have the same shape as their first input
+        input_path = derivedVariable(dataset_name).input_names[0]
+        return self.getDataset(input_path).shape
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def _slice2DDataset(self, dataset, min_y, max_y, min_x, max_x):
-        if max_y == min_y:
-            if max_x == min_x: # retrieve data for one node
-                return dataset[min_y, min_x]
-            elif max_x < dataset.shape[1]:
-                return dataset.value[min_y, min_x:max_x]
-            else: # max_x >= dataset.shape[1]
-                return dataset.value[min_y, min_x:]
-        elif max_y < dataset.shape[0]:
-            if max_x == min_x:
-                return dataset.value[min_y:max_y, min_x]
-            elif max_x < dataset.shape[1]:
-                return dataset.value[min_y:max_y, min_x:max_x]
-            else: # max_x >= dataset.shape[1]
-                return dataset.value[min_y:max_y, min_x:]
-        else: # max_y >= dataset.shape[0]
-            if max_x == min_x:
-                return dataset.value[min_y:, min_x]
-            elif max_x < dataset.shape[1]:
-                return dataset.value[start, min_y:, min_x:max_x]
-            else: # max_x >= dataset.shape[1]
-                return dataset.value[min_y:, min_x:]
+        # reads only the window from the file ... a max index equal to
+        # the min index selects a single row/column and bounds past the
+        # edge of the grid end at the edge
+        return dataset[windowIndex(min_y, max_y), windowIndex(min_x, max_x)]
 
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
@@ -344,6 +471,24 @@ class Hdf5GridFileMixin:
         if not hasattr(self, 'node_search_radius') \
         or self.node_search_radius is None:
             self._setDefaultSearchRadius_()
+        self._initNodeIndexer_()
+        self._initWindowRegistry_()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _initNodeIndexer_(self):
+        # nodes in ACIS grids are regularly spaced in lon/lat, so the node
+        # closest to any point can be calculated instead of searched for
+        if 'nodeIndexer' in dir(self.__class__): return
+        self.nodeIndexer = acisGridNodeIndexer(self.lons, self.lats)
+
+    def _initWindowRegistry_(self):
+        # windows are shared by all files with the same lon/lat grids
+        self.windows = gridWindowRegistry(self.lons, self.lats)
+        if self.windows is None: return
+        if self.filepath not in self.windows.sources \
+        and self.datasetExists('windows.regions'):
+            self.loadRegionWindows()
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -413,8 +558,93 @@ class Hdf5GridFileManager(Hdf5FileManager, Hdf5GridFileMixin):
         dataset = self.getDataset(dataset_name)
         self._insert2DSlice(dataset, data, min_y, max_y, min_x, max_x)
 
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def saveRegionWindows(self, group_path='windows'):
+        """ Saves the windows for all registered regions in the file
+        (normally a static file), replacing any that were saved before.
+        They are loaded automatically whenever a file with the same
+        lon/lat grids is opened in the same process.
+        """
+        names = self.windows.regions
+        if self.groupExists(group_path): self.deleteObject(group_path)
+        self.createGroup(group_path,
+                         description='Index windows for named regions')
+
+        records = N.empty((len(names),), dtype=WINDOW_RECORD_DTYPE)
+        for indx, name in enumerate(names):
+            bbox, window = self.windows.region(name)
+            if window.mask is None: mask = -1
+            else:
+                mask = indx
+                mask_path = '%s.mask_%d' % (group_path, indx)
+                dataset = self.createEmptyDataset(mask_path,
+                                                  window.mask.shape, '|u1')
+                dataset[...] = window.mask
+            records[indx] = (name,) + tuple(bbox) + tuple(window[:4]) + (mask,)
+
+        dataset = self.createEmptyDataset('%s.regions' % group_path,
+                                          records.shape, records.dtype)
+        dataset[...] = records
+        self.windows.sources.add(self.filepath)
+
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
+    def _insertAtNodeIndexes(self, dataset_path, data, start_index, y, x,
+                                   **kwargs):
+        """ Inserts a series of values at each of many grid nodes in a 3D
+        dataset. Row n of the 2D data array is inserted at node y[n], x[n]
+        beginning at start_index in the first dimension.
+
+        Nodes are grouped by the HDF5 chunk that contains them and each
+        touched chunk is updated with a single read-modify-write. When
+        the same node appears more than once, the last series wins.
+
+        Returns the number of nodes updated.
+        """
+        dataset = self.getDataset(dataset_path)
+        if dataset.ndim != 3 or data.ndim != 2:
+            errmsg = 'Cannot insert %dD node data into %dD dataset "%s".'
+            raise ValueError, errmsg % (data.ndim, dataset.ndim, dataset_path)
+        y = N.asarray(y, dtype=N.int64).ravel()
+        x = N.asarray(x, dtype=N.int64).ravel()
+        if data.shape[0] != y.size:
+            errmsg = 'Data for %d nodes was passed with %d node coordinates.'
+            raise ValueError, errmsg % (data.shape[0], y.size)
+        if y.size == 0: return 0
+
+        end_index = start_index + data.shape[1]
+        # contiguous datasets are updated one row of nodes at a time
+        if dataset.chunks is not None: rows, cols = dataset.chunks[1:]
+        else: rows, cols = 1, dataset.shape[2]
+
+        # sort the nodes by chunk, keeping original order within each chunk
+        chunk_y = y // rows
+        chunk_x = x // cols
+        keys = (chunk_y * (dataset.shape[2] // cols + 1)) + chunk_x
+        order = N.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        first = N.concatenate(([0], N.nonzero(keys[1:] != keys[:-1])[0] + 1,
+                               [keys.size]))
+
+        for indx in range(len(first)-1):
+            nodes = order[first[indx]:first[indx+1]]
+            min_y = chunk_y[nodes[0]] * rows
+            min_x = chunk_x[nodes[0]] * cols
+            max_y = min(min_y + rows, dataset.shape[1])
+            max_x = min(min_x + cols, dataset.shape[2])
+            block = dataset[start_index:end_index, min_y:max_y, min_x:max_x]
+            block[:, y[nodes] - min_y, x[nodes] - min_x] = data[nodes].T
+            dataset[start_index:end_index, min_y:max_y, min_x:max_x] = block
+
+        # always track time updated
+        timestamp = kwargs.get('timestamp', self.timestamp)
+        self.setDatasetAttribute(dataset_path, 'updated', timestamp)
+
+        return y.size
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def _insertDataInBounds(dataset_name, dataset, data):
         if self._index_bounds is not None:
             min_y, max_y, min_x, max_x = self._index_bounds
@@ -1,13 +1,17 @@
 """ Classes for accessing hourly data from Hdf5 encoded grid files.
 """
 
+import calendar
 import datetime
+ONE_HOUR = datetime.timedelta(hours=1)
 
 import numpy as N
 
 from atmosci.utils import tzutils
 
-from atmosci.hdf5.grid import Hdf5GridFileReader, Hdf5GridFileManager
+from atmosci.hdf5.derived import derivedVariable
+from atmosci.hdf5.grid import Hdf5GridFileReader, Hdf5GridFileManager, \
+                              windowIndex
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -28,6 +32,346 @@ compareValues = { '==': lambda v1,v2 : v1 == v2,
                   '>=': lambda v1,v2 : v1 >= v2,
                   '!=': lambda v1,v2 : v1 != v2 }
 
+TIME_REDUCTIONS = ('min', 'max', 'mean', 'sum', 'count')
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class TimeReducer(object):
+    """ Accumulates NaN-aware reductions along the time axis of hourly
+    grids one chunk at a time, so that a min, max, mean and sum can all
+    be computed in a single pass without holding the full 3D time slice
+    in memory.
+
+    Grid nodes that never have a valid value will be NaN in the min,
+    max and mean grids and zero in the sum grid (same as N.nansum).
+    """
+
+    def __init__(self, ops=('min','max','mean','sum')):
+        if isinstance(ops, basestring): ops = (ops,)
+        for op in ops:
+            if op not in TIME_REDUCTIONS:
+                errmsg = '"%s" is not a supported time reduction.' 
+                raise ValueError, errmsg % op
+        self.ops = tuple(ops)
+
+        self.count = None
+        self.hours = 0
+        self.max = None
+        self.min = None
+        self.sum = None
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def results(self):
+        """ Returns a dictionary of 2D grids for each requested
+        reduction, keyed by op name.
+        """
+        if self.count is None:
+            raise ValueError, 'No data has been passed to the reducer.'
+
+        results = { }
+        for op in self.ops:
+            if op == 'count': results[op] = self.count.copy()
+            elif op == 'mean':
+                mean = N.empty(self.sum.shape, dtype=float)
+                mean.fill(N.nan)
+                valid = self.count > 0
+                mean[valid] = self.sum[valid] / self.count[valid]
+                results[op] = mean
+            else: results[op] = getattr(self, op).copy()
+        return results
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def update(self, data):
+        """ Add a 2D (single hour) or 3D (hours,rows,columns) chunk
+        of data to the reduction.
+        """
+        if data.ndim == 2: data = data.reshape((1,) + data.shape)
+        if data.shape[0] == 0: return
+
+        valid = ~N.isnan(data)
+        if self.count is None: self._initialize_(data.shape[1:])
+        self.count += valid.sum(axis=0)
+        self.hours += data.shape[0]
+
+        if 'min' in self.ops:
+            chunk = N.where(valid, data, N.inf).min(axis=0)
+            N.fmin(self.min, N.where(N.isinf(chunk), N.nan, chunk), self.min)
+        if 'max' in self.ops:
+            chunk = N.where(valid, data, -N.inf).max(axis=0)
+            N.fmax(self.max, N.where(N.isinf(chunk), N.nan, chunk), self.max)
+        if 'sum' in self.ops or 'mean' in self.ops:
+            self.sum += N.where(valid, data, 0.).sum(axis=0)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _initialize_(self, grid_shape):
+        self.count = N.zeros(grid_shape, dtype=int)
+        if 'min' in self.ops:
+            self.min = N.empty(grid_shape, dtype=float)
+            self.min.fill(N.nan)
+        if 'max' in self.ops:
+            self.max = N.empty(grid_shape, dtype=float)
+            self.max.fill(N.nan)
+        if 'sum' in self.ops or 'mean' in self.ops:
+            self.sum = N.zeros(grid_shape, dtype=float)
+
+def epochHour(time_obj):
+    """ Returns the number of hours between 1970-01-01:00 UTC and a
+    timezone aware datetime.
+    """
+    return calendar.timegm(time_obj.utctimetuple()) // 3600
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class HourlyTimeAxis(object):
+    """ Precomputed time axis for an hourly dataset. Hours are stored as
+    int64 hours since 1970-01-01:00 UTC, so once the axis is loaded,
+    converting times to indexes is integer arithmetic.
+
+    Arguments:
+    ---------
+        dataset_path: full dot.path to dataset (string)
+        start_time: timezone aware datetime of first hour in dataset
+        end_time: timezone aware datetime of last hour in dataset
+        frequency: number of hours between entries in the dataset
+        tzinfo: timezone used for naive input times. None means that
+                the caller's timezone (or the default) should be used.
+    """
+
+    def __init__(self, dataset_path, start_time, end_time, frequency=1,
+                       tzinfo=None):
+        self.dataset_path = dataset_path
+        self.end_time = end_time
+        self.frequency = int(frequency)
+        self.start_time = start_time
+        self.tzinfo = tzinfo
+
+        self.first_hour = epochHour(start_time)
+        self.last_hour = epochHour(end_time)
+        self.hours = N.arange(self.first_hour, self.last_hour+1,
+                              self.frequency, dtype=N.int64)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def index(self, epoch_hour, exact=True, hour=None):
+        """ Returns the index of a single epoch hour. hour is only used
+        to make error messages more readable.
+        """
+        if hour is None: hour = epoch_hour
+        if epoch_hour < self.first_hour or epoch_hour > self.last_hour:
+            msg_args = (str(hour), str(epoch_hour), str(self.start_time),
+                        str(self.end_time), self.dataset_path)
+            errmsg = '%s (%s) is outside the valid range of hours\n'
+            errmsg += '(%s to %s) for the "%s" dataset.'
+            raise ValueError, errmsg % msg_args
+
+        diff = int(epoch_hour - self.first_hour)
+        if self.frequency == 1: return diff
+        index, mod = divmod(diff, self.frequency)
+        # always return an exact match
+        if mod == 0: return index
+        # raise exception when hour must exactly match a dataset hour
+        if exact:
+            msg_args = (str(hour), diff, self.frequency, self.dataset_path)
+            errmsg = '%s (hour %d) is not a multiple of the hourly'
+            errmsg += ' frequency (%d) in the "%s" dataset.\nPass False'
+            errmsg += ' in "exact" arg to get data for closest hour.'
+            raise ValueError, errmsg % msg_args
+        # "exact" is False - return index for closest hour
+        if mod <= self.frequency / 2.: return index
+        return index + 1
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def indexes(self, epoch_hours, exact=True):
+        """ Vectorized version of index() for an array of epoch hours.
+        """
+        epoch_hours = N.asarray(epoch_hours, dtype=N.int64)
+        outside = (epoch_hours < self.first_hour) \
+                | (epoch_hours > self.last_hour)
+        if outside.any():
+            msg_args = (N.count_nonzero(outside), str(self.start_time),
+                        str(self.end_time), self.dataset_path)
+            errmsg = '%d hours are outside the valid range of hours\n'
+            errmsg += '(%s to %s) for the "%s" dataset.'
+            raise ValueError, errmsg % msg_args
+
+        diffs = epoch_hours - self.first_hour
+        if self.frequency == 1: return diffs
+        indexes, mods = N.divmod(diffs, self.frequency)
+        if exact:
+            if mods.any():
+                msg_args = (N.count_nonzero(mods), self.frequency,
+                            self.dataset_path)
+                errmsg = '%d hours are not a multiple of the hourly'
+                errmsg += ' frequency (%d) in the "%s" dataset.\nPass False'
+                errmsg += ' in "exact" arg to get data for closest hours.'
+                raise ValueError, errmsg % msg_args
+            return indexes
+        return N.where(mods <= self.frequency / 2., indexes, indexes + 1)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def monthKey(hour):
+    """ Returns an integer that uniquely identifies the month containing
+    hour. Consecutive months have consecutive keys.
+    """
+    return (hour.year * 12) + hour.month - 1
+
+def monthStart(month_key, tzinfo):
+    """ Returns the first hour of the month identified by month_key
+    in the timezone defined by tzinfo.
+    """
+    year, month = divmod(month_key, 12)
+    return tzutils.tzaDatetime(datetime.datetime(year, month+1, 1, 0), tzinfo)
+
+def monthlyTimeSlices(start_time, end_time):
+    """ Splits a span of hours into one (first_hour, last_hour) tuple for
+    each calendar month in the span. Both times must be timezone aware
+    and in the same timezone.
+    """
+    first_key = monthKey(start_time)
+    last_key = monthKey(end_time)
+    if first_key == last_key: return ((start_time, end_time),)
+
+    tzinfo = start_time.tzinfo
+    slices = [ ]
+    first_hour = start_time
+    for key in range(first_key+1, last_key+1):
+        next_month = monthStart(key, tzinfo)
+        slices.append((first_hour, next_month - ONE_HOUR))
+        first_hour = next_month
+    slices.append((first_hour, end_time))
+    return tuple(slices)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class MonthlyGridFileView(object):
+    """ Presents a single, continuous hourly time axis for a dataset that
+    is split across a sequence of monthly hourly grid files.
+
+    Files are located by month using integer arithmetic and readers are
+    opened only once, so resolving a span of hours to (file, offset)
+    pairs does not require scanning files. Data for the entire span is
+    read directly into one preallocated array. Hours that are not in
+    any file (e.g. beyond the last valid hour of a forecast file) are
+    left as NaN.
+
+    Arguments:
+    ---------
+        readerForMonth: function that accepts a timezone aware hour and
+                        returns a reader for the file for that month.
+        dataset_path: full dot.path to dataset in each file (string)
+        grid_shape: tuple with number of rows and columns in the grid
+        timezone: timezone used to determine month boundaries
+    """
+
+    def __init__(self, readerForMonth, dataset_path, grid_shape,
+                       timezone='UTC'):
+        self.dataset_path = dataset_path
+        self.grid_shape = tuple(grid_shape)
+        self.readerForMonth = readerForMonth
+        self.readers = { }
+        self.tzinfo = tzutils.asTimezoneObj(timezone)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def close(self):
+        for reader in self.readers.values(): reader.close()
+        self.readers = { }
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def reader(self, hour):
+        """ Returns the (cached) reader for the month containing hour.
+        """
+        key = monthKey(hour)
+        reader = self.readers.get(key, None)
+        if reader is None:
+            reader = self.readerForMonth(hour)
+            self.readers[key] = reader
+        return reader
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def segments(self, start_time, end_time):
+        """ Resolves a span of hours to the file and offsets that hold
+        each part of it.
+
+        Returns:
+        -------
+            tuple of (first_hour, last_hour, out_start, out_end) where
+            out_start and out_end are indexes into the time axis of
+            the view (i.e. relative to start_time).
+        """
+        start_time = tzutils.tzaDatetime(start_time, self.tzinfo)
+        end_time = tzutils.tzaDatetime(end_time, self.tzinfo)
+
+        segments = [ ]
+        for first_hour, last_hour in monthlyTimeSlices(start_time, end_time):
+            out_start = tzutils.timeDiffInHours(first_hour, start_time)
+            out_end = out_start + tzutils.hoursInTimespan(first_hour, last_hour)
+            segments.append((first_hour, last_hour, out_start, out_end))
+        return tuple(segments)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def timeSlice(self, start_time, end_time, out=None, **kwargs):
+        """ Extracts data for all grid nodes for a continuous span of
+        hours, regardless of how many monthly files it spans.
+
+        An existing 3D array may be passed in "out" to avoid allocating
+        a new one. Otherwise, a float array filled with NaN is created.
+        Options in kwargs are the same as the reader's timeSlice method.
+
+        Returns:
+        -------
+            3D NumPy array (hours, rows, columns)
+        """
+        segments = self.segments(start_time, end_time)
+        shape = (segments[-1][3],) + self.grid_shape
+        if out is None:
+            out = N.empty(shape, dtype=kwargs.get('dtype', float))
+            out.fill(N.nan)
+        elif out.shape != shape:
+            errmsg = 'Shape of "out" array %s does not match time slice %s.'
+            raise ValueError, errmsg % (str(out.shape), str(shape))
+
+        for first_hour, last_hour, out_start, out_end in segments:
+            reader = self.reader(first_hour)
+            self._readSegment(reader, out, first_hour, last_hour, out_start,
+                              **kwargs)
+        return out
+
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _readSegment(self, reader, out, first_hour, last_hour, out_start,
+                           **kwargs):
+        path = self.dataset_path
+        # clip to the hours that are actually in the file
+        valid_start = reader.timeAttribute(path, 'start_time',
+                                           reader.start_time)
+        if first_hour < valid_start:
+            out_start += tzutils.timeDiffInHours(valid_start, first_hour)
+            first_hour = valid_start
+        valid_end = reader.timeAttribute(path, 'end_time', reader.end_time)
+        if last_hour > valid_end: last_hour = valid_end
+        if first_hour > last_hour: return
+
+        start, end = reader.indexesForTimes(path, first_hour, last_hour)
+        out_end = out_start + (end - start)
+        dataset = reader.getDataset(path)
+
+        # no unpacking or conversion required, let HDF5 fill the output
+        if kwargs.get('raw', False) or (reader._getUnpacker(path) is None \
+        and not [key for key in ('units','dtype','missing') if key in kwargs]):
+            dataset.read_direct(out, N.s_[start:end], N.s_[out_start:out_end])
+        else:
+            out[out_start:out_end] = \
+                reader._processDataOut(path, dataset[start:end], **kwargs)
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #
 # timezone-specific file management methods
@@ -169,11 +513,9 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
             NumPy array containing the retrieved data.
         """
         dataset = self.getDataset(dataset_path)
-
-        min_y, min_x = self.ll2index(min_lon, min_lat)
-        max_y, max_x = self.ll2index(max_lon, max_lat)
-
-        data = self._areaSlice(dataset, min_y, min_x, max_y, max_x, **kwargs)
+        window = self.bboxWindow((min_lon, min_lat, max_lon, max_lat))
+        data = self._areaSlice(dataset, window.y0, window.x0, window.y1,
+                               window.x1, **kwargs)
         return self._processDataOut(dataset_path, data, **kwargs)
 
     get2Dslice = areaSlice
@@ -241,12 +583,22 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
                   will be used. The default can be changed
                   using this class' setDefaultTimezone() method.
 
+            NOTE: pass lazy=True to get a LazyDataset proxy (see
+                  atmosci.hdf5.lazy) instead of an array.
+
         Returns:
         -------
             NumPy array containing the retrieved data.
         """
+        if self.isDerivedDataset(dataset_path):
+            time_path = derivedVariable(dataset_path).input_names[0]
+            index = self.indexForTime(time_path, hour, **kwargs)
+            return self.getDerivedData(dataset_path, index=index, **kwargs)
+
         index = self.indexForTime(dataset_path, hour, **kwargs)
-        data = self.getDataset(dataset_path).value[index,:,:]
+        if kwargs.get('lazy', False):
+            return self.lazyDataset(dataset_path, **kwargs)[index]
+        data = self.getDataset(dataset_path)[index,:,:]
         return self._processDataOut(dataset_path, data, **kwargs)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -323,13 +675,12 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
         -------
             NumPy array containing the retrieved data.
         """
-        min_y, min_x = self.ll2index(min_lon, min_lat)
-        max_y, max_x = self.ll2index(max_lon, max_lat)
+        window = self.bboxWindow((min_lon, min_lat, max_lon, max_lat))
         start, end = self.indexesForTimes(dataset_path, start_time,
                                           end_time, **kwargs)
         dataset = self.getDataset(dataset_path)
-        data = self._slice3DDataset(dataset, start, end, min_y, max_y,
-                                    min_x, max_x)
+        data = self._slice3DDataset(dataset, start, end, window.y0, window.y1,
+                                    window.x0, window.x1)
         return self._processDataOut(dataset_path, data, **kwargs)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -370,40 +721,9 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
         # integers are treated as indexes and passed through
         if isinstance(hour, int): return hour
 
-        # conbvert the input hour to an hour in the dataset's timzone
-        timezone = kwargs.get('timezone',None)
-        tzhour = self.asDatasetTime(dataset_path, hour, timezone) 
-        start_time = \
-            self.timeAttribute(dataset_path, 'start_time', self.start_time)
-        end_time = self.timeAttribute(dataset_path, 'end_time', self.end_time)
-
-        if tzhour >= start_time and tzhour <= end_time:
-            frequency = self.datasetAttribute(dataset_path, 'frequency', 1)
-            diff = tzutils.timeDifferenceInHours(tzhour, start_time)
-            if frequency == 1: return diff
-            else:
-                index = diff / frequency
-                mod = diff % frequency
-                # always return an exact match
-                if mod == 0: return index
-                # raise exception when hour must exactly match a dataset hour
-                if exact:
-                    msg_args = (tzutils.hourAsString(hour), diff, frequency,
-                                dataset_path)
-                    errmsg = '%s (hour %d) is not a multiple of the hourly'
-                    errmsg += ' frequency (%d) in the "%s" dataset.\nPass False'
-                    errmsg += ' in "exact" arg to get data for closest hour.'
-                    raise ValueError, errmsg % msg_args
-                # "exact" is False - return index for closest hour
-                else:
-                    if mod <= frequency / 2.: return index
-                    else: return index + 1
-        else:
-            msg_args = (str(hour), tzutils.hourAsString(hour), str(start_time),
-                        str(end_time), dataset_path)
-            errmsg = '%s (%s) is outside the valid range of hours\n'
-            errmsg += '(%s to %s) for the "%s" dataset.'
-            raise ValueError, errmsg % msg_args
+        axis = self.timeAxis(dataset_path)
+        epoch_hour = self._epochHour(axis, hour, kwargs.get('timezone',None))
+        return axis.index(epoch_hour, exact, hour)
     indexForHour = indexForTime
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -465,6 +785,119 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def indexesForTimeArray(self, dataset_path, hours, exact=True, **kwargs):
+        """
+        Vectorized version of indexForTime for a sequence of hours.
+
+        Arguments:
+        ---------
+            dataset_path: full dot.path to dataset (string)
+            hours: NumPy datetime64 array (always interpreted as UTC)
+                   or a sequence of datetime.datetime objects and/or
+                   strings of the form YYYY-MM-DD:HH
+            exact: boolean, same as indexForTime
+
+        Returns:
+        -------
+            NumPy int64 array of indexes
+        """
+        axis = self.timeAxis(dataset_path)
+        if isinstance(hours, N.ndarray) and hours.dtype.kind == 'M':
+            epoch_hours = hours.astype('datetime64[h]').astype(N.int64)
+        else:
+            timezone = kwargs.get('timezone',None)
+            epoch_hours = [self._epochHour(axis, hour, timezone)
+                           for hour in hours]
+        return axis.indexes(epoch_hours, exact)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def iterTimeChunks(self, dataset_path, start_time, end_time, **kwargs):
+        """
+        Generator that walks a time slice of the dataset one chunk
+        of hours at a time. Each chunk is run through the same data
+        processing as timeSlice (unpacking, units, dtype, missing).
+
+        Arguments:
+        ---------
+            dataset_path: full dot.path to dataset (string)
+            start_time: datetime.datetime object or string of
+                        the form YYYY-MM-DD:HH
+            end_time: datetime.datetime object, string of the
+                      form YYYY-MM-DD:HH, an integer number
+                      of hours or ':' indicating to end.
+
+            NOTE: the number of hours in each chunk may be passed
+                  in kwargs as "chunk_hours". Otherwise, it matches
+                  the time dimension of the dataset's HDF5 chunks
+                  or 24 hours when the dataset is not chunked.
+
+        Yields:
+        ------
+            3D NumPy arrays (hours, rows, columns)
+        """
+        start, end = \
+            self.indexesForTimes(dataset_path, start_time, end_time, **kwargs)
+        dataset = self.getDataset(dataset_path)
+        end = min(end, dataset.shape[0])
+
+        step = kwargs.get('chunk_hours', None)
+        if step is None:
+            if dataset.chunks is not None: step = dataset.chunks[0]
+            else: step = 24
+
+        # keep reads aligned with HDF5 chunk boundaries
+        chunk_end = start + step - (start % step)
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_end, end)
+            data = dataset[chunk_start:chunk_end, :, :]
+            yield self._processDataOut(dataset_path, data, **kwargs)
+            chunk_start = chunk_end
+            chunk_end = chunk_start + step
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def reduceTime(self, dataset_path, start_time, end_time,
+                         ops=('min','max','mean','sum'), **kwargs):
+        """
+        Reduces a time slice of the dataset to 2D grids using one or
+        more NaN-aware reductions computed in a single pass over the
+        data. Memory use is bounded by the size of one chunk of hours.
+
+        Arguments:
+        ---------
+            dataset_path: full dot.path to dataset (string)
+            start_time: datetime.datetime object or string of
+                        the form YYYY-MM-DD:HH
+            end_time: datetime.datetime object, string of the
+                      form YYYY-MM-DD:HH, an integer number
+                      of hours or ':' indicating to end.
+            ops: sequence of reductions to compute. Any combination
+                 of 'min', 'max', 'mean', 'sum' and 'count'.
+
+            NOTE: an existing TimeReducer may be passed in kwargs as
+                  "reducer" in order to accumulate reductions across
+                  multiple files. In that case "ops" is ignored and
+                  the reducer is returned instead of the results.
+
+        Returns:
+        -------
+            dictionary of 2D NumPy arrays keyed by op name
+        """
+        reducer = kwargs.get('reducer', None)
+        if reducer is None: _reducer = TimeReducer(ops)
+        else: _reducer = reducer
+
+        for data in \
+        self.iterTimeChunks(dataset_path, start_time, end_time, **kwargs):
+            _reducer.update(data)
+
+        if reducer is None: return _reducer.results()
+        return reducer
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def setDefaultTimezone(self, timezone):
         """
         Set the default timezone for time arguments passed to data
@@ -529,6 +962,28 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def timeAxis(self, dataset_path):
+        """
+        Returns the HourlyTimeAxis for a dataset. It is built from the
+        dataset's time attributes on first access and cached.
+        """
+        axis = self.time_axis_cache.get(dataset_path, None)
+        if axis is None:
+            start_time = \
+                self.timeAttribute(dataset_path, 'start_time', self.start_time)
+            end_time = \
+                self.timeAttribute(dataset_path, 'end_time', self.end_time)
+            frequency = self.datasetAttribute(dataset_path, 'frequency', 1)
+            timezone = self.datasetAttribute(dataset_path, 'timezone', None)
+            if timezone is not None: tzinfo = tzutils.asTimezoneObj(timezone)
+            else: tzinfo = None
+            axis = HourlyTimeAxis(dataset_path, start_time, end_time,
+                                  frequency, tzinfo)
+            self.time_axis_cache[dataset_path] = axis
+        return axis
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def timeAttribute(self, object_path, attr_name, default=None):
         """
         Extract a time attribute from an object in a file.
@@ -640,57 +1095,46 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
                   will be used. The default can be changed
                   using this class' setDefaultTimezone() method.
 
+            NOTE: dataset_path may also be the name of a derived
+                  dataset (see atmosci.hdf5.derived) that can be
+                  computed from datasets stored in the file.
+
+            NOTE: pass lazy=True to get a LazyDataset proxy (see
+                  atmosci.hdf5.lazy) that reads only the data that
+                  is finally selected from it. Derived datasets are
+                  always computed immediately.
+
         Returns:
         -------
             NumPy array containing the retrieved data.
         """
+        if self.isDerivedDataset(dataset_path):
+            # derived datasets use the time axis of their first input
+            time_path = derivedVariable(dataset_path).input_names[0]
+            start, end = \
+                self.indexesForTimes(time_path, start_time, end_time, **kwargs)
+            return self.getDerivedData(dataset_path, start, end, **kwargs)
+
         start, end = \
             self.indexesForTimes(dataset_path, start_time, end_time, **kwargs)
-        data = self.getDataset(dataset_path).value[start:end, :, :]
+        if kwargs.get('lazy', False):
+            return self.lazyDataset(dataset_path, **kwargs)[start:end]
+        data = self.getDataset(dataset_path)[start:end, :, :]
         return self._processDataOut(dataset_path, data, **kwargs)
 
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
     def _areaSlice(self, dataset, min_y, min_x, max_y, max_x, **kwargs):
-        shape = dataset.shape
-        ndims = len(shape)
+        ndims = len(dataset.shape)
         errmsg = 'Cannot subset %dD dataset using lon,lat bounds.'
         assert(ndims in (2,3)), errmsg % ndims
 
+        # only the window is read from the file ... bounds past the edge
+        # of the grid end at the edge
         if ndims == 3:
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[:, min_y, min_x]
-                elif max_x < shape[2]:
-                    return dataset.value[:, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[:, min_y, min_x:]
-            elif max_y < shape[1]:
-                if max_x == min_x:
-                    return dataset.value[:, min_y:max_y, min_x]
-                elif max_x < shape[2]:
-                    return dataset.value[:, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[:, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[:, min_y:, min_x]
-                elif max_x < shape[2]:
-                    return dataset.value[:, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[:, min_y:, min_x:]
-
-        elif ndims == 2:
-            if max_y < shape[0]:
-                if max_x < shape[1]:
-                    return dataset.value[min_y:max_y, min_x:max_x]
-                else:
-                    return dataset.value[min_y:max_y, min_x:]
-            else:
-                if max_x < shape[1]:
-                    return dataset.value[min_y:, min_x:max_x]
-                else:
-                    return dataset.value[min_y:, min_x:]
+            return dataset[:, windowIndex(min_y, max_y),
+                              windowIndex(min_x, max_x)]
+        return dataset[min_y:max_y, min_x:max_x]
         
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -727,6 +1171,16 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def _epochHour(self, axis, hour, timezone=None):
+        # same timezone rules as asDatasetTime, without the attribute reads
+        hour = tzutils.asHourObject(hour)
+        if not tzutils.isValidTimezoneObj(hour.tzinfo):
+            if axis.tzinfo is not None: hour = axis.tzinfo.localize(hour)
+            else: hour = self.asLocalTime(hour, timezone)
+        return epochHour(hour)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def _fromTimeAttrCache(self, object_path, attr_name):
         cache = self.time_attr_cache.get(object_path, { })
         return cache.get(attr_name, None)
@@ -734,72 +1188,10 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def _slice3DDataset(self, dataset, start, end, min_y, max_y, min_x, max_x):
-        if end == start: # single date
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[start, min_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start, min_y, min_x:]
-            elif max_y < dataset.shape[1]:
-                if max_x == min_x:
-                    return dataset.value[start, min_y:max_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[start, min_y:, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start, min_y:, min_x:]
-        elif end < dataset.shape[0]:
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[start:end, min_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:end, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:end, min_y, min_x:]
-            elif max_y < dataset.shape[1]:
-                if max_x == min_x:
-                    return dataset.value[start:end, min_y:max_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:end, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:end, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[start:end, min_y:, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:end, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:end, min_y:, min_x:]
-        else: # end > dataset.shape[0] ... retrieve all dates to end of dataset
-            if max_y == min_y:
-                if max_x == min_x: # retrieve data for one node
-                    return dataset.value[start:, min_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:, min_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:, min_y, min_x:]
-            elif max_y < dataset.shape[1]:
-                if max_x == min_x:
-                    return dataset.value[start:, min_y:max_y, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:, min_y:max_y, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:, min_y:max_y, min_x:]
-            else: # max_y >= dataset.shape[1]
-                if max_x == min_x:
-                    return dataset.value[start:, min_y:, min_x]
-                elif max_x < dataset.shape[2]:
-                    return dataset.value[start:, min_y:, min_x:max_x]
-                else: # max_x >= dataset.shape[2]
-                    return dataset.value[start:, min_y:, min_x:]
+        # only the hyperslab is read from the file ... end == start selects
+        # a single hour and indexes past the end of an axis end there
+        return dataset[windowIndex(start, end), windowIndex(min_y, max_y),
+                       windowIndex(min_x, max_x)]
 
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
@@ -833,6 +1225,7 @@ class Hdf5HourlyGridReaderMethods(TimeZoneManagementMethods):
         self.timezone_cache = timezone_map
 
         self.time_attr_cache = { }
+        self.time_axis_cache = { }
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -911,6 +1304,40 @@ class Hdf5HourlyGridManagerMethods(Hdf5HourlyGridReaderMethods):
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def insertAtNodes(self, dataset_path, data, start_time, lons, lats,
+                            **kwargs):
+        """
+        Inserts data for a sequence hours at each of the grid nodes
+        closest to many coordinate points (e.g. a network of stations).
+
+        Arguments:
+        ---------
+            dataset_path: full dot.path to dataset (string)
+            data: 2D NumPy data array with one row of hourly data
+                  for each coordinate point
+            start_time: datetime.datetime object or string of
+                        the form YYYY-MM-DD:HH
+            lons: sequence of longitudes for grid nodes
+            lats: sequence of latitudes for grid nodes
+
+            NOTE: time arguments are handled the same as insertAtNode.
+
+            NOTE: node indexes for all points are resolved at once and
+                  the dataset is updated one HDF5 chunk at a time, with
+                  the "updated" attribute set only once.
+
+        Returns:
+        -------
+            number of nodes updated
+        """
+        index = self.indexForTime(dataset_path, start_time, **kwargs)
+        y, x = self.ll2indexes(lons, lats)
+        processed = self._processDataIn(dataset_path, data, **kwargs)
+        return self._insertAtNodeIndexes(dataset_path, processed, index, y, x,
+                                         **kwargs)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def insertTimeSlice(self, dataset_path, data, start_time, **kwargs):
         """
         Inserts data for a sequence hours at at all grid nodes.
@@ -1004,7 +1431,12 @@ class Hdf5HourlyGridManagerMethods(Hdf5HourlyGridReaderMethods):
         # cache the new value as a timezone aware datetime
         tz = self.objectAttribute(object_path, 'timezone', self.timezone)
         time_obj = tzutils.asHourInTimezone(hour, tz)
-        self._cacheTimeAttr(object_path, attr_name, time_obj)
+        self._cacheTimeAttr(object_path, attribute_name, time_obj)
+
+        # time axis must be rebuilt the next time it is used
+        if object_path in self.time_axis_cache:
+            del self.time_axis_cache[object_path]
+        else: self.time_axis_cache = { }
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -0,0 +1,180 @@
+""" Lazy, sliceable proxies for datasets in Hdf5 files.
+
+A LazyDataset records the selections and output conversions requested by
+a caller, but nothing is read from the file until it is materialized by
+calling read() or by passing it to a NumPy function. Successive selections
+are combined into a single hyperslab, so only the data that is finally
+selected is read from the file, and the file manager's unpacking, dtype,
+missing value and units conversions are applied only to that data.
+"""
+
+import numpy as N
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# keywords that control reading but are not output conversions
+READ_KEYWORDS = ('index', 'indexes', 'lazy')
+
+SELECTION_TYPE_ERROR = '"%s" is an invalid type for a lazy selection. '
+SELECTION_TYPE_ERROR += 'Only integers, slices and Ellipsis are supported.'
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def sliceLength(_slice):
+    """ Returns the number of indexes in a normalized slice, i.e. one
+    with explicit non-negative start and stop plus a positive step.
+    """
+    return max(0, (_slice.stop - _slice.start + _slice.step - 1) // _slice.step)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def combineSelections(selection, key):
+    """ Applies an index key (int, slice, Ellipsis or a tuple of them) to
+    the axes remaining in selection and returns the combined selection.
+    selection is a tuple with one item for each dimension of a dataset :
+    an int for dimensions that have been indexed out or a normalized
+    slice for dimensions that are still present.
+    """
+    if not isinstance(key, tuple): key = (key,)
+    for item in key:
+        if item is Ellipsis or isinstance(item, slice): continue
+        if isinstance(item, (int, long, N.integer)): continue
+        raise TypeError, SELECTION_TYPE_ERROR % type(item)
+
+    axes = [axis for axis, item in enumerate(selection)
+                 if isinstance(item, slice)]
+    ellipses = [indx for indx, item in enumerate(key) if item is Ellipsis]
+    if len(ellipses) > 1:
+        raise IndexError, 'Only one Ellipsis is allowed in a selection.'
+    elif ellipses:
+        indx = ellipses[0]
+        fill = (slice(None),) * (len(axes) - len(key) + 1)
+        key = key[:indx] + fill + key[indx+1:]
+    if len(key) > len(axes):
+        errmsg = 'Too many indexes (%d) for selection with %d dimensions.'
+        raise IndexError, errmsg % (len(key), len(axes))
+
+    combined = list(selection)
+    for axis, item in zip(axes, key):
+        current = combined[axis]
+        length = sliceLength(current)
+        if isinstance(item, slice):
+            first, last, step = item.indices(length)
+            if step < 1:
+                raise ValueError, 'Lazy selections must have a positive step.'
+            count = max(0, (last - first + step - 1) // step)
+            start = current.start + (first * current.step)
+            step *= current.step
+            if count: stop = start + ((count - 1) * step) + 1
+            else: stop = start
+            combined[axis] = slice(start, stop, step)
+        else:
+            indx = int(item)
+            if indx < 0: indx += length
+            if indx < 0 or indx >= length:
+                errmsg = 'Index %d is out of range for axis with size %d.'
+                raise IndexError, errmsg % (int(item), length)
+            combined[axis] = current.start + (indx * current.step)
+    return tuple(combined)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class LazyDataset(object):
+    """ Proxy for data in an Hdf5 dataset that is read only when it is
+    materialized.
+
+    Arguments:
+    ---------
+        manager: Hdf5 file reader/manager that contains the dataset
+        dataset_path: full dot.path to dataset (string)
+        selection: optional tuple with an int or slice for each
+                   dimension of the dataset. Default is the whole
+                   dataset.
+        kwargs: output options passed to the manager when the data is
+                read (e.g. "dtype", "missing", "raw" and "units")
+
+        NOTE: the file must still be open when the data is read.
+    """
+
+    def __init__(self, manager, dataset_path, selection=None, **kwargs):
+        self.dataset = manager.getDataset(dataset_path)
+        self.dataset_path = dataset_path
+        self.manager = manager
+        self.options = dict([ (key, value) for key, value in kwargs.items()
+                              if key not in READ_KEYWORDS ])
+        if selection is None:
+            selection = tuple([slice(0, size, 1)
+                               for size in self.dataset.shape])
+        self.selection = selection
+
+    def __array__(self, dtype=None):
+        if dtype is None: return N.asarray(self.read())
+        return N.asarray(self.read(), dtype=dtype)
+
+    def __getitem__(self, key):
+        return self._copy(combineSelections(self.selection, key))
+
+    def __len__(self):
+        if not self.shape: raise TypeError, 'len() of unsized selection'
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<LazyDataset "%s" %s %s>' % (self.dataset_path,
+                str(self.selection), str(self.options))
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def shape(self):
+        return tuple([ sliceLength(item) for item in self.selection
+                       if isinstance(item, slice) ])
+
+    @property
+    def size(self):
+        return int(N.prod(self.shape))
+
+    @property
+    def stored_dtype(self):
+        return self.dataset.dtype
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def astype(self, dtype):
+        """ Returns a new proxy that converts the data to dtype when read.
+        """
+        return self._copy(dtype=dtype)
+
+    def inUnits(self, units):
+        """ Returns a new proxy that converts the data to units when read.
+        """
+        return self._copy(units=units)
+
+    def withMissing(self, missing):
+        """ Returns a new proxy that sets missing data to missing when read.
+        """
+        return self._copy(missing=missing)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def read(self):
+        """ Reads the selected hyperslab from the file and applies the
+        output conversions.
+        """
+        data = self.dataset[self.selection]
+        return self.manager._processDataOut(self.dataset_path, data,
+                                            **self.options)
+    materialize = read
+
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _copy(self, selection=None, **options):
+        if selection is None: selection = self.selection
+        kwargs = dict(self.options)
+        kwargs.update(options)
+        return LazyDataset(self.manager, self.dataset_path, selection,
+                           **kwargs)
@@ -98,6 +98,14 @@ class Hdf5DataReaderMixin:
         dataset = self._getDataset_(parent, dataset_name)
         # index subset in kwargs
         if 'indexes' in kwargs:
+            indexes = kwargs['indexes']
+            if indexes and isinstance(indexes[0], N.ndarray):
+                # coordinate arrays (e.g. from N.where or _where)
+                # only read the rows that span the coordinates
+                first = indexes[0].min()
+                rows = indexes[0] - first
+                data = dataset[first:indexes[0].max()+1]
+                return data[(rows,) + tuple(indexes[1:])]
             index_strings = [ ]
             for indx in kwargs['indexes']:
                 if isinstance(indx, (tuple,list)):
@@ -433,6 +441,26 @@ class Hdf5DataWriterMixin:
 
         # new data goes into multi-dimensional slice
         if 'indexes' in kwargs:
+            indexes = kwargs['indexes']
+            if indexes and isinstance(indexes[0], N.ndarray):
+                # coordinate arrays (e.g. from N.where or _where) : update
+                # the rows that span the coordinates and write them back
+                if indexes[0].size > 0:
+                    first = indexes[0].min()
+                    last = indexes[0].max()
+                    data = dataset[first:last+1]
+                    coords = (indexes[0] - first,) + tuple(indexes[1:])
+                    try:
+                        data[coords] = numpy_array
+                    except (IndexError, ValueError):
+                        errmsg = 'Cannot insert %s array at %d coordinates'
+                        errmsg += ' in dataset of shape %s'
+                        raise IndexError, errmsg % (str(numpy_array.shape),
+                                    indexes[0].size, str(dataset.shape))
+                    dataset[first:last+1] = data
+                if attributes:
+                    self._setObjectAttributes_(dataset, attributes)
+                return dataset
             index_strings = [ ]
             for indx in kwargs['indexes']:
                 if isinstance(indx, (tuple,list)):
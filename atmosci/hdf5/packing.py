@@ -0,0 +1,328 @@
+""" Vectorized packing of grid data into compact storage types.
+
+Grid data that only needs a few decimal places of precision does not
+need to be stored as 64 bit floats. A dataset may declare one of the
+packing modes below, either in its configuration (the "packing" key) or
+in the "packing" attribute of an existing dataset :
+
+    float32 : data is stored as 32 bit floats, missing values are NaN
+    int16 : data is stored as 16 bit integers with a scale_factor and
+            an add_offset attribute, i.e.
+                data = (packed * scale_factor) + add_offset
+            missing values are stored as -32768
+
+File readers and managers find the packing mode of a dataset from its
+attributes and pack or unpack data automatically as it is written to or
+read from the file. Unpacked data is rounded to the dataset's precision,
+so readers get the same values they would from a 64 bit float dataset.
+"""
+
+import numpy as N
+
+from atmosci.hdf5.derived import DEFAULT_BLOCK_NODES
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+PACKING_DTYPES = { 'float32':N.dtype('<f4'), 'int16':N.dtype('<i2') }
+
+# value used for missing data in int16 datasets
+INT16_MISSING = -32768
+# range of valid packed int16 values (excludes INT16_MISSING)
+INT16_RANGE = (-32767, 32767)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def asPackingMode(mode):
+    if mode is None: return None
+    mode = str(mode).lower()
+    if mode in ('f4', '<f4', 'float32'): return 'float32'
+    if mode in ('i2', '<i2', 'int16'): return 'int16'
+    errmsg = '"%s" is not a supported packing mode. Use one of %s.'
+    raise ValueError, errmsg % (mode, str(tuple(sorted(PACKING_DTYPES))))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def packingAttributes(mode, precision=None, scale_factor=None,
+                      add_offset=None):
+    """ Returns the storage dtype and the dataset attributes required to
+    pack data using mode ('float32' or 'int16'). When scale_factor is not
+    passed, int16 datasets use a scale of 1/10**precision.
+    """
+    mode = asPackingMode(mode)
+    attrs = { 'packing':mode }
+    if precision is not None: attrs['precision'] = int(precision)
+    if mode == 'int16':
+        if scale_factor is None:
+            if precision is None:
+                errmsg = 'int16 packing requires a precision or scale_factor.'
+                raise ValueError, errmsg
+            scale_factor = 10. ** -int(precision)
+        attrs['scale_factor'] = float(scale_factor)
+        if add_offset is None: add_offset = 0.
+        attrs['add_offset'] = float(add_offset)
+        attrs['missing'] = INT16_MISSING
+    else: attrs['missing'] = N.nan
+    # readers that do not know about packing modes use this to find
+    # the missing value in unpacked data
+    attrs['unpack'] = '(float,N.nan)'
+    return PACKING_DTYPES[mode], attrs
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class DataPacking(object):
+    """ Packs and unpacks arrays of data for one dataset.
+
+    Arguments:
+    ---------
+        mode: packing mode, 'float32' or 'int16'
+        precision: number of decimal places in the unpacked data. When
+                   it is None, unpacked data is not rounded.
+        scale_factor: multiplier for int16 packed values. Default is
+                      1/10**precision.
+        add_offset: offset added to int16 packed values after scaling
+        dtype: dtype of unpacked data (default is float64)
+        name: name of the dataset, used in error messages
+    """
+
+    def __init__(self, mode, precision=None, scale_factor=None,
+                       add_offset=None, dtype=float, name=None):
+        self.packed_dtype, attrs = \
+            packingAttributes(mode, precision, scale_factor, add_offset)
+        self.mode = attrs['packing']
+        self.name = name
+        self.precision = attrs.get('precision', None)
+        self.scale_factor = attrs.get('scale_factor', None)
+        self.add_offset = attrs.get('add_offset', None)
+        self.packed_missing = attrs['missing']
+        self.dtype = N.dtype(dtype)
+
+    def __repr__(self):
+        return '<DataPacking %s precision=%s scale=%s offset=%s>' % (self.mode,
+                str(self.precision), str(self.scale_factor),
+                str(self.add_offset))
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @property
+    def attributes(self):
+        return packingAttributes(self.mode, self.precision, self.scale_factor,
+                                 self.add_offset)[1]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def fits(self, min_value, max_value):
+        """ Returns True when all values from min_value thru max_value
+        can be packed without leaving the range of the storage dtype.
+        """
+        if self.mode != 'int16': return True
+        packed = N.around((N.array([min_value, max_value], dtype=float)
+                           - (self.add_offset or 0.)) / self.scale_factor)
+        return packed[0] >= INT16_RANGE[0] and packed[1] <= INT16_RANGE[1]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def pack(self, data, missing=N.nan):
+        """ Returns data packed into the storage dtype. Nodes that are NaN
+        (or equal to missing) are set to the packed missing value. Data
+        that is already in the storage dtype is returned unchanged.
+
+        Raises ValueError when any int16 value is outside the range that
+        the scale_factor and add_offset can store.
+        """
+        if not isinstance(data, N.ndarray):
+            return self.pack(N.array(data), missing)[()]
+        if data.dtype == self.packed_dtype: return data
+
+        if self.mode == 'float32':
+            packed = data.astype(self.packed_dtype)
+            if not _isnan(missing):
+                N.putmask(packed, data == missing, N.nan)
+            return packed
+
+        work = N.array(data, dtype=float)
+        is_missing = N.isnan(work)
+        if not _isnan(missing): is_missing |= (work == missing)
+        errors = N.seterr(invalid='ignore')
+        try:
+            if self.add_offset: work -= self.add_offset
+            work /= self.scale_factor
+            N.around(work, out=work)
+            out_of_range = (work < INT16_RANGE[0]) | (work > INT16_RANGE[1])
+        finally:
+            N.seterr(**errors)
+        out_of_range &= ~is_missing
+        if out_of_range.any():
+            bad = N.array(data, dtype=float)[out_of_range]
+            if self.name is None: name = 'data'
+            else: name = '"%s" dataset' % self.name
+            errmsg = '%d values in %s (%s to %s) are outside the range that '
+            errmsg += 'int16 packing with scale_factor=%s and add_offset=%s '
+            errmsg += 'can store.'
+            raise ValueError, errmsg % (len(bad), name, str(bad.min()),
+                              str(bad.max()), str(self.scale_factor),
+                              str(self.add_offset))
+        N.putmask(work, is_missing, self.packed_missing)
+        return work.astype(self.packed_dtype)
+    # writers pass the missing value of the unpacked data to pack
+    pack.accepts_options = True
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def unpack(self, packed, **kwargs):
+        """ Returns packed data converted to the unpacked dtype. Missing
+        nodes are set to NaN.
+
+        Optional keyword arguments:
+        --------------------------
+            dtype: dtype for unpacked data (overrides default dtype)
+            missing: value for missing nodes (overrides NaN)
+        """
+        if not isinstance(packed, N.ndarray):
+            return self.unpack(N.array(packed, dtype=self.packed_dtype),
+                               **kwargs)[()]
+        dtype = N.dtype(kwargs.get('dtype', self.dtype))
+        missing = kwargs.get('missing', None)
+
+        # always unpack to a float array, convert to dtype at the end
+        if dtype.kind == 'f': data = N.empty(packed.shape, dtype=dtype)
+        else: data = N.empty(packed.shape, dtype=float)
+        if self.mode == 'float32':
+            data[...] = packed
+            if missing is not None and not _isnan(missing):
+                is_missing = N.isnan(data)
+            else: is_missing = None
+        else:
+            is_missing = N.equal(packed, self.packed_missing)
+            N.multiply(packed, self.scale_factor, out=data)
+            if self.add_offset: data += self.add_offset
+
+        if self.precision is not None:
+            N.around(data, self.precision, out=data)
+        if missing is None: missing = N.nan
+        if is_missing is not None: N.putmask(data, is_missing, missing)
+        if data.dtype != dtype: return data.astype(dtype)
+        return data
+    # readers pass their output options (i.e. dtype and missing) to unpack
+    unpack.accepts_options = True
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def datasetPacking(dataset):
+    """ Returns a DataPacking for an Hdf5 dataset when its attributes
+    declare a packing mode. Otherwise, returns None.
+    """
+    attrs = dataset.attrs
+    mode = attrs.get('packing', None)
+    if mode is None: return None
+    precision = attrs.get('precision', None)
+    if precision is not None: precision = int(precision)
+    scale_factor = attrs.get('scale_factor', None)
+    if scale_factor is not None: scale_factor = float(scale_factor)
+    add_offset = attrs.get('add_offset', None)
+    if add_offset is not None: add_offset = float(add_offset)
+    return DataPacking(mode, precision, scale_factor, add_offset,
+                       name=dataset.name)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def packingForRange(mode, min_value, max_value, precision=None,
+                    scale_factor=None, add_offset=None, name=None):
+    """ Returns a DataPacking that can store all values from min_value
+    thru max_value. When add_offset is None and the values do not fit
+    with an offset of 0, the offset is set to the middle of the range.
+    Raises ValueError when the range can not be stored.
+    """
+    packing = DataPacking(mode, precision, scale_factor, add_offset,
+                          name=name)
+    if min_value is None or packing.fits(min_value, max_value):
+        return packing
+    if add_offset is None:
+        scale = packing.scale_factor
+        add_offset = round((min_value + max_value) / (2. * scale)) * scale
+        packing = DataPacking(mode, precision, scale_factor, add_offset,
+                              name=name)
+        if packing.fits(min_value, max_value): return packing
+    if name is None: name = 'data'
+    else: name = '"%s" dataset' % name
+    errmsg = 'Range of %s (%s to %s) does not fit in int16 packing with '
+    errmsg += 'scale_factor=%s and add_offset=%s.'
+    raise ValueError, errmsg % (name, str(min_value), str(max_value),
+                      str(packing.scale_factor), str(packing.add_offset))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def datasetRange(source, missing=N.nan, max_nodes=DEFAULT_BLOCK_NODES):
+    """ Returns a tuple with the minimum and maximum of the values in the
+    source dataset that are not missing, reading one block of the first
+    axis at a time. Returns (None, None) when all values are missing.
+    """
+    min_value = max_value = None
+    if len(source.shape) == 0: blocks = [source[()],]
+    else:
+        nodes = max(int(N.prod(source.shape[1:])), 1)
+        size = max(max_nodes // nodes, 1)
+        blocks = (source[first:first+size]
+                  for first in range(0, source.shape[0], size))
+    for block in blocks:
+        block = N.array(block, dtype=float)
+        valid = ~N.isnan(block)
+        if not _isnan(missing): valid &= (block != missing)
+        if not valid.any(): continue
+        block = block[valid]
+        if min_value is None:
+            min_value, max_value = block.min(), block.max()
+        else:
+            min_value = min(min_value, block.min())
+            max_value = max(max_value, block.max())
+    return min_value, max_value
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def packDatasetInto(source, parent, name, packing, missing=N.nan,
+                    max_nodes=DEFAULT_BLOCK_NODES):
+    """ Creates a dataset called name in parent (an h5py file or group)
+    that contains the data in the source dataset packed with packing.
+    The new dataset has the same shape, chunks, compression filters and
+    attributes as source, plus the packing attributes. missing is the
+    value used for missing data in source. The data is packed one block
+    of chunks along the first axis at a time, so that memory use does not
+    depend on the size of the dataset.
+    """
+    create_args = { 'dtype':packing.packed_dtype,
+                    'fillvalue':packing.packed_missing }
+    for arg_name in ('chunks', 'compression', 'compression_opts',
+                     'shuffle', 'fletcher32'):
+        value = getattr(source, arg_name, None)
+        if value is not None: create_args[arg_name] = value
+    if source.maxshape != source.shape:
+        create_args['maxshape'] = source.maxshape
+
+    packed = parent.create_dataset(name, source.shape, **create_args)
+    for attr_name, attr_value in source.attrs.items():
+        packed.attrs[attr_name] = attr_value
+    for attr_name, attr_value in packing.attributes.items():
+        packed.attrs[attr_name] = attr_value
+    if 'multiplier' in packed.attrs: del packed.attrs['multiplier']
+
+    if len(source.shape) == 0:
+        packed[()] = packing.pack(source[()], missing)
+        return packed
+
+    nodes = max(int(N.prod(source.shape[1:])), 1)
+    size = max(max_nodes // nodes, 1)
+    if source.chunks is not None and size > source.chunks[0]:
+        size -= size % source.chunks[0]
+    for first in range(0, source.shape[0], size):
+        last = min(first + size, source.shape[0])
+        packed[first:last] = packing.pack(source[first:last], missing)
+    return packed
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _isnan(value):
+    try:
+        return N.isnan(value)
+    except TypeError:
+        return False
@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+
+import os, sys
+import posixpath
+
+import numpy as N
+
+from atmosci.hdf5.file import Hdf5FileReader, Hdf5FileManager
+from atmosci.hdf5.packing import datasetRange, packDatasetInto, \
+                                 packingForRange
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+from optparse import OptionParser
+usage = 'usage: %prog [options] hdf5_filepath dataset [dataset ...]'
+parser = OptionParser(usage=usage)
+parser.add_option('-i', action='store_true', dest='in_place', default=False,
+                  help='pack datasets in the existing file')
+parser.add_option('-m', action='store', dest='mode', default='int16',
+                  help='packing mode : int16 or float32')
+parser.add_option('-o', action='store', type='float', dest='add_offset',
+                  default=None, help='offset for int16 packing (default : '
+                  '0 or the middle of the range when the data needs it)')
+parser.add_option('-p', action='store', type='int', dest='precision',
+                  default=None, help='decimal places to keep (default : '
+                  'the dataset\'s precision attribute or 2)')
+parser.add_option('-s', action='store', type='float', dest='scale_factor',
+                  default=None, help='scale factor for int16 packing')
+parser.add_option('-x', action='store_true', dest='replace_existing',
+                  default=False)
+parser.add_option('--out', action='store', dest='out_filepath', default=None,
+                  help='path for the packed file')
+options, args = parser.parse_args()
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+if len(args) < 2:
+    parser.print_help()
+    exit(1)
+
+from_filepath = os.path.normpath(args[0])
+pack_datasets = tuple(args[1:])
+
+def datasetPrecision(dataset):
+    if options.precision is not None: return options.precision
+    return dataset.attrs.get('precision', 2)
+
+def datasetMissing(dataset):
+    missing = dataset.attrs.get('missing', N.nan)
+    if isinstance(missing, basestring):
+        try:
+            missing = float(missing)
+        except ValueError:
+            missing = N.nan
+    return missing
+
+def packingForDataset(name, dataset):
+    # refuse to pack a dataset whose values won't fit in the packed range
+    min_value, max_value = datasetRange(dataset, datasetMissing(dataset))
+    try:
+        packing = packingForRange(options.mode, min_value, max_value,
+                                  datasetPrecision(dataset),
+                                  options.scale_factor, options.add_offset,
+                                  name)
+    except ValueError as e:
+        print str(e)
+        print "Refusing to pack '%s' dataset." % name
+        exit(1)
+    if options.add_offset is None and packing.add_offset:
+        info = (str(packing.add_offset), name)
+        print "using add_offset=%s to fit '%s' dataset" % info
+    return packing
+
+def checkDatasets(reader):
+    # check all of the datasets before any of them are packed
+    packings = { }
+    for name in pack_datasets:
+        if name not in reader.dataset_names:
+            print "'%s' dataset is not in %s" % (name, from_filepath)
+            exit(1)
+        dataset = reader.getDataset(name)
+        if 'packing' in dataset.attrs or dataset.dtype.kind != 'f':
+            print "'%s' dataset is already packed as %s" % (name,
+                  dataset.attrs.get('packing', str(dataset.dtype)))
+            exit(1)
+        packings[name] = packingForDataset(name, dataset)
+    return packings
+
+reader = Hdf5FileReader(from_filepath)
+packings = checkDatasets(reader)
+
+# in place packing can't reclaim space used by the original datasets
+if options.in_place:
+    reader.close()
+    manager = Hdf5FileManager(from_filepath, 'a')
+    for name in pack_datasets:
+        packing = packings[name]
+        print "packing '%s' dataset as %s" % (name, options.mode)
+        manager.packDataset(name, options.mode, packing.precision,
+                            packing.scale_factor, packing.add_offset)
+    manager.close()
+    exit(0)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+to_filepath = options.out_filepath
+if to_filepath is None:
+    to_filepath = from_filepath.replace('.h5','-packed.h5')
+to_filepath = os.path.normpath(to_filepath)
+
+if os.path.exists(to_filepath):
+    if options.replace_existing:
+        os.remove(to_filepath)
+    else:
+        print to_filepath, 'already exists.'
+        exit(1)
+
+msg = "Packing datasets from '%s'\ninto new file at '%s'"
+print msg % (from_filepath, to_filepath)
+
+manager = Hdf5FileManager(to_filepath, 'a')
+manager.setFileAttributes(**dict(reader.getFileAttributes()))
+
+for name in reader.group_names:
+    group = reader.getGroup(name)
+    new_group = manager.file.require_group(group.name)
+    for attr_name, attr_value in group.attrs.items():
+        new_group.attrs[attr_name] = attr_value
+
+for name in reader.dataset_names:
+    dataset = reader.getDataset(name)
+    parent = manager.file.require_group(posixpath.dirname(dataset.name))
+    if name in pack_datasets:
+        print "packing '%s' dataset as %s" % (name, options.mode)
+        packDatasetInto(dataset, parent, posixpath.basename(dataset.name),
+                        packings[name], datasetMissing(dataset))
+    else:
+        print "copying '%s' dataset" % name
+        reader.file.copy(dataset.name, parent)
+
+manager.close()
+reader.close()
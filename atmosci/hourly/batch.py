@@ -0,0 +1,345 @@
+""" Write-combining batch for updates to hourly grid files.
+
+Update scripts typically make a series of separate manager calls for
+each slice of data (insert the data, insert provenance, then update the
+time attributes of both datasets), each one re-reading attributes and
+often bracketed by an open and close of the file. An HourlyGridUpdateBatch
+queues all of that work in memory and applies it with a single open of
+the file when flush() is called :
+
+    * data slices for the same dataset that are adjacent in time (or
+      overlap) are merged into one contiguous hyperslab write, later
+      slices replacing earlier ones where they overlap
+    * provenance records are generated with a single timestamp and
+      written as one record array per contiguous run of hours
+    * validation time updates for each dataset/source are coalesced
+      into a single call covering the full timespan of the batch
+    * explicit attribute changes are applied once, last value wins
+
+All data passed to a batch must be time first (the 'tyx' or 'txy' view
+used by hourly grid files). A 2D array is a single hour.
+"""
+
+import datetime
+ONE_HOUR = datetime.timedelta(hours=1)
+
+from collections import OrderedDict
+
+import numpy as N
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+FORECAST_SOURCES = ('fcast', 'forecast', 'ndfd')
+WRITABLE_MODES = ('a', 'r+', 'w')
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class HourlyGridUpdateBatch(object):
+    """ Queues updates to an hourly grid file and writes them all at
+    once. Works with any manager derived from HourlyGridFileManager,
+    including the NDFD and reanalysis grid file managers.
+
+    Arguments
+    --------------------------------------------------------------------
+    manager : HourlyGridFileManager (or subclass) instance. It may be
+              open or closed. If it is not open for writing, the file
+              is opened in 'a' mode for the flush and closed afterwards.
+
+    Keyword Arguments
+    --------------------------------------------------------------------
+    provenance_path : default provenance dataset for update()
+    """
+
+    def __init__(self, manager, **kwargs):
+        self.manager = manager
+        self.provenance_path = kwargs.get('provenance_path', 'provenance')
+        self.clear()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def __len__(self):
+        return sum([len(pieces) for pieces in self.slices.values()]) \
+             + sum([len(pieces) for pieces in self.provenance.values()]) \
+             + len(self.attributes) + len(self.validation)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def clear(self):
+        """ Discards all queued updates.
+        """
+        self.attributes = OrderedDict() # (path, name) : (is_time, value)
+        self.optional = set() # paths that may be missing from the file
+        self.provenance = OrderedDict() # prov_path : [(start, data, source, required)]
+        self.slices = OrderedDict() # dataset_path : [(start, data)]
+        self.validation = OrderedDict() # (path, source) : [start, end]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def flush(self, **kwargs):
+        """ Writes all queued updates to the file and clears the queue.
+        Returns a dictionary with the number of items that were queued
+        and the number of writes that were needed for each type.
+        """
+        stats = { 'slices':0, 'data_writes':0, 'prov_records':0,
+                  'prov_writes':0, 'validations':len(self.validation),
+                  'attributes':len(self.attributes) }
+        if len(self) == 0: return stats
+
+        manager = self.manager
+        opened_here = False
+        if not manager.isOpen() or manager.filemode not in WRITABLE_MODES:
+            manager.close()
+            manager.open('a')
+            opened_here = True
+
+        try:
+            timestamp = kwargs.get('timestamp', manager.timestamp)
+            for dataset_path, pieces in self.slices.items():
+                stats['slices'] += len(pieces)
+                stats['data_writes'] += self._flushSlices(dataset_path, pieces)
+            for prov_path, pieces in self.provenance.items():
+                num_records, num_writes = \
+                    self._flushProvenance(prov_path, pieces, timestamp)
+                stats['prov_records'] += num_records
+                stats['prov_writes'] += num_writes
+            self._flushValidation()
+            self._flushAttributes()
+        finally:
+            if opened_here: manager.close()
+            elif manager.isOpen(): manager.file.flush()
+
+        self.clear()
+        return stats
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def insertData(self, dataset_path, start_time, data, process=False):
+        """ Queues a time slice of data to be inserted into a dataset.
+        When process is True, the manager's input processor for the
+        dataset (if any) is applied to the data when the batch is
+        flushed. Returns a reference to the queued slice that
+        may be passed to insertProvenance in place of the data.
+        """
+        piece = [start_time, data, process]
+        pieces = self.slices.get(dataset_path, None)
+        if pieces is None: self.slices[dataset_path] = [piece,]
+        else: pieces.append(piece)
+        return (dataset_path, len(self.slices[dataset_path]) - 1)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def insertProvenance(self, prov_path, start_time, data, source=None,
+                               required=True):
+        """ Queues provenance for a time slice of data. Records are
+        generated when the batch is flushed. Data may be an array or a
+        reference returned by insertData, in which case the provenance
+        is generated from the data as it was written. When required is
+        False, the provenance is silently skipped if the file does not
+        have a prov_path dataset.
+        """
+        piece = (start_time, data, source, required)
+        pieces = self.provenance.get(prov_path, None)
+        if pieces is None: self.provenance[prov_path] = [piece,]
+        else: pieces.append(piece)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def processData(self, dataset_path, data):
+        if hasattr(self.manager, 'inputProcessor'):
+            processor = self.manager.inputProcessor(dataset_path)
+            if processor is not None: return processor(data)
+        return data
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def setAttribute(self, path, attr_name, value):
+        self.attributes[(path, attr_name)] = (False, value)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def setTimeAttribute(self, path, attr_name, hour):
+        self.attributes[(path, attr_name)] = (True, hour)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def setValidationTime(self, path, start_time, end_time, source):
+        """ Queues an update to the validation time attributes of a
+        dataset. Multiple updates for the same dataset and source are
+        coalesced into one update covering the combined timespan.
+        """
+        key = (path, source)
+        timespan = self.validation.get(key, None)
+        if timespan is None:
+            self.validation[key] = [start_time, end_time]
+        else:
+            timespan[0] = min(timespan[0], start_time)
+            timespan[1] = max(timespan[1], end_time)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def update(self, dataset_path, start_time, data, source=None, **kwargs):
+        """ Queues everything needed for a complete update of a dataset
+        from a time slice of data : the data, its provenance (when the
+        file has a provenance dataset) and validation times for both.
+        Data is passed thru the manager's input processor unless the
+        process keyword argument is False.
+
+        Source is passed to the provenance generator. Validation times
+        are updated for the source unless a different one is passed in
+        the validation keyword argument. It may be 'forecast' (or 'fcast',
+        'ndfd') for forecast data, another data source name (e.g. 'urma',
+        'rtma') for observed or analysis data, or None to skip validation
+        time updates.
+        """
+        end_time = start_time + (self._numHours(data) - 1) * ONE_HOUR
+        data_ref = self.insertData(dataset_path, start_time, data,
+                                   kwargs.get('process', True))
+
+        prov_path = kwargs.get('provenance_path', self.provenance_path)
+        if prov_path is not None and kwargs.get('update_provenance', True):
+            self.insertProvenance(prov_path, start_time, data_ref, source,
+                                  False)
+            self.optional.add(prov_path)
+        else: prov_path = None
+
+        validation = kwargs.get('validation', source)
+        if validation is not None:
+            self.setValidationTime(dataset_path, start_time, end_time,
+                                   validation)
+            if prov_path is not None:
+                self.setValidationTime(prov_path, start_time, end_time,
+                                       validation)
+
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _flushAttributes(self):
+        manager = self.manager
+        for (path, attr_name), (is_time, value) in self.attributes.items():
+            if is_time: manager.setTimeAttribute(path, attr_name, value)
+            else: manager.setObjectAttribute(path, attr_name, value)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _flushProvenance(self, prov_path, pieces, timestamp):
+        manager = self.manager
+        if not manager.hasDataset(prov_path):
+            if any([piece[3] for piece in pieces]):
+                errmsg = 'File does not have a "%s" provenance dataset.'
+                raise KeyError, errmsg % prov_path
+            return 0, 0
+
+        # later records replace earlier records for the same hour
+        records = { }
+        for start_time, data, source, required in pieces:
+            if isinstance(data, tuple): # reference to a queued slice
+                dataset_path, index = data
+                data = self.slices[dataset_path][index][1]
+            if source is None:
+                start_hour, end_hour, prov_records = \
+                    manager.generateProvenanceRecords(prov_path, start_time,
+                                                data, timestamp=timestamp)
+            else:
+                start_hour, end_hour, prov_records = \
+                    manager.generateProvenanceRecords(prov_path, start_time,
+                                  data, source=source, timestamp=timestamp)
+            index = manager.indexForHour(prov_path, start_hour)
+            for record in prov_records:
+                records[index] = record
+                index += 1
+
+        dataset = manager.getDataset(prov_path)
+        num_writes = 0
+        for start_index, end_index in self._contiguousRuns(records.keys()):
+            run = [records[index] for index in range(start_index, end_index)]
+            dataset[start_index:end_index] = \
+                N.rec.fromrecords(run, dtype=dataset.dtype)
+            num_writes += 1
+        dataset.attrs['updated'] = timestamp
+
+        return len(records), num_writes
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _flushSlices(self, dataset_path, pieces):
+        manager = self.manager
+        view = manager.datasetAttribute(dataset_path, 'view', 'tyx')
+
+        indexed = [ ]
+        for piece in pieces:
+            start_time, data, process = piece
+            if process:
+                data = piece[1] = self.processData(dataset_path, data)
+                piece[2] = False
+            index = manager.indexForTime(dataset_path, start_time)
+            indexed.append((index, index + self._numHours(data), data))
+
+        if not view.startswith('t'):
+            # merging assumes time first, write each slice separately
+            for start_index, end_index, data in indexed:
+                manager._insertTimeSlice(dataset_path, data, start_index)
+            return len(indexed)
+
+        # group slices into runs of adjacent or overlapping hours
+        order = sorted(range(len(indexed)), key=lambda i: indexed[i][0])
+        groups = [[order[0],],]
+        group_end = indexed[order[0]][1]
+        for i in order[1:]:
+            if indexed[i][0] <= group_end:
+                groups[-1].append(i)
+                group_end = max(group_end, indexed[i][1])
+            else:
+                groups.append([i,])
+                group_end = indexed[i][1]
+
+        for group in groups:
+            if len(group) == 1:
+                start_index, end_index, data = indexed[group[0]]
+            else:
+                start_index = min([indexed[i][0] for i in group])
+                end_index = max([indexed[i][1] for i in group])
+                first = indexed[group[0]][2]
+                dtype = N.result_type(*[indexed[i][2] for i in group])
+                data = N.empty((end_index-start_index,) + first.shape[-2:],
+                               dtype=dtype)
+                # apply in the order queued so later slices win overlaps
+                for i in sorted(group):
+                    slice_start, slice_end, slice_data = indexed[i]
+                    data[slice_start-start_index:slice_end-start_index] = \
+                        slice_data
+            manager._insertTimeSlice(dataset_path, data, start_index)
+
+        return len(groups)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _flushValidation(self):
+        manager = self.manager
+        for (path, source), (start_time, end_time) in self.validation.items():
+            if path in self.optional and not manager.hasDataset(path):
+                continue
+            if source in FORECAST_SOURCES:
+                manager.setForecastTimes(path, start_time, end_time)
+            else:
+                manager.setValidationTime(path, start_time, end_time, source)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _contiguousRuns(self, indexes):
+        indexes = sorted(indexes)
+        runs = [ ]
+        if not indexes: return runs
+        run_start = prev = indexes[0]
+        for index in indexes[1:]:
+            if index != prev + 1:
+                runs.append((run_start, prev+1))
+                run_start = index
+            prev = index
+        runs.append((run_start, prev+1))
+        return runs
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _numHours(self, data):
+        if data.ndim == 2: return 1
+        return data.shape[0]
+
@@ -450,3 +450,4 @@ class HourlyGridFileBuilder(HourlyGridBuilderMethods, HourlyGridFileManager):
             if hasattr(self, '_loadProvenanceGenerators_'):
                 self._loadProvenanceGenerators_()
             self.time_attr_cache = { }
+            self.time_axis_cache = { }
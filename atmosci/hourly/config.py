@@ -27,6 +27,22 @@ CONFIG.datasets.timegrid = { 'chunk_type':('time','gzip'),
 CONFIG.datasets.timegrid.copy('timeaccum', CONFIG.datasets)
 CONFIG.datasets.timeaccum.provenance = 'timeaccum'
 
+# same as timegrid, but stored as float32 rounded to a declared precision
+CONFIG.datasets.timegrid.copy('timegrid32', CONFIG.datasets)
+CONFIG.datasets.timegrid32.dtype_packed = '<f4'
+CONFIG.datasets.timegrid32.packing = 'float32'
+CONFIG.datasets.timegrid32.precision = 2
+
+# same as timegrid, but stored as int16 scaled to a declared precision
+# i.e. +/- 327.67 around add_offset for 2 decimals. Datasets with larger
+# values (e.g. temperatures in K) need an add_offset in their config.
+CONFIG.datasets.timegrid.copy('timegrid16', CONFIG.datasets)
+CONFIG.datasets.timegrid16.add_offset = 0.
+CONFIG.datasets.timegrid16.dtype_packed = '<i2'
+CONFIG.datasets.timegrid16.missing_packed = -32768
+CONFIG.datasets.timegrid16.packing = 'int16'
+CONFIG.datasets.timegrid16.precision = 2
+
 CONFIG.datasets.timegrid.copy('test', CONFIG.datasets)
 CONFIG.datasets.test.description = 'A test dataset.'
 CONFIG.datasets.test.tag = 'testdata'
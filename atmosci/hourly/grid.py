@@ -20,6 +20,8 @@ from atmosci.seasonal.methods.grid import GridFileReaderMethods, \
 
 from atmosci.seasonal.methods.provenance import ProvenanceManagerMethods
 
+from atmosci.hourly.batch import HourlyGridUpdateBatch
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -411,7 +413,7 @@ class HourlyGridFileManagerMethods(HourlyGridFileReaderMethods,
         if last_obs_time is None or hour > last_obs_time:
             self.setTimeAttribute(dataset_path, 'last_obs_time', hour,
                                   **kwargs)
-            self.setLastValidDate(dataset_path, hour, 'unknown')
+            self.setLastValidTime(dataset_path, hour, 'unknown')
             # make adjustments when obs hour stomps on forecast
             self.adjustForecast(dataset_path, hour, **kwargs)
 
@@ -455,7 +457,8 @@ class HourlyGridFileManagerMethods(HourlyGridFileReaderMethods,
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def setValidationTime(self, path, start_time, end_time, source):
+    def setValidationTime(self, path, start_time, end_time, source,
+                                **kwargs):
         # dataset period must be 'hour'
         period = self.getDatasetAttribute(path, 'period', None)
         if period != 'hour': return
@@ -468,6 +471,14 @@ class HourlyGridFileManagerMethods(HourlyGridFileReaderMethods,
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def updateBatch(self, **kwargs):
+        """ Returns an HourlyGridUpdateBatch that queues updates to this
+        file and writes them all at once when it is flushed.
+        """
+        return HourlyGridUpdateBatch(self, **kwargs)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def updateDataset(self, dataset_path, start_time, data, **kwargs):
         time_index = self.indexForTime(dataset_path, start_time, **kwargs)
         num_hours = \
@@ -0,0 +1,112 @@
+""" Input processors applied to each slice of data before it is written
+to an hourly grid file.
+
+All processors have the same signature :
+
+    processor(data, out=None, precision=2, dtype=None)
+
+and do their work with in-place ufuncs and boolean masks so that no
+temporary arrays the size of the input are created beyond the output
+array itself. When out is None, a single output array is allocated
+(in dtype when passed, otherwise in the dtype of data). Pass out=data
+to process an array in place.
+
+Precision is the number of decimal places that values are rounded to.
+It matters most when data is stored as float32, where it should not
+exceed the number of significant digits float32 can represent for the
+range of the data (e.g. 2 decimals for temperatures in K).
+"""
+
+import numpy as N
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def outputArray(data, out=None, dtype=None):
+    """ Returns the array that a processor should work in : out itself
+    when it is data, out with a copy of data when it is another array,
+    or a new array (in dtype if passed) initialized with data.
+    """
+    if out is None:
+        if dtype is None:
+            dtype = data.dtype if data.dtype.kind == 'f' else float
+        return N.array(data, dtype=dtype)
+    if out is not data: out[...] = data
+    return out
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def roundInPlace(data, precision):
+    if precision is not None:
+        N.around(data, precision, out=data)
+    return data
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def storageParameters(manager, dataset_path, default_precision=2):
+    """ Returns the precision and storage dtype for a dataset. Precision
+    is taken from the dataset's "precision" attribute when present. The
+    dtype is only returned for floating point datasets.
+    """
+    dataset = manager.getDataset(dataset_path)
+    precision = dataset.attrs.get('precision', default_precision)
+    if dataset.dtype.kind == 'f': dtype = dataset.dtype
+    else: dtype = None
+    return precision, dtype
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# processors
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def processPcpn(data, out=None, precision=2, dtype=None):
+    """ Precipitation : values < 0.01 (trace amounts) are set to 0.
+    NaN are preserved.
+    """
+    out = outputArray(data, out, dtype)
+    errors = N.seterr(invalid='ignore')
+    try:
+        trace = N.less(out, 0.01)
+    finally:
+        N.seterr(**errors)
+    N.putmask(out, trace, 0.)
+    return roundInPlace(out, precision)
+processPcpn.storage_aware = True
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def processRhum(data, out=None, precision=2, dtype=None):
+    """ Relative humidity : rounded and constrained to 0 - 100 percent.
+    NaN are preserved.
+    """
+    out = roundInPlace(outputArray(data, out, dtype), precision)
+    errors = N.seterr(invalid='ignore')
+    try:
+        N.clip(out, 0., 100., out=out)
+    finally:
+        N.seterr(**errors)
+    return out
+processRhum.storage_aware = True
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def processTemp(data, out=None, precision=2, dtype=None):
+    """ Temperature (and dew point) : rounded to precision.
+    """
+    return roundInPlace(outputArray(data, out, dtype), precision)
+processTemp.storage_aware = True
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def storageProcessor(manager, dataset_path, processor):
+    """ Returns a processor function for a dataset. Storage aware
+    processors are bound to the dataset's precision and storage dtype
+    and take (data, out=None) arguments. Any other processor is
+    returned unchanged.
+    """
+    if not getattr(processor, 'storage_aware', False): return processor
+    precision, dtype = storageParameters(manager, dataset_path)
+    def process(data, out=None):
+        return processor(data, out, precision, dtype)
+    return process
+
@@ -16,6 +16,7 @@ from BaseHTTPServer import BaseHTTPRequestHandler
 
 from atmosci.utils import tzutils
 from atmosci.utils.config import ConfigObject
+from atmosci.utils.dirindex import DirectoryIndex
 from atmosci.utils.timeutils import lastDayOfMonth
 
 from atmosci.seasonal.methods.access  import BasicFileAccessorMethods
@@ -213,18 +214,14 @@ class NdfdGribFactoryMethods:
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def lastAvailableForecast(self, variable, period, region, prev_days=10):
-        last_available_fcast = None
         fcast_date = datetime.date.today()
-        min_fcast_date = fcast_date - datetime.timedelta(days=prev_days)
-
-        # look for the last available file in the month
-        while fcast_date > min_fcast_date:
+        filename = self.ndfdGribFilename(variable, period, region)
+        # each day's directory is listed at most once, newest first
+        for day in range(prev_days):
             dirpath = self.ndfdDownloadDir(fcast_date, region, False)
-            if os.path.exists(dirpath):
-                filename = self.ndfdGribFilename(variable, period, region)
-                filepath = os.path.join(dirpath, filename)
-                # first file found is last file available
-                if os.path.exists(filepath): return fcast_date
+            # first file found is last file available
+            if filename in self.grib_dir_index.filenames(dirpath):
+                return fcast_date
             fcast_date -= ONE_DAY
 
         # no forecast data available for current season
@@ -338,6 +335,8 @@ class NdfdGribFactoryMethods:
                                         self.ndfd.grib.timezone))
         self.download_attempts = self.project.downloads.attempts
         self.wait_times = self.project.downloads.wait_times
+        # cached directory listings for grib file availability queries
+        self.grib_dir_index = DirectoryIndex(kwargs.get('dir_index_age', 30.))
 
         self.AccessRegistrars.ndfd_grib = { 'iter': _registerNdfdGribIterator,
                                             'read': _registerNdfdGribReader }
@@ -424,6 +423,7 @@ class NdfdGribFileFactory(NdfdGribFactoryMethods, NDFDFactoryMethods, object):
                     file_obj = open(local_filepath,'wb')
                     file_obj.write(response.read())
                     file_obj.close()
+                    self.grib_dir_index.refresh(os.path.dirname(local_filepath))
                     if debug: path = local_filepath
                     else: path = local_filename
                     return 200, path, url, 'Data was saved to file'
@@ -17,6 +17,8 @@ from atmosci.utils import tzutils
 
 from atmosci.hourly.grid import HourlyGridFileReader, HourlyGridFileManager
 from atmosci.hourly.builder import HourlyGridBuilderMethods
+from atmosci.hourly.processors import processPcpn, processRhum, \
+                                      processTemp, storageProcessor
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -33,7 +35,9 @@ class NdfdGridFileManagerMethods:
     def inputProcessor(self, dataset_path):
         if '.' in dataset_path: key = dataset_path.split('.')[-1]
         else: key = dataset_path
-        return self.processors.get(key.upper(), None)
+        processor = self.processors.get(key.upper(), None)
+        if processor is None: return None
+        return storageProcessor(self, dataset_path, processor)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -163,24 +167,11 @@ class NdfdGridFileManagerMethods:
     def _initDataProcessors_(self, **kwargs):
         # special processing rules for datasets
         self.processors = ConfigObject('processors', None)
-        # humidity data input processor
-        def processRhum(data):
-            rhum = N.around(data, 2)
-            rhum[N.where(rhum > 100)] = 100.
-            rhum[N.where(rhum < 0)] = 0.
-            return rhum
+        # input processors for humidity, temperature and precipitation
+        # are bound to each dataset's precision and storage dtype
         self.processors.RHUM = processRhum
-
-        # temperature data input processor
-        def processTemp(data):
-            return N.around(data, 2)
         self.processors.DPT = processTemp
         self.processors.TMP = processTemp
-
-        # precip data input processor
-        def processPcpn(data):
-            data[N.where(data < 0.01)] = 0.
-            return N.around(data, 2)
         self.processors.PCPN = processPcpn
 
         processors = kwargs.get('processors', None)
@@ -234,6 +225,7 @@ class NdfdGridFileBuilder(HourlyGridBuilderMethods, NdfdGridFileManager):
             self.load_manager_attrs = False
         else: self.load_manager_attrs = True
         self.time_attr_cache = { }
+        self.time_axis_cache = { }
 
         NdfdGridFileManager.__init__(self, hdf5_filepath, mode)
         # set the time span for this file
@@ -13,13 +13,16 @@
 import os, sys
 import warnings
 
+import time
 import datetime
 ONE_DAY = datetime.timedelta(days=1)
+ONE_HOUR = datetime.timedelta(hours=1)
 UPDATE_START_TIME = datetime.datetime.now()
 
 import numpy as N
 
 from atmosci.utils import tzutils
+from atmosci.utils.pipeline import StageTimer, WriterPool, orderedMap
 from atmosci.utils.timeutils import elapsedTime, nextMonth, lastDayOfMonth
 from atmosci.utils.units import convertUnits
 
@@ -73,39 +76,121 @@ def gridManager(grid_factory, manager_date, grid_dataset, region):
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-def updateForecast(grid_factory, grid_dataset, grib_variable, data, units,
-                   region, verbose):
-    # start and end times for data in forecast
-    fcast_start = data[0][1]
-    filepath = grid_factory.ndfdGridFilepath(fcast_start.date(), grid_dataset, region)
-    if not os.path.exists(filepath):
-        grid_factory.buildForecastGridFile(fcast_start.date(), grid_dataset, region=region)
-
-    if len(data) > 1:
-        fcast_end = data[-1][1]
-        if fcast_end.month != fcast_start.month:
-            filepath = grid_factory.ndfdGridFilepath(fcast_end.date(), grid_dataset, region)
-            if not os.path.exists(filepath):
-                grid_factory.buildForecastGridFile(fcast_end.date(), grid_dataset, region=region)
-    else: fcast_end = fcast_start
-
-    manager_date = fcast_start.date()
-    manager = gridManager(grid_factory, manager_date, grid_dataset, region)
-    if debug: print'\nUpdating grid file :\n    ', manager.filepath
-
-    for source, fcast_time, grid in data:
-        manager.open('a')
-        if fcast_time.month != manager_date.month:
-            manager.close()
-            manager_date = fcast_time.date()
-            manager = gridManager(grid_factory, manager_date, grid_dataset, region)
-            if debug: print'\nUpdating grid file :\n    ', manager.filepath
+# grib readers created by decodeForecast, one per decode context
+DECODE_READERS = { }
+
+def decodeReader(context):
+    """ Returns the grib reader and the region/source configs for a
+    decode context. They are created from the context the first time
+    it is seen in each process, so decode workers never rely on state
+    inherited from the main process.
+    """
+    reader_args = DECODE_READERS.get(context, None)
+    if reader_args is None:
+        dev_mode, grib_region_key, grid_region_key, grid_source_key = \
+            context[:4]
+        reader = SmartNdfdGribFileReader()
+        if dev_mode: reader.useDirpathsForMode('dev')
+        grid_factory = NdfdGridFileFactory()
+        reader_args = (reader, reader.regionConfig(grib_region_key),
+                       grid_factory.regionConfig(grid_region_key),
+                       grid_factory.sourceConfig(grid_source_key))
+        DECODE_READERS[context] = reader_args
+    return reader_args
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def decodeForecast(args):
+    """ Decode stage : reads, reshapes and gap fills the grids for one
+    (grib variable, timespan, date) job. args is a tuple of (decode
+    context, job) where the context is a tuple of (dev mode, grib region
+    key, grid region key, grid source key, fill gaps, graceful fail,
+    debug). Runs in the decode pool, so it returns any error instead of
+    raising it.
+    """
+    context, job = args
+    grib_variable, timespan, target_date = job
+    fill_gaps, graceful_fail, debug = context[4:]
+    started = time.time()
+    try:
+        reader, grib_region, grid_region, grid_source = decodeReader(context)
+        units, data = reader.dataForRegion(target_date, grib_variable,
+                             timespan, grib_region, grid_region, grid_source,
+                             fill_gaps, graceful_fail, debug)
+    except ValueError as e:
+        return job, None, [ ], ('ValueError', str(e)), time.time() - started
+    except Exception as e:
+        return job, None, [ ], ('Exception', str(e)), time.time() - started
+    return job, units, data, None, time.time() - started
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class ForecastFileWriter(object):
+    """ Write stage : the only object that writes to a forecast grid file.
+    Updates are collected in a write-combining batch while there are more
+    waiting in the queue and the batch is flushed (with a single open of
+    the file) whenever the queue is drained.
+    """
+
+    def __init__(self, filepath):
+        self.batch = None
+        self.filepath = filepath
+        self.manager = None
+
+    def close(self):
+        self.idle()
+
+    def idle(self):
+        if self.batch is not None and len(self.batch) > 0:
+            stats = self.batch.flush()
+            if debug:
+                info = (self.filepath, stats['slices'], stats['data_writes'])
+                print 'Flushed %s : %d slices in %d writes' % info
+        if self.manager is not None: self.manager.close()
+
+    def write(self, item):
+        grid_dataset, fcast_time, grid, source = item
+        if self.manager is None:
+            self.manager = gridManager(grid_factory, fcast_time.date(),
+                                       grid_dataset, grid_region)
+            self.batch = self.manager.updateBatch()
+            if debug: print '\nUpdating grid file :\n    ', self.filepath
         if verbose:
-            print '    inserting :', fcast_time, source, N.nanmin(grid), N.nanmax(grid)
-        manager.updateForecast(grid_dataset, fcast_time, grid, source=source)
-        manager.close()
+            info = (fcast_time, source, N.nanmin(grid), N.nanmax(grid))
+            print '    inserting :', '%s %s %s %s' % info
+        self.batch.update(grid_dataset, fcast_time, grid, source,
+                          validation='forecast')
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-    return fcast_start, fcast_time
+def queueForecast(writers, grid_dataset, data):
+    """ Splits the decoded forecast into runs of consecutive hours from
+    the same source that go to the same grid file. Each run is queued as
+    a single 3D update to the writer for that file.
+    """
+    def queueRun(run):
+        source, fcast_time, grid = run[0]
+        if len(run) > 1: grid = N.array([record[2] for record in run])
+        filepath = grid_factory.ndfdGridFilepath(fcast_time.date(),
+                                                 grid_dataset, grid_region)
+        grid_files[filepath] = grid_dataset
+        writers.put(filepath, (grid_dataset, fcast_time, grid, source))
+
+    run = [data[0],]
+    for record in data[1:]:
+        prev_source, prev_time, prev_grid = run[-1]
+        source, fcast_time, grid = record
+        if source == prev_source and fcast_time.month == prev_time.month \
+        and fcast_time - prev_time == ONE_HOUR:
+            run.append(record)
+        else:
+            queueRun(run)
+            run = [record,]
+    queueRun(run)
+
+    return data[0][1], data[-1][1]
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -127,6 +212,8 @@ default = "TD,TEMP,RHM,QPF,POP12"
 parser.add_option('-g', action='store', dest='grib_variables', default=default,
         help='List of grib variables to be updated (default="%s")' % default)
 parser.add_option('-p', action='store', type=int, dest='prev_days', default=10)
+parser.add_option('-q', action='store', type=int, dest='queue_depth', default=4,
+        help='Maximum number of updates waiting to be written to each grid file')
 parser.add_option('-r', action='store', dest='grid_region',
                         default=CONFIG.sources.ndfd.grid.region)
 parser.add_option('-s', action='store', dest='grid_source',
@@ -135,6 +222,8 @@ parser.add_option('-s', action='store', dest='grid_source',
 parser.add_option('-d', action='store_true', dest='dev_mode', default=False)
 parser.add_option('-u', action='store_false', dest='utc_file', default=True)
 parser.add_option('-v', action='store_true', dest='verbose', default=False)
+parser.add_option('-w', action='store', type=int, dest='workers', default=1,
+        help='Number of grib decode processes (default=1, decode serially)')
 parser.add_option('-z', action='store_true', dest='debug', default=False)
 
 parser.add_option('--fileltz', action='store', dest='file_timezone',
@@ -162,9 +251,11 @@ grid_region_key = options.grid_region
 grid_source_key = options.grid_source
 local_timezone = options.local_timezone
 prev_days = options.prev_days
+queue_depth = options.queue_depth
 TODAY = datetime.date.today()
 utc_file = options.utc_file
 verbose = options.verbose or debug
+workers = options.workers
 
 if utc_file: file_timezone = 'UTC'
 else: file_timezone = local_timezone
@@ -227,9 +318,13 @@ grid_source = grid_factory.sourceConfig(grid_source_key)
 variables_requested = grib_variables
 variables_processed = []
 
-for grib_variable in grib_variables:
-    VARIABLE_START_TIME = datetime.datetime.now()
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# plan the update for each variable
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+update_plans = [ ]
 
+for grib_variable in grib_variables:
     if grib_variable == 'QPF': timespans = ('001-003',)
     else: timespans = ('001-003','004-007')
 
@@ -246,17 +341,17 @@ for grib_variable in grib_variables:
         filepath = grid_factory.ndfdGridFilepath(TODAY, grid_dataset, grid_region)
         if os.path.exists(filepath):
             reader = grid_factory.ndfdGridFileReader(TODAY, grid_dataset, grid_region)
-            last_update = reader.lastUpdate(grid_dataset, None).date()
+            last_update = reader.lastUpdate(grid_dataset, None)
             reader.close()
-            if last_update is not None:
-                update_start = last_update
+            if last_update not in (None, 'never'):
+                update_start = last_update.date()
             else: # in case TODAY is early in a new month
                 prev_month, last_update = checkPreviousMonth(TODAY, grid_dataset, grid_region)
                 if last_update is not None:
                     update_start = last_update
                 else:
                     if prev_month is not None:
-                        info (grid_dataset, prev_month.replace(day=1))
+                        info = (grid_dataset, prev_month.replace(day=1))
                         print 'No previous %s forecast update since at least %s' % info
                     else:
                         print 'No previous %s forecast update yet this year' % grid_dataset
@@ -265,7 +360,7 @@ for grib_variable in grib_variables:
 
         else:
             grid_factory.buildForecastGridFile(TODAY, grid_dataset, region=grid_region)
-            update_start = datetme.date(TODAY.year, TODAY.month, 1)
+            update_start = datetime.date(TODAY.year, TODAY.month, 1)
 
         if update_end < update_start:
             info = (grib_variable, update_start.strftime('%Y-%m-%d'), update_end.strftime('%Y-%m-%d'))
@@ -285,87 +380,119 @@ for grib_variable in grib_variables:
         if not os.path.exists(filepath):
             grid_factory.buildForecastGridFile(update_end, grid_dataset, region=grid_region)
 
-    min_fcast_time = tzutils.asUTCTime(datetime.datetime(2099,12,31,23))
-    max_fcast_time = tzutils.asUTCTime(datetime.datetime(1900,1,1,0))
-
-    manager = None
-    prev_date_filepath = None
-
     if debug:
         print 'Processing %s files for :' % grib_variable
         print '    update start :', update_start
         print '      update end :', update_end
 
+    update_plans.append((grib_variable, grid_dataset, timespans,
+                         update_start, update_end))
 
-    # filter annoying numpy warnings
-    warnings.filterwarnings('ignore',"All-NaN axis encountered")
-    warnings.filterwarnings('ignore',"All-NaN slice encountered")
-    warnings.filterwarnings('ignore',"invalid value encountered in greater")
-    warnings.filterwarnings('ignore',"invalid value encountered in less")
-    warnings.filterwarnings('ignore',"Mean of empty slice")
-    # MUST ALSO TURN OFF WARNING FILTERS AT END OF SCRIPT !!!!!
-
-
-    num_updates = 0
-    target_date = update_start
-    while target_date <= update_end:
-        if debug:
-            print '\ntarget date :', target_date
-
-        for timespan in timespans:
-            # get all hours that in latest forecast for this date
-            try:
-                units, data = smart_grib.dataForRegion(target_date, grib_variable, timespan, grib_region,
-                                         grid_region, grid_source, fill_gaps, graceful_fail, debug)
-            except ValueError as e:
-                info = (grib_variable, str(target_date))
-                reason = str(e)
-                if reason == 'file not found':
-                    continue
-                else:
-                    print 'Error reading %s forecast for %s' % info
-                    print reason
-                    checkFileValidity(smart_grib, target_date, grib_variable, timespan, grib_region)
-                    continue
 
-            except Exception as e:
-                info = (grib_variable, str(target_date))
-                print 'Error reading %s forecast for %s' % info
-                print str(e)
-                continue
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# decode/write pipeline
+#
+# jobs are ordered by date so that all variables progress together and
+# the updates to each grid file are always queued in forecast order
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-            if len(data) > 0:
-                fcast_start, fcast_end = \
-                    updateForecast(grid_factory, grid_dataset, grib_variable, data, units, grid_region, verbose)
-                num_updates += 1
+# everything the decode workers need is passed to them with each job
+decode_context = (dev_mode, grib_region_key, grid_region_key, grid_source_key,
+                  fill_gaps, graceful_fail, debug)
+
+jobs = [ ]
+if update_plans:
+    target_date = min([plan[3] for plan in update_plans])
+    last_date = max([plan[4] for plan in update_plans])
+    while target_date <= last_date:
+        for grib_variable, grid_dataset, timespans, update_start, update_end \
+        in update_plans:
+            if update_start <= target_date <= update_end:
+                for timespan in timespans:
+                    jobs.append((decode_context,
+                                 (grib_variable, timespan, target_date)))
+        target_date += ONE_DAY
 
-                max_fcast_time = max(max_fcast_time, fcast_end)
-                min_fcast_time = min(min_fcast_time, fcast_start)
+datasets = dict([(plan[0], plan[1]) for plan in update_plans])
+grid_files = { } # grid file path -> grid dataset
+num_updates = dict([(plan[0], 0) for plan in update_plans])
+
+# filter annoying numpy warnings (set before the decode pool is started)
+warnings.filterwarnings('ignore',"All-NaN axis encountered")
+warnings.filterwarnings('ignore',"All-NaN slice encountered")
+warnings.filterwarnings('ignore',"invalid value encountered in greater")
+warnings.filterwarnings('ignore',"invalid value encountered in less")
+warnings.filterwarnings('ignore',"Mean of empty slice")
+# MUST ALSO TURN OFF WARNING FILTERS AT END OF SCRIPT !!!!!
+
+timer = StageTimer()
+writers = WriterPool(ForecastFileWriter, queue_depth, timer)
+PIPELINE_START_TIME = datetime.datetime.now()
+
+for job, units, data, error, decode_secs in \
+    orderedMap(decodeForecast, jobs, workers, timer):
+    grib_variable, timespan, target_date = job
+    timer.add('decode', decode_secs)
+    if debug: print '\n%s %s target date : %s' % job
+
+    if error is not None:
+        error_type, reason = error
+        if error_type == 'ValueError' and reason == 'file not found':
+            continue
+        info = (grib_variable, str(target_date))
+        print 'Error reading %s forecast for %s' % info
+        print reason
+        if error_type == 'ValueError':
+            checkFileValidity(smart_grib, target_date, grib_variable, timespan, grib_region)
+        continue
+
+    if len(data) > 0:
+        started = timer.start()
+        fcast_start, fcast_end = \
+            queueForecast(writers, datasets[grib_variable], data)
+        timer.stop('queue', started)
+        num_updates[grib_variable] += 1
+
+        if fcast_end > fcast_start:
+            info = (grib_variable, timespan, fcast_start.strftime('%Y-%m-%d'),
+                    fcast_end.strftime('%Y-%m-%d'))
+            print 'Queued %s data for %s timespan from %s thru %s' % info
+        else:
+            info = (grib_variable, timespan, fcast_start.strftime('%Y-%m-%d'))
+            print '    queued %s data for %s timespan on %s' % info
+    else:
+        info = (grib_variable, timespan, str(target_date))
+        print '%s DATA NOT AVAILABLE FOR %s TIMESPAN ON %s' % info
 
-                if fcast_end > fcast_start:
-                    info = (grib_variable, timespan, fcast_start.strftime('%Y-%m-%d'),
-                            fcast_end.strftime('%Y-%m-%d'))
-                    print 'Updated %s data for %s timespan from %s thru %s' % info
-                else:
-                    info = (grib_variable, timespan, fcast_start.strftime('%Y-%m-%d'))
-                    print '    updated %s data for %s timespan on %s' % info
-            else:
-                info = (grib_variable, timespan, str(target_date))
-                print '%s DATA NOT AVAILABLE FOR %s TIMESPAN ON %s' % info
-     
-        target_date += ONE_DAY
+write_errors = writers.finish()
 
-    # turn annoying numpy warnings back on
-    warnings.resetwarnings()
+# turn annoying numpy warnings back on
+warnings.resetwarnings()
 
+for filepath, errors in write_errors.items():
+    print 'Error writing %s :' % filepath
+    for error in errors: print '   ', str(error)
 
+failed_datasets = set([grid_files[filepath] for filepath in write_errors])
+for grib_variable, grid_dataset, timespans, update_start, update_end \
+in update_plans:
+    if grid_dataset in failed_datasets: continue
     variables_processed.append(grid_dataset)
-    if num_updates > 0:
-        elapsed_time = elapsedTime(VARIABLE_START_TIME, True)
-        msg = 'Completed %s updates in %s'
-        print msg % (grib_variable, elapsed_time)
+    if num_updates[grib_variable] > 0:
+        msg = 'Completed %d %s updates'
+        print msg % (num_updates[grib_variable], grib_variable)
     else: print '%s forecast is already up to date.' % grib_variable
-    print ' '  # dummy space between reports for each variable
+
+# report stage timings and queue depths
+if jobs:
+    info = (len(jobs), workers, elapsedTime(PIPELINE_START_TIME, True))
+    print '\nPipeline processed %d decode jobs with %d workers in %s' % info
+    print 'Stage timings :'
+    for line in timer.report(): print line
+    if writers.writers:
+        print 'Writer queues :'
+        for line in writers.depthReport(): print line
+print ' '
 
 # summarize total time spent in updates
 elapsed_time = elapsedTime(UPDATE_START_TIME, True)
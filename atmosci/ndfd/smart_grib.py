@@ -14,6 +14,7 @@ ONE_HOUR = datetime.timedelta(hours=1)
 import numpy as N
 import pygrib
 
+from atmosci.utils import timeaxis
 from atmosci.utils.tzutils import asUTCTime
 
 from atmosci.ndfd.factory import NdfdGribFileFactory
@@ -152,6 +153,55 @@ GridFillMethods = {
     'spread': spreadFill,
 }
 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# in-place versions of the fill methods. grid is a 3D (hours, y, x) buffer,
+# base is the index of the forecast at the start of the gap and end is the
+# index of the next forecast (or the end of the extrapolated span). Hours
+# between base and end are filled in place. Each returns True when the
+# forecast at base was also changed.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def fillAverageInPlace(grid, base, end, varconfig, decimals=2):
+    N.around(grid[base] / (end - base), decimals, out=grid[base])
+    grid[base+1:end] = grid[base]
+    return True
+
+def fillConstantInPlace(grid, base, end, varconfig, decimals=2):
+    grid[base+1:end] = varconfig.fill_value
+    return False
+
+def fillCopyInPlace(grid, base, end, varconfig, decimals=2):
+    grid[base+1:end] = grid[base]
+    return False
+
+def scaledFillInPlace(grid, base, end, varconfig, decimals=2):
+    gap = end - base
+    increment = N.around((grid[end] - grid[base]) / gap, decimals)
+    steps = N.arange(1, gap, dtype=grid.dtype).reshape((gap-1, 1, 1))
+    N.multiply(steps, increment, out=grid[base+1:end])
+    grid[base+1:end] += grid[base]
+    return False
+
+def spreadFillInPlace(grid, base, end, varconfig, decimals=2):
+    zeros = grid[base] < 0.01
+    N.around(grid[base] / (end - base), decimals, out=grid[base])
+    grid[base][zeros] = 0
+    grid[base+1:end] = grid[base]
+    return True
+
+#  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+# fill method : (in-place function, can extrapolate past last forecast)
+InPlaceFillMethods = {
+    'avg': (fillAverageInPlace, False),
+    'constant': (fillConstantInPlace, True),
+    'copy': (fillCopyInPlace, True),
+    'scaled': (scaledFillInPlace, False),
+    'spread': (spreadFillInPlace, True),
+}
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def hoursInTimespan(time1, time2, inclusive=True):
@@ -170,6 +220,23 @@ def reshapeGrid(grib_msg, missing_value, grib_indexes, grid_shape_2D,
     values[N.where(grid_mask == True)] = N.nan
     return N.around(values,decimals)
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def decodeInto(grib_msg, missing_value, grib_indexes, grid_mask, out,
+               decimals=2):
+    """ Same as reshapeGrid, but decodes the message directly into an
+    existing 2D array (e.g. one hour of a 3D buffer).
+    """
+    values = grib_msg.values[grib_indexes]
+    if N.ma.is_masked(values): values = values.data
+    values = values.reshape(out.shape)
+    # find missing values before rounding can change the sentinel
+    missing = values >= missing_value
+    missing |= (grid_mask == True)
+    N.around(values, decimals, out=out)
+    out[missing] = N.nan
+    return out
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -210,7 +277,6 @@ class SmartNdfdGribFileReader(NdfdGribFileFactory):
 
         # code for filling gaps between records
         if fill_gaps and fill_method is not None:
-            prev_record = None
             if debug:
                 info = (timespan, variable, str(fcast_date))
                 print '\nReading %s %s grib file for %s' % info
@@ -222,25 +288,11 @@ class SmartNdfdGribFileReader(NdfdGribFileFactory):
             missing = float(first_msg.missingValue)
             units = first_msg.units
 
-            # fill the gap between this timespan and the previous one
-            if not prev_record is None:
-                grid = reshapeGrid(first_msg, missing, grib_indexes,
-                                   grid_shape_2D, grid_mask)
-                next_record = ('ndfd',asUTCTime(first_msg.validDate),grid)
-                data_records.extend(self.fillTimeGap(prev_record,
-                                         next_record, varconfig))
-
             # update with records for the current timespan
             data = self.dataWithoutGaps(messages, varconfig, grib_indexes,
                                         grid_shape_2D, grid_mask, debug)
             data_records.extend(data)
 
-            # track last record in previous timespan
-            msg = messages[-1]
-            grid = reshapeGrid(msg, missing, grib_indexes, grid_shape_2D,
-                               grid_mask)
-            prev_record = ('ndfd', asUTCTime(msg.validDate), grid)
-
             self.closeGribfile()
         
         # code that preserves gaps between records
@@ -256,13 +308,14 @@ class SmartNdfdGribFileReader(NdfdGribFileFactory):
             missing = float(first_msg.missingValue)
             units = first_msg.units
 
-            for msg in messages:
-                grid = reshapeGrid(msg, missing, grib_indexes,
-                                   grid_shape_2D, grid_mask)
+            first_hour, offsets, grid = \
+                self.decodeMessages(messages, grib_indexes, grid_shape_2D,
+                                    grid_mask)
+            for msg, indx in zip(messages, offsets):
                 this_time =  asUTCTime(msg.validDate)
-                data_records.append(('ndfd', this_time, grid))
+                data_records.append(('ndfd', this_time, grid[indx]))
                 if debug:
-                    stats = (N.nanmin(grid), N.nanmax(grid))
+                    stats = (N.nanmin(grid[indx]), N.nanmax(grid[indx]))
                     print 'value stats :', msg.validDate, stats
             self.closeGribfile()
 
@@ -272,48 +325,16 @@ class SmartNdfdGribFileReader(NdfdGribFileFactory):
 
     def dataWithoutGaps(self, messages, varconfig, grib_indexes,
                               grid_shape_2D, grid_mask, debug=False):
-        data_records = [ ]
-
-        first_msg = messages[0]
-        missing = float(first_msg.missingValue)
-
-        prev_grid = reshapeGrid(first_msg, missing, grib_indexes,
-                                grid_shape_2D, grid_mask)
-        prev_time = asUTCTime(first_msg.validDate)
-        prev_record = ('ndfd', prev_time, prev_grid)
-        if debug:
-            print 'processing %d grib messages :' % len(messages)
-            stats = (N.nanmin(prev_grid), N.nanmax(prev_grid))
-            print '    stats :', first_msg.validDate, stats
-
-        open_gap = False
-        for msg in messages[1:]:
-            grid = reshapeGrid(msg, missing, grib_indexes, grid_shape_2D,
-                               grid_mask)
-            this_time =  asUTCTime(msg.validDate)
-            this_record = ('ndfd', this_time, grid)
-            if debug:
-                stats = (N.nanmin(grid), N.nanmax(grid))
-                print '    stats :', msg.validDate, stats
-
-            gap = hoursInTimespan(prev_time, this_time, inclusive=False)
-            if gap > 1:
-                records = \
-                    self.fillTimeGap(prev_record, this_record, varconfig)
-                # add the gap records
-                data_records.extend(records)
-            else: # no gap, add previous record
-                data_records.append(prev_record)
-
-            prev_record = this_record
-            prev_time = this_time
-
-        # at this point prev_record == last this_record
-        records = self.fillTimeGap(prev_record, None, varconfig)
-        if len(records) > 0: data_records.extend(records)
-        else: data_records.append(prev_record)
-
-        return data_records
+        first_hour, sources, grid = \
+            self.gridWithoutGaps(messages, varconfig, grib_indexes,
+                                 grid_shape_2D, grid_mask, debug)
+        # records reference hours in the 3D grid, nothing is copied
+        last_hour = first_hour + datetime.timedelta(hours=grid.shape[0]-1)
+        hours = timeaxis.hourRange(first_hour, last_hour)
+        return [(source, fcast_time, grid[indx])
+                for indx, (source, fcast_time)
+                in enumerate(zip(sources, timeaxis.asDatetimes(hours)))
+                if source is not None]
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -356,23 +377,94 @@ class SmartNdfdGribFileReader(NdfdGribFileFactory):
         Assumes file contains a range of time periods for a single variable.
         """
         varconfig = self.variableConfig(variable, timespan)
+        grid_shape_2D, grib_indexes, grid_mask = \
+            self.gribToGridParameters(grid_source, grid_region)
+
+        self.openGribFile(fcast_date, variable, timespan, grib_region)
+        messages = self.gribs.select()
+        if fill_gaps and varconfig.get('fill_method',None) is not None:
+            first_hour, sources, grid = \
+                self.gridWithoutGaps(messages, varconfig, grib_indexes,
+                                     grid_shape_2D, grid_mask, debug)
+        else:
+            first_hour, offsets, grid = \
+                self.decodeMessages(messages, grib_indexes, grid_shape_2D,
+                                    grid_mask)
+        self.closeGribfile()
+
+        return first_hour, varconfig.units, grid
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def gridWithoutGaps(self, messages, varconfig, grib_indexes,
+                              grid_shape_2D, grid_mask, debug=False):
+        """
+        Decodes all messages into a single 3D (hours, y, x) grid that
+        covers the full hourly time axis of the forecast, then fills the
+        gaps between forecast hours in place using the variable's fill
+        method.
 
-        records = self.dataForRegion(fcast_date, variable, timespans,
-                       grib_region, grid_region, grid_source, fill_gaps,
-                       graceful_fail, debug)
+        Returns a tuple containing the first hour (UTC datetime), a list
+        with the source of the data at each hour and the 3D grid.
+        """
+        fill_method = varconfig.fill_method
+        fill, extrapolate = InPlaceFillMethods[fill_method]
+        span = varconfig.get('span', 1)
+        if isinstance(span, tuple): span = span[-1]
+
+        first_hour, offsets, grid = \
+            self.decodeMessages(messages, grib_indexes, grid_shape_2D,
+                                grid_mask, extra_hours=span-1)
+        if debug:
+            print 'processing %d grib messages :' % len(messages)
+
+        sources = [None] * grid.shape[0]
+        filled_source = 'ndfd %s' % fill_method
+        for indx, base in enumerate(offsets):
+            sources[base] = 'ndfd'
+            if indx < len(offsets) - 1: end = offsets[indx+1]
+            elif extrapolate: end = base + span
+            else: break
+            if end - base > 1 or (indx == len(offsets)-1):
+                if fill(grid, base, end, varconfig):
+                    sources[base] = filled_source
+                for hour in range(base+1, end): sources[hour] = filled_source
+
+        # drop extra hours that were not needed
+        last = max([indx for indx, source in enumerate(sources)
+                    if source is not None])
+        if last < grid.shape[0] - 1:
+            grid = grid[:last+1]
+            sources = sources[:last+1]
+
+        return first_hour, sources, grid
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-        first_hour = records[0][1]
-        last_hour = records[-1][1]
-        num_hours = hoursInTimespan(last_hour, first_hour, inclusive=True)
+    def decodeMessages(self, messages, grib_indexes, grid_shape_2D,
+                             grid_mask, extra_hours=0):
+        """
+        Decodes each message directly into its hour in a single 3D
+        (hours, y, x) grid. Hours without a message are N.nan.
+
+        Returns a tuple containing the first hour (UTC datetime), an
+        array with the index of each message's hour in the grid and the
+        3D grid.
+        """
+        missing = float(messages[0].missingValue)
+        hours = N.array([timeaxis.asHour64(msg.validDate, 'UTC')
+                         for msg in messages])
+        offsets = ((hours - hours[0]) / timeaxis.ONE_HOUR).astype(int)
 
-        grid_shape_2d = records[0][-1].shape
-        grid = N.empty((num_hours,)+grid_shape_2D, dtype=float)
+        num_hours = offsets[-1] + 1 + extra_hours
+        grid = N.empty((num_hours,)+tuple(grid_shape_2D), dtype=float)
         grid.fill(N.nan)
 
-        for index, record in enumerate(records):
-            grid[index,:,:] = record[-1]
-        
-        return first_hour, varconfig.units, grid
+        for msg, indx in zip(messages, offsets):
+            decodeInto(msg, missing, grib_indexes, grid_mask, grid[indx])
+
+        first_hour = asUTCTime(messages[0].validDate)
+        return first_hour, offsets, grid
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -10,12 +10,11 @@
 import os
 import datetime
 ONE_HOUR = datetime.timedelta(hours=1)
-import warnings
-
-import numpy as N
 
 from atmosci.utils import tzutils
-from atmosci.utils.timeutils import lastDayOfMonth, nextMonth
+from atmosci.utils.timeutils import nextMonth
+
+from atmosci.hdf5.hourgrid import MonthlyGridFileView, monthlyTimeSlices
 
 from atmosci.ndfd.factory import NdfdGridFileFactory
 
@@ -51,66 +50,39 @@ class SmartNdfdDataMethods:
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def slices(self, slice_start_time, slice_end_time):
-
-        slices = [ ]
         start_time = tzutils.tzaDatetime(slice_start_time, 'UTC')
         end_time = tzutils.tzaDatetime(slice_end_time, 'UTC')
-
-        if start_time.month == end_time.month:
-            slices.append((start_time, end_time))
-        else:
-            last_day = lastDayOfMonth(start_time)
-            month_end = start_time.replace(day=last_day, hour=23)
-            slices.append((start_time, month_end))
-            
-            month = start_time.month + 1
-            while month < end_time.month:
-                month_start = start_time.replace(month=month, day=1, hour=0)
-                last_day = lastDayOfMonth(month_start)
-                month_end = month_start.replace(day=last_day, hour=23)
-                slices.append((month_start, month_end))
-            
-            slices.append((end_time.replace(day=1, hour=0), end_time))
-
-        return tuple(slices)
+        return monthlyTimeSlices(start_time, end_time)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def timeSlice(self, variable, slice_start_time, slice_end_time, **kwargs):
+    def timeSeriesView(self, variable, **kwargs):
+        """ Returns a MonthlyGridFileView that presents the variable's
+        monthly forecast files as a single continuous hourly time series.
+        The caller is responsible for closing the view.
+        """
         region = kwargs.get('region', self.region)
+        def readerForMonth(hour):
+            return self.ndfdGridFileReader(hour, variable, region, **kwargs)
+        return MonthlyGridFileView(readerForMonth, variable,
+                                   self.grid_dimensions, 'UTC')
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-        # find
-        time_slices = self.slices(slice_start_time, slice_end_time)
-
-        # filter annoying numpy warnings
-        warnings.filterwarnings('ignore',"All-NaN axis encountered")
-        warnings.filterwarnings('ignore',"All-NaN slice encountered")
-        warnings.filterwarnings('ignore',"invalid value encountered in greater")
-        warnings.filterwarnings('ignore',"invalid value encountered in less")
-        warnings.filterwarnings('ignore',"Mean of empty slice")
-        # MUST ALSO TURN OFF WARNING FILTERS AT END OF SCRIPT !!!!!
-
-        data_slices = [ ]
-        for first_hour, last_hour in time_slices:
-            reader = \
-                self.ndfdGridFileReader(first_hour, variable, region, **kwargs)
-            data = \
-                reader.timeSlice(variable, first_hour, last_hour, **kwargs)
-            units = reader.datasetAttribute(variable, 'units')
-            prev_indx = eindx
-            data_slices.append((units,first_hour,data))
-
-        # turn annoying numpy warnings back on
-        warnings.resetwarnings()
+    def timeSlice(self, variable, slice_start_time, slice_end_time, **kwargs):
+        view = self.timeSeriesView(variable, **kwargs)
+        data = view.timeSlice(slice_start_time, slice_end_time, **kwargs)
 
+        reader = view.reader(tzutils.tzaDatetime(slice_start_time, 'UTC'))
+        units = kwargs.get('units', reader.datasetAttribute(variable, 'units'))
         if kwargs.get('lonlat', False):
             lats = reader.lats
             lons = reader.lons
-            reader.close()
-            return lons, lats, data_slices
+            view.close()
+            return lons, lats, units, data
         else:
-            reader.close()
-            return data_slices
+            view.close()
+            return units, data
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -5,7 +5,8 @@ ONE_HOUR = datetime.timedelta(hours=1)
 
 import numpy as N
 
-from atmosci.utils import tzutils
+from atmosci.utils import timeaxis, tzutils
+from atmosci.utils.dirindex import DirectoryIndex
 from atmosci.utils.timeutils import lastDayOfMonth
 
 from atmosci.seasonal.methods.access  import BasicFileAccessorMethods
@@ -250,6 +251,39 @@ class ReanalysisGribFactoryMethods:
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+    def gribFilepaths(self, hours, variable, region, **kwargs):
+        """ Bulk version of gribFilepath for an array of UTC datetime64
+        hours (see atmosci.utils.timeaxis). Paths are formatted directly
+        from the templates, directories are never created and existence
+        of the files is not checked.
+        """
+        root_dir = self.config.dirpaths[self.reanalysis.grib.root_dir]
+        subdir = self.gribSubdirTemplate()
+        if subdir is not None: root_dir = os.path.join(root_dir, subdir)
+        if isinstance(region, basestring): region_name = region
+        else: region_name = region.name
+
+        times = timeaxis.timeStrings(hours)
+        dir_times = dict(times)
+        # same as utcTimes, the directory time is the date by default
+        if not kwargs.get('use_time_in_path', False):
+            dir_times['utc_time'] = times['utc_date']
+        dirpaths = timeaxis.formatTimeStrings(root_dir, dir_times,
+                                analysis=self.anal_config.name,
+                                region=region_name,
+                                source=self.grib_source.name)
+
+        template = self.gribFilenameTemplate(variable)
+        file_args = { 'analysis':self.analysis_type, 'region':region,
+                      'source':self.grib_source.name, 'variable':variable }
+        file_args.update(kwargs)
+        filenames = timeaxis.formatTimeStrings(template, times, **file_args)
+
+        return [os.path.join(dirpath, filename)
+                for dirpath, filename in zip(dirpaths, filenames)]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
     def gribFileReader(self, target_hour, variable, region, **kwargs):
         filepath = self.gribFilepath(target_hour, variable, region, **kwargs)
         Class = self.fileAccessorClass('grib', 'read')
@@ -297,6 +331,8 @@ class ReanalysisGribFactoryMethods:
     def _initReanalysisGribFactory_(self, **kwargs):
         self.grib_region = \
              kwargs.get('grib_region', self.reanalysis.grib.region)
+        # cached directory listings for grib file availability queries
+        self.grib_dir_index = DirectoryIndex(kwargs.get('dir_index_age', 30.))
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -412,6 +448,7 @@ class ReanalysisGridFactoryMethods:
         print '\nBuilt "%s" reanalysis grid file :' % variable
         print '    ', builder.filepath
         builder.close()
+        return builder
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -10,6 +10,8 @@ from atmosci.utils import tzutils
 from atmosci.hourly.grid import HourlyGridFileReader, \
                                 HourlyGridFileManager
 from atmosci.hourly.builder import HourlyGridBuilderMethods
+from atmosci.hourly.processors import processPcpn, processRhum, \
+                                      processTemp, storageProcessor
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -58,7 +60,9 @@ class ReanalysisGridFileManagerMethods:
     def inputProcessor(self, dataset_path):
         if '.' in dataset_path: key = dataset_path.split('.')[-1]
         else: key = dataset_path
-        return self.processors.get(key.upper(), None)
+        processor = self.processors.get(key.upper(), None)
+        if processor is None: return None
+        return storageProcessor(self, dataset_path, processor)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -132,7 +136,8 @@ class ReanalysisGridFileManagerMethods:
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def setValidationTime(self, dataset_path, start_time, end_time, source):
+    def setValidationTime(self, dataset_path, start_time, end_time, source,
+                                **kwargs):
         # dataset period must be 'hour'
         period = self.getDatasetAttribute(dataset_path, 'period', None)
 
@@ -305,29 +310,11 @@ class ReanalysisGridFileManagerMethods:
     def _initDataProcessors_(self, **kwargs):
         # special processing rules for datasets
         self.processors = ConfigObject('processors', None)
-        # humidity data input processor
-        def processRhum(data):
-            rhum = N.around(data, 2)
-            rhum[N.where(rhum > 100)] = 100.
-            rhum[N.where(rhum < 0)] = 0.
-            return rhum
+        # input processors for humidity, temperature and precipitation
+        # are bound to each dataset's precision and storage dtype
         self.processors.RHUM = processRhum
-
-        # temperature data input processor
-        def processTemp(data):
-            return N.around(data, 2)
         self.processors.DPT = processTemp
         self.processors.TMP = processTemp
-
-        # precip data input processor
-        def processPcpn(data):
-            nans = N.where(N.isnan(data))
-            if len(nans[0]) > 0:
-                data[nans] = 0.
-                data[N.where(data < 0.01)] = 0.
-                data[nans] = N.nan
-            else: data[N.where(data < 0.01)] = 0.
-            return N.around(data, 2)
         self.processors.PCPN = processPcpn
 
         processors = kwargs.get('processors', None)
@@ -451,4 +438,5 @@ class ReanalysisGridFileBuilder(HourlyGridBuilderMethods,
             ReanalysisGridFileManager._loadManagerAttributes_(self)
         else:
             self.time_attr_cache = { }
+            self.time_axis_cache = { }
 
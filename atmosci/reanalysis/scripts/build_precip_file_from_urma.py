@@ -98,6 +98,8 @@ parser.add_option('--localtz', action='store', dest='local_timezone',
                                default='US/Eastern')
 parser.add_option('--obs_days', action='store', type=int, dest='obs_days',
                                 default=10)
+parser.add_option('--static', action='store_true', dest='link_static',
+                              default=False)
 parser.add_option('--target', action='store', type=int, dest='target_hour',
                               default=7)
 
@@ -111,6 +113,7 @@ fcast_days = options.fcast_days
 grib_region = options.grib_region
 grib_timezone = options.grib_timezone
 grib_var_name = options.grib_var_name
+link_static = options.link_static
 local_timezone = options.local_timezone
 obs_days = options.obs_days
 region_key = options.region
@@ -165,6 +168,7 @@ reader = grib_factory.staticFileReader(static_source, region)
 lats = reader.getData('lat')
 lons = reader.getData('lon')
 grid_shape, grib_indexes = reader.gribSourceIndexes('ndfd')
+static_filepath = reader.filepath
 reader.close()
 del reader
 
@@ -174,7 +178,9 @@ builder = grid_factory.gridFileBuilder(file_var_name, region_key,
                                use_time_in_path=use_time_in_path)
 print '\nbuilding grid file :', builder.filepath
 
-builder.build(lons=lons, lats=lats)
+if link_static:
+    builder.build(kwarg_dict={'static_file':static_filepath})
+else: builder.build(lons=lons, lats=lats)
 del lats, lons
 
 builder.open('r')
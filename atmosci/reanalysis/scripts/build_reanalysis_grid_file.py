@@ -4,11 +4,53 @@ import os, sys
 import datetime
 
 from atmosci.reanalysis.factory import ReanalysisGridFileFactory
+from atmosci.utils.pipeline import BuildOrchestrator, serviceSlot
+from atmosci.utils.timeutils import elapsedTime
+
+BUILD_START_TIME = datetime.datetime.now()
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 from atmosci.reanalysis.config import CONFIG
 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def buildGridFile(job):
+    """ Builds the grid file for one (project, source, region, month,
+    variable) job. Runs in the orchestrator's process pool.
+    """
+    project_name, grid_source, grid_region, month, grib_var_name = job
+    reference_date = datetime.date(*[int(num) for num in month.split('-')])
+
+    timespan = factory.fileTimespan(reference_date, **kwargs)
+    if verbose:
+        grid_start_time, reference_time, grid_end_time, num_hours = timespan
+        print ' grid file timespan in %s timeszone :' % file_timezone
+        print '    start hour :', grid_start_time
+        print '      ref hour :', reference_time
+        print '      end hour :', grid_end_time
+        print '     num hours :', num_hours
+        print '     file date :', reference_time.date()
+    else:
+        reference_time = timespan[1]
+
+    # build grid file
+    info = (grib_var_name, reference_time.strftime('%B, %Y'))
+    print '\nBuilding "%s" grid file for %s' % info
+    with serviceSlot('hdf5'):
+        manager = factory.buildReanalysisGridFile(reference_time,
+                          grib_var_name, grid_region, file_timezone,
+                          grid_source)
+
+    if debug:
+        manager.open('r')
+        time_attrs = manager.timeAttributes(grib_var_name)
+        manager.close()
+        print '\ngrid file time attrs :\n', time_attrs
+
+    print '\nCompleted build for "%s" grid file.' % grib_var_name
+
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 from optparse import OptionParser
@@ -21,18 +63,24 @@ parser.add_option('-r', action='store', dest='grid_region',
 parser.add_option('-s', action='store', dest='grid_source',
                         default=CONFIG.sources.reanalysis.grid.source)
 
+parser.add_option('-c', action='store', dest='checkpoint', default=None,
+        help='Checkpoint file. Jobs completed in a previous run are skipped.')
 parser.add_option('-d', action='store_true', dest='dev_mode', default=False)
 parser.add_option('-n', action='store_true', dest='next_month', default=False)
 parser.add_option('-t', action='store_true', dest='use_time_in_path',
                         default=False)
 parser.add_option('-u', action='store_false', dest='utc_file', default=True)
 parser.add_option('-v', action='store_true', dest='verbose', default=False)
+parser.add_option('-w', action='store', type=int, dest='workers', default=1,
+        help='Number of files to build at the same time')
 parser.add_option('-z', action='store_true', dest='debug', default=False)
 
 parser.add_option('--grib_region', action='store', dest='grib_region',
                         default=CONFIG.sources.reanalysis.grib.region)
 parser.add_option('--grib_source', action='store', dest='grib_source',
                         default=CONFIG.sources.reanalysis.grib.source)
+parser.add_option('--hdf5', action='store', type=int, dest='hdf5_limit',
+        default=None, help='Maximum number of concurrent HDF5 writers')
 parser.add_option('--gribtz', action='store', dest='grib_timezone',
                         default=CONFIG.sources.reanalysis.grib.timezone)
 parser.add_option('--localtz', action='store', dest='local_timezone',
@@ -63,25 +111,26 @@ verbose = options.verbose or debug
 if utc_file: file_timezone = 'UTC'
 else: file_timezone = local_timezone
 
-grib_var_name = args[0].upper()
+grib_var_names = [name.upper() for name in args[0].split(',')]
 
 num_date_args = len(args) - 1
 if num_date_args == 0:
     if next_month:
-        reference_date = datetime.date(today.year, today.month+1, 1)
-    else: reference_date = datetime.date(today.year, today.month, 1)
+        reference_dates = [datetime.date(today.year, today.month+1, 1),]
+    else: reference_dates = [datetime.date(today.year, today.month, 1),]
 elif num_date_args == 1:
-    reference_date =  datetime.date(today.year, int(args[1]), 1)
-elif num_date_args > 1:
-    reference_date =  datetime.date(int(args[1]), int(args[2]), 1)
-else:
-    errmsg = 'No arguments passed to script. You must at least specify'
-    raise RuntimeError, '%s the grib variable name.' % errmsg
+    reference_dates =  [datetime.date(today.year, int(args[1]), 1),]
+elif num_date_args == 2:
+    reference_dates =  [datetime.date(int(args[1]), int(args[2]), 1),]
+else: # year, first month, last month
+    year = int(args[1])
+    reference_dates = [datetime.date(year, month, 1)
+                       for month in range(int(args[2]), int(args[3])+1)]
 
 if verbose:
     print 'requesting ...'
-    print '    variable :', grib_var_name
-    print '    ref date :', reference_date
+    print '   variables :', ','.join(grib_var_names)
+    print '   ref dates :', ','.join([str(date) for date in reference_dates])
     print '    timezone :', file_timezone
 
 # create a factory for access to grid files
@@ -92,29 +141,23 @@ if dev_mode: factory.useDirpathsForMode('dev')
 kwargs = { 'timezone':file_timezone, }
 if target_hour is not None: kwargs['target_hour'] = target_hour
 
-timespan = factory.fileTimespan(reference_date, **kwargs)
-if verbose:
-    grid_start_time, reference_time, grid_end_time, num_hours = timespan
-    print ' grid file timespan in %s timeszone :' % file_timezone
-    print '    start hour :', grid_start_time
-    print '      ref hour :', reference_time
-    print '      end hour :', grid_end_time
-    print '     num hours :', num_hours
-    print '     file date :', reference_time.date()
-else:
-    reference_time = timespan[1]
-del kwargs['timezone']
-
-# build grid file
-print '\nBuilding "%s" grid file for %s' % (grib_var_name, reference_time.strftime('%B, %Y'))
-manager = factory.buildReanalysisGridFile(reference_time, grib_var_name, grid_region, 
-                                          file_timezone, grid_source)
-
-if debug:
-    manager.open('r')
-    time_attrs = manager.timeAttributes(grib_var_name)
-    manager.close()
-    print '\ngrid file time attrs :\n', time_attrs
-
-print '\nCompleted build for "%s" grid file.' % grib_var_name
-
+# build the matrix of jobs
+jobs = [ ]
+for region in grid_region.split(','):
+    for reference_date in reference_dates:
+        month = reference_date.strftime('%Y-%m-01')
+        for grib_var_name in grib_var_names:
+            jobs.append(('reanalysis', grid_source, region, month,
+                         grib_var_name))
+
+orchestrator = BuildOrchestrator(buildGridFile, options.workers,
+                                 {'hdf5':options.hdf5_limit},
+                                 options.checkpoint)
+orchestrator.run(jobs)
+
+for key, errmsg in orchestrator.failed:
+    print '\nbuild failed for %s :\n%s' % (key, errmsg)
+print '\n'.join(orchestrator.report())
+
+elapsed_time = elapsedTime(BUILD_START_TIME, True)
+print 'completed %d build jobs in %s' % (len(jobs), elapsed_time)
@@ -8,7 +8,7 @@ import requests
 import numpy as N
 import pygrib
 
-from atmosci.utils import tzutils
+from atmosci.utils import timeaxis, tzutils
 from atmosci.utils.timeutils import lastDayOfMonth
 
 from atmosci.seasonal.methods.static  import StaticFileAccessorMethods
@@ -109,16 +109,26 @@ class SmartReanalysisGribMethods:
         year = reference_time.year
         month = reference_time.month
         last_day = lastDayOfMonth(year, month)
-        last_hour = datetime.datetime(year, month, last_day, 23)
-        target_hour = tzutils.asUtcTime(last_hour, 'UTC')
+        hours = timeaxis.hourRange(datetime.datetime(year, month, 1, 0),
+                    datetime.datetime(year, month, last_day, 23), 'UTC')
+        filepaths = self.gribFilepaths(hours, variable, self.grib_region)
         # look for the last available file in the month
-        while target_hour.month == month:
-            filepath = self.gribFilepath(target_hour, variable, 
-                            self.grib_region, make_directory=False)
-            if os.path.exists(filepath): return target_hour
-            target_hour -= ONE_HOUR
-        # no data available for the month
-        return None
+        indx = self.grib_dir_index.lastAvailable(filepaths)
+        if indx is None: return None # no data available for the month
+        return timeaxis.asDatetimes(hours[indx:indx+1], 'UTC')[0]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def missingGribHours(self, variable, start_time, end_time, **kwargs):
+        """ Returns a datetime64 array of the UTC hours between start_time
+        and end_time (inclusive) that do not have a grib file.
+        """
+        region = kwargs.get('region', self.grib_region)
+        start_time = tzutils.tzaDatetime(start_time, self.tzinfo)
+        end_time = tzutils.tzaDatetime(end_time, self.tzinfo)
+        hours = timeaxis.hourRange(start_time, end_time)
+        filepaths = self.gribFilepaths(hours, variable, region)
+        return hours[~self.grib_dir_index.availableMask(filepaths)]
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -165,40 +175,32 @@ class SmartReanalysisGribMethods:
         grib_start_time = tzutils.tzaDatetime(slice_start_time, self.tzinfo)
         if slice_end_time > slice_start_time:
             grib_end_time = tzutils.tzaDatetime(slice_end_time, self.tzinfo)
+            hours = timeaxis.hourRange(grib_start_time, grib_end_time)
+            filepaths = self.gribFilepaths(hours, variable, region)
 
             # a requested end time is not necessarily available
             # so strip off missing hours from end of time span
-            while grib_end_time >= grib_start_time:
-                filepath = self.gribFilepath(grib_end_time, variable, region)
-                if os.path.exists(filepath): break
-                grib_end_time -= ONE_HOUR
+            last_indx = self.grib_dir_index.lastAvailable(filepaths)
+            if last_indx is None: num_hours = 0
+            else: num_hours = last_indx + 1
 
-            num_hours = tzutils.hoursInTimespan(grib_start_time, grib_end_time)
             data = N.empty((num_hours,)+self.grid_dimensions, dtype=float)
             data.fill(N.nan)
 
             units = None
-            date_indx = 0
-            grib_time = grib_start_time
-            while units is None and grib_time <= grib_end_time:
-                success, package = self.dataFromGrib(variable, grib_time,
-                                        return_units=True, **kwargs)
-                if success:
-                    units, data_for_hour = package
-                    data[date_indx,:,:] = data_for_hour
-                else: failed.append(package)
-
-                grib_time += ONE_HOUR
-                date_indx += 1
+            grib_hours = timeaxis.asDatetimes(hours[:num_hours], self.tzinfo)
+            for date_indx, grib_time in enumerate(grib_hours):
+                if units is None:
+                    success, package = self.dataFromGrib(variable, grib_time,
+                                            return_units=True, **kwargs)
+                    if success: units, package = package
+                else:
+                    success, package = \
+                        self.dataFromGrib(variable, grib_time, **kwargs)
 
-            while grib_time <= grib_end_time:
-                OK, package = self.dataFromGrib(variable, grib_time, **kwargs)
-                if OK: data[date_indx,:,:] = package
+                if success: data[date_indx,:,:] = package
                 else: failed.append(package)
 
-                grib_time += ONE_HOUR
-                date_indx += 1
-
         else:
             success, package = self.dataFromGrib(variable, grib_start_time,
                                                 return_units=True, **kwargs)
@@ -350,6 +352,7 @@ class ReanalysisDownloadFactory(SmartReanalysisGribMethods,
                             file_obj.write(data)
 
                     if packet_size >= expected_size:
+                        self.grib_dir_index.refresh(os.path.dirname(filepath))
                         return 200, filepath, url, variable
 
             except requests.exceptions.Timeout as e:
@@ -437,6 +440,7 @@ class ReanalysisDownloadFactory(SmartReanalysisGribMethods,
                     file_obj = open(filepath,'wb')
                     file_obj.write(req.content)
                     file_obj.close()
+                    self.grib_dir_index.refresh(os.path.dirname(filepath))
                     return 200, filepath, url, variable
 
             except requests.exceptions.Timeout as e:
@@ -1,11 +1,10 @@
 
 import datetime
-import warnings
-
-import numpy as N
 
 from atmosci.utils import tzutils
-from atmosci.utils.timeutils import lastDayOfMonth
+
+from atmosci.hdf5.hourgrid import MonthlyGridFileView, TimeReducer, \
+                                  monthlyTimeSlices
 
 from atmosci.reanalysis.factory import ReanalysisGridFileFactory
 
@@ -16,66 +15,73 @@ class SmartReanalysisDataMethods:
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def slices(self, slice_start_time, slice_end_time):
+    def reduceTime(self, variable, slice_start_time, slice_end_time,
+                         ops=('min','max','mean','sum'), **kwargs):
+        """ Reduces the hourly data for a time span to 2D grids in a
+        single pass. Spans that cross month boundaries are accumulated
+        file by file, so only one chunk of hours is in memory at a time.
+
+        Returns a tuple containing the units of the data followed by a
+        dictionary of 2D grids for each reduction in ops. When lonlat=True
+        is passed in kwargs, the grid's lons and lats are prepended.
+        """
+        region = kwargs.get('region', self.region)
+        units = kwargs.get('units', None)
+        reducer = TimeReducer(ops)
+
+        for first_hour, last_hour in \
+        self.slices(slice_start_time, slice_end_time):
+            reader = \
+                self.gridFileReader(first_hour, variable, region, **kwargs)
+            reader.reduceTime(variable, first_hour, last_hour,
+                              reducer=reducer, **kwargs)
+            if units is None:
+                units = reader.datasetAttribute(variable, 'units')
+            if kwargs.get('lonlat', False):
+                lats = reader.lats
+                lons = reader.lons
+            reader.close()
+
+        if kwargs.get('lonlat', False):
+            return lons, lats, units, reducer.results()
+        return units, reducer.results()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-        slices = [ ]
+    def slices(self, slice_start_time, slice_end_time):
         start_time = tzutils.tzaDatetime(slice_start_time, self.tzinfo)
         end_time = tzutils.tzaDatetime(slice_end_time, self.tzinfo)
-
-        if start_time.month == end_time.month:
-            slices.append((start_time, end_time))
-        else:
-            last_day = lastDayOfMonth(start_time)
-            month_end = start_time.replace(day=last_day, hour=23)
-            slices.append((start_time, month_end))
-            
-            month = start_time.month + 1
-            while month < end_time.month:
-                month_start = start_time.replace(month=month, day=1, hour=0)
-                last_day = lastDayOfMonth(month_start)
-                month_end = month_start.replace(day=last_day, hour=23)
-                slices.append((month_start, month_end))
-            
-            slices.append((end_time.replace(day=1, hour=0), end_time))
-
-        return tuple(slices)
+        return monthlyTimeSlices(start_time, end_time)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    def timeSlice(self, variable, slice_start_time, slice_end_time, **kwargs):
+    def timeSeriesView(self, variable, **kwargs):
+        """ Returns a MonthlyGridFileView that presents the variable's
+        monthly grid files as a single continuous hourly time series.
+        The caller is responsible for closing the view.
+        """
         region = kwargs.get('region', self.region)
+        def readerForMonth(hour):
+            return self.gridFileReader(hour, variable, region, **kwargs)
+        return MonthlyGridFileView(readerForMonth, variable,
+                                   self.grid_dimensions, self.tzinfo)
 
-        slices = self.slices(slice_start_time, slice_end_time)
-        num_hours = tzutils.hoursInTimespan(slices[0][0], slices[-1][1])
-
-        # filter annoying numpy warnings
-        warnings.filterwarnings('ignore',"All-NaN axis encountered")
-        warnings.filterwarnings('ignore',"All-NaN slice encountered")
-        warnings.filterwarnings('ignore',"invalid value encountered in greater")
-        warnings.filterwarnings('ignore',"invalid value encountered in less")
-        warnings.filterwarnings('ignore',"Mean of empty slice")
-        # MUST ALSO TURN OFF WARNING FILTERS AT END OF SCRIPT !!!!!
-
-        data = N.empty((num_hours,)+self.grid_dimensions, dtype=float)
-        data.fill(N.nan)
-
-        units = None
-        prev_indx = 0
-        for first_hour, last_hour in slices:
-            sindx = prev_indx
-            eindx = sindx + tzutils.hoursInTimespan(first_hour, last_hour)
-            reader = \
-                self.gridFileReader(first_hour, variable, region, **kwargs)
-            data[sindx:eindx,:,:] = \
-                reader.timeSlice(variable, first_hour, last_hour, **kwargs)
-            if sindx == 0:
-                units = reader.datasetAttribute(variable, 'units')
-            prev_indx = eindx
-
-        # turn annoying numpy warnings back on
-        warnings.resetwarnings()
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-        return units, data
+    def timeSlice(self, variable, slice_start_time, slice_end_time, **kwargs):
+        view = self.timeSeriesView(variable, **kwargs)
+        data = view.timeSlice(slice_start_time, slice_end_time, **kwargs)
+
+        reader = view.reader(tzutils.tzaDatetime(slice_start_time,self.tzinfo))
+        units = kwargs.get('units', reader.datasetAttribute(variable, 'units'))
+        if kwargs.get('lonlat', False):
+            lats = reader.lats
+            lons = reader.lons
+            view.close()
+            return lons, lats, units, data
+        else:
+            view.close()
+            return units, data
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -5,10 +5,9 @@ ONE_HOUR = datetime.timedelta(hours=1)
 
 import numpy as N
 
-from atmosci.units import convertUnits
-
-from nrcc_viz.maps import hiResMap, addScatterToMap, drawFilledContours, \
-                          drawColoredTextBar, finishMap, finishPlot
+from nrcc_viz.maps import mapSetup, renderContext, addScatterToMap, \
+                          drawFilledContours, drawColoredTextBar, \
+                          finishMap, finishPlot
 from atmosci.reanalysis.factory import ReanalysisGridFileFactory
 from atmosci.reanalysis.smart_grid import SmartReanalysisDataMethods
 
@@ -210,9 +209,9 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def mapData(self, variable, start_time, end_time):
-        lons, lats, units, data = \
-            self.timeSlice(variable, start_time, end_time, lonlat=True)
-        return lons, lats, units, N.nansum(data, axis=0)
+        lons, lats, units, grids = self.reduceTime(variable, start_time,
+                                   end_time, ('sum',), lonlat=True)
+        return lons, lats, units, grids['sum']
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -223,7 +222,7 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
         options['outputfile'] = map_filepath
 
         lons, lats, units, data = self.mapData(variable, start_time, end_time)
-        drawFilledContours(N.nansum(data, axis=0), lats, lons, **options)
+        drawFilledContours(data, lats, lons, **options)
 
         return options
 
@@ -238,14 +237,15 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
         #map_options['keylabels'] = levels
         #map_options['colorbar'] = False
 
-        # create a map figure
-        options, _map_, map_fig, axes, xy_extremes, x, y, _grid_ = \
-            hiResMap(data, lats, lons, **map_options)
-        del x, y, _grid_
+        # create a map figure ... scatter maps use the data grid directly,
+        # so there is no need for the high resolution grid
+        options, _map_, map_fig, axes, xy_extremes = \
+            mapSetup(map_options, lats, lons)
+        map_x, map_y = renderContext(lats, lons, **options).nativeXY()
 
         # flatten the datasets so basemap scatter can handle them
-        map_lats = lats.flatten()
-        map_lons = lons.flatten()
+        map_x = map_x.flatten()
+        map_y = map_y.flatten()
         map_data = data.flatten()
 
         # plot data for each level
@@ -258,8 +258,8 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
             if len(indexes[0]) > 0:
                 color = marker_colors[level]
                 fig = addScatterToMap(options, _map_, map_fig, 
-                                      map_data[indexes], map_lats[indexes],
-                                      map_lons[indexes], markercolor=color)
+                                      map_data[indexes], x=map_x[indexes],
+                                      y=map_y[indexes], markercolor=color)
             prev_value = value
 
         finishMap(map_fig, axes, map_fig, **options)
@@ -272,11 +272,9 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
 
     def mapDataExtremes(self, variable, start_time, end_time, region, debug,
                               **kwargs):
-        lons, lats, data_units, data = \
-            self.timeSlice(variable, start_time, end_time, lonlat=True)
-        map_units = kwargs.get('units', data_units)
-        if map_units != data_units:
-            data = convertUnits(data, data_units, map_units)
+        # data is converted to map units one chunk at a time
+        lons, lats, units, grids = self.reduceTime(variable, start_time,
+                            end_time, ('min','max'), lonlat=True, **kwargs)
 
         options = self.mapOptions(variable, start_time, end_time, region)
         title_template = options['title']
@@ -285,14 +283,14 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
         options['title'] = title_template % arg_dict
         options['outputfile'] = \
             self.mapFilepath(end_time, variable, region, **arg_dict)
-        min_filepath = self.drawScatterMap(lons, lats, N.nanmin(data, axis=0),
+        min_filepath = self.drawScatterMap(lons, lats, grids['min'],
                                        start_time, end_time, options, debug)
 
         arg_dict = { 'summary':'Max', }
         options['title'] = title_template % arg_dict
         options['outputfile'] = \
             self.mapFilepath(end_time, variable, region, **arg_dict)
-        max_filepath = self.drawScatterMap(lons, lats, N.nanmax(data, axis=0),
+        max_filepath = self.drawScatterMap(lons, lats, grids['max'],
                                        start_time, end_time, options, debug)
 
         return min_filepath, max_filepath
@@ -301,11 +299,9 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
 
     def mapDataMeans(self, variable, start_time, end_time, region, debug,
                            **kwargs):
-        lons, lats, data_units, data = \
-            self.timeSlice(variable, start_time, end_time, lonlat=True)
-        map_units = kwargs.get('units', data_units)
-        if map_units != data_units:
-            data = convertUnits(data, data_units, map_units)
+        # data is converted to map units one chunk at a time
+        lons, lats, units, grids = self.reduceTime(variable, start_time,
+                            end_time, ('mean',), lonlat=True, **kwargs)
 
         options = self.mapOptions(variable, start_time, end_time, region)
         title_template = options['title']
@@ -315,18 +311,16 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
         options['outputfile'] = \
             self.mapFilepath(end_time, variable, region=region, **arg_dict)
 
-        return self.drawScatterMap(lons, lats, N.nanmean(data, axis=0), 
+        return self.drawScatterMap(lons, lats, grids['mean'],
                                    start_time, end_time, options, debug)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def mapDataTotals(self, variable, start_time, end_time, region, debug,
                             **kwargs):
-        lons, lats, data_units, data = \
-            self.timeSlice(variable, start_time, end_time, lonlat=True)
-        map_units = kwargs.get('units', data_units)
-        if map_units != data_units:
-            data = convertUnits(data, data_units, map_units)
+        # data is converted to map units one chunk at a time
+        lons, lats, units, grids = self.reduceTime(variable, start_time,
+                            end_time, ('sum',), lonlat=True, **kwargs)
 
         options = self.mapOptions(variable, start_time, end_time, region)
         title_template = options['title']
@@ -338,6 +332,6 @@ class SmartReanalysisDataMapper(SmartReanalysisDataMethods,
         options['outputfile'] = \
             self.mapFilepath(end_time, variable, region, **arg_dict)
 
-        return self.drawScatterMap(lons, lats, N.nansum(data, axis=0),
+        return self.drawScatterMap(lons, lats, grids['sum'],
                                    start_time, end_time, options, debug)
 
@@ -1,11 +1,17 @@
 
+import os
 import datetime
 from copy import copy, deepcopy
 
 import numpy as N
+import h5py
 
+from atmosci.utils.data import safestring, safevalue
 from atmosci.utils.timeutils import asDatetimeDate, asAcisQueryDate, ONE_DAY
 
+from atmosci.hdf5.mixin import DATASET_CREATE_ARGS
+from atmosci.hdf5.packing import packingAttributes
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -47,6 +53,8 @@ class FileBuilderMethods:
 
         # initialize protected instance attributes
         self._access_authority = ('r','a', 'w')
+        self._build_template = None
+        self._bulk_build = False
     
         # initialize private instance attributes
         self._config = project_config.copy()
@@ -157,8 +165,9 @@ class FileBuilderMethods:
         dataset_name, dataset, dataset_keydict = \
                                self._datasetConfig(dataset_key, **kwargs)
         self.open('r')
-        if self.datasetExistsIn(dataset_name, group_path): return
-        self.close()
+        exists = self.datasetExistsIn(dataset_name, group_path)
+        self._closeForBuild()
+        if exists: return
 
         if group_path is not None:
             dataset_path = '%s.%s' % (group_path, dataset_name)
@@ -178,19 +187,18 @@ class FileBuilderMethods:
             else: attrs['compression'] = 'gzip'
 
         data = kwargs.get('%s_data' % dataset_name, kwargs.get('data', None))
-        if data is None:
-            missing = attrs.get('missing', self.defaultMissingForType(dtype))
-            data = N.full(shape, missing, dtype)
-
-        if data.shape == shape:
-            self.open('a')
-            self.createDataset(dataset_path, data, **attrs)
-            self.close()
-        else:
+        if data is not None and data.shape != shape:
             errmsg = 'Shape of input data %s does not match' % str(data.shape)
             errmsg = '%s shape of new dataset %s.' % (errmsg, str(shape))
             raise ValueError, errmsg
 
+        self._openForBuild()
+        if data is None:
+            missing = attrs.get('missing', self.defaultMissingForType(dtype))
+            self._buildEmptyDataset(dataset_path, shape, dtype, missing, attrs)
+        else: self.createDataset(dataset_path, data, **attrs)
+        self._closeForBuild()
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def initLonLatData(self, lons, lats, **kwargs):
@@ -198,19 +206,27 @@ class FileBuilderMethods:
         Build the latitude and longitude datasets from information
         in their configuration records and the data passed in the
         "lons" and "lats" arguments.
+
+        When a "static_file" keyword argument is passed, the datasets
+        are linked to the lon and lat datasets in that file instead
+        and "lons" and "lats" are ignored.
         """
+        static_file = kwargs.pop('static_file', None)
+        if static_file is not None:
+            return self.linkStaticLonLat(static_file)
+
         # build the latitude dataset
         if not self.hasDataset('lat'):
             self.buildDataset('lat', shape=lats.shape, **kwargs)
 
         min_lat = N.nanmin(lats)
         max_lat = N.nanmax(lats)
-        self.open('a')
+        self._openForBuild()
         dataset = self.getDataset('lat')
         dataset[:,:] = lats[:,:]
         dataset.attrs['max'] = max_lat
         dataset.attrs['min'] = min_lat
-        self.close()
+        self._closeForBuild()
 
         # build the longitude dataset
         if not self.hasDataset('lon'):
@@ -218,18 +234,71 @@ class FileBuilderMethods:
 
         min_lon = N.nanmin(lons)
         max_lon = N.nanmax(lons)
-        self.open('a')
+        self._openForBuild()
         dataset = self.getDataset('lon')
         dataset[:,:] = lons[:,:]
         dataset.attrs['max'] = max_lon
         dataset.attrs['min'] = min_lon
-        self.close()
+        self._closeForBuild()
 
         # capture longitude/latitude limits as file attributes
-        self.open('a')
+        self._openForBuild()
         self.setFileAttributes(min_lon=min_lon, max_lon=max_lon,
                                min_lat=min_lat, max_lat=max_lat)
-        self.close()
+        self._closeForBuild()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def linkStaticLonLat(self, static_filepath, lon_path='lon',
+                               lat_path='lat'):
+        """ Creates the lon and lat datasets as virtual datasets that
+        read their data from the lon and lat datasets in a static file.
+        No coordinate data is written to this file.
+
+        HDF5 opens the static file read-only whenever the virtual datasets
+        are read, so any number of files may link to the same static file
+        while they are being updated. The link is stored relative to this
+        file's directory, so the files can be moved together.
+        """
+        static_filepath = os.path.abspath(static_filepath)
+        filepath = os.path.abspath(self.filepath)
+        if static_filepath == filepath: source_filepath = '.'
+        else:
+            source_filepath = os.path.relpath(static_filepath,
+                                              os.path.dirname(filepath))
+        limits = { }
+        static = h5py.File(static_filepath, 'r')
+        self._openForBuild()
+        try:
+            for coord, path in (('lat',lat_path), ('lon',lon_path)):
+                source = static['/%s' % path.replace('.','/')]
+                layout = h5py.VirtualLayout(shape=source.shape,
+                                            dtype=source.dtype)
+                layout[...] = h5py.VirtualSource(source_filepath, source.name,
+                                                 shape=source.shape)
+                name, parent = self._pathToNameAndParent(self.file, coord)
+                dataset = parent.create_virtual_dataset(name, layout,
+                                                 fillvalue=source.fillvalue)
+                for attr_name, attr_value in source.attrs.items():
+                    dataset.attrs[attr_name] = attr_value
+                dataset.attrs['created'] = self._timestamp_()
+                dataset.attrs['static_file'] = source_filepath
+                self._registerDatasetName(coord)
+
+                min_value = source.attrs.get('min', None)
+                max_value = source.attrs.get('max', None)
+                if min_value is None or max_value is None:
+                    data = source[...]
+                    min_value = N.nanmin(data)
+                    max_value = N.nanmax(data)
+                limits['min_%s' % coord] = min_value
+                limits['max_%s' % coord] = max_value
+
+            # capture longitude/latitude limits as file attributes
+            self.setFileAttributes(**limits)
+        finally:
+            static.close()
+            self._closeForBuild()
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -248,6 +317,89 @@ class FileBuilderMethods:
         return None
 
 
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+    # bulk build support
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _beginBulkBuild(self, template=None):
+        # the file stays open until _endBulkBuild is called
+        self.open('a')
+        self._bulk_build = True
+        if template is not None:
+            self._build_template = h5py.File(template, 'r')
+
+    def _endBulkBuild(self):
+        self._bulk_build = False
+        if self._build_template is not None:
+            self._build_template.close()
+            self._build_template = None
+        self.close()
+
+    def _openForBuild(self):
+        self.open('a')
+
+    def _closeForBuild(self):
+        if not self._bulk_build: self.close()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _buildEmptyDataset(self, dataset_path, shape, dtype, missing, attrs):
+        """ Creates a dataset without writing any data to it. The missing
+        value is used as the HDF5 fill value, so storage is allocated
+        only when data is written and unwritten nodes read as missing.
+        """
+        dtype = N.dtype(dtype)
+        if missing is None or dtype.kind not in 'biufS':
+            # no usable fill value, initialize the data explicitly
+            data = N.full(shape, missing, dtype)
+            return self.createDataset(dataset_path, data, **attrs)
+
+        template = self._templateDataset(dataset_path, shape, dtype, missing,
+                                         attrs)
+        if template is None:
+            return self.createEmptyDataset(dataset_path, shape, dtype,
+                                           fill_value=missing, **attrs)
+
+        # clone the empty template dataset, but not its attributes
+        name, parent = self._pathToNameAndParent(self.file, dataset_path)
+        self._build_template.copy(template, parent, name, without_attrs=True)
+        dataset = parent[name]
+        # set attributes the same way that _createEmptyDataset_ does
+        attributes = { }
+        for attr_name, attr_value in attrs.items():
+            if attr_name not in DATASET_CREATE_ARGS:
+                attributes[safestring(attr_name)] = safevalue(attr_value)
+        if 'created' not in attributes:
+            attributes['created'] = self._timestamp_()
+        for attr_name, attr_value in attributes.items():
+            dataset.attrs[attr_name] = attr_value
+        self._registerDatasetName(dataset_path)
+        return dataset
+
+    def _templateDataset(self, dataset_path, shape, dtype, missing, attrs):
+        """ Returns the template file's dataset at dataset_path when it
+        has the same layout as the new dataset and contains no data.
+        Otherwise, returns None.
+        """
+        if self._build_template is None: return None
+        path = '/%s' % dataset_path.replace('.','/')
+        template = self._build_template.get(path, None)
+        if not isinstance(template, h5py.Dataset): return None
+        if template.shape != tuple(shape) or template.dtype != dtype:
+            return None
+        chunks = attrs.get('chunks', None)
+        if chunks is not None: chunks = tuple(chunks)
+        if template.chunks != chunks: return None
+        if template.compression != attrs.get('compression', None):
+            return None
+        fillvalue = template.fillvalue
+        if fillvalue != missing:
+            if not (dtype.kind == 'f' and N.isnan(fillvalue)
+                    and N.isnan(missing)): return None
+        if template.id.get_storage_size() > 0: return None
+        return template
+
+
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
     # config object access methods
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
@@ -432,6 +584,12 @@ class FileBuilderMethods:
 
         dtype = dataset_config.dtype
         packed_dtype = dataset_config.get('dtype_packed', dtype)
+        packing = dataset_config.get('packing', None)
+        if packing is not None:
+            packed_dtype, packing_attrs = \
+                packingAttributes(packing, dataset_config.get('precision',None),
+                                  dataset_config.get('scale_factor', None),
+                                  dataset_config.get('add_offset', None))
 
         missing = dataset_config.get('missing_data', None)
         packed_missing = dataset_config.get('missing_packed', None)
@@ -441,6 +599,9 @@ class FileBuilderMethods:
         multiplier = dataset_config.get('multiplier', None)
         if multiplier: attrs['multiplier'] = multiplier
 
+        precision = dataset_config.get('precision', None)
+        if precision is not None: attrs['precision'] = precision
+
         units = dataset_config.get('units', None)
         if units is not None:
             if multiplier:
@@ -464,6 +625,9 @@ class FileBuilderMethods:
                     attrs['unpack'] = '(%s,%s)' % (dtype, str(missing))
                 else: attrs['unpack'] = '(%s,None)' % dtype
 
+        # packing modes define their own missing and unpack attributes
+        if packing is not None: attrs.update(packing_attrs)
+
         return shape, packed_dtype, attrs
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -573,36 +737,55 @@ class GridFileBuildMethods(FileBuilderMethods):
 
     def build(self, build_groups=True, build_datasets=True, lons=None,
                     lats=None, **kwargs):
+        """ Builds all groups and datasets defined for the filetype.
+
+        The file is opened once for the whole build and datasets created
+        without data are allocated only when data is first written to
+        them, so building an empty file never writes grid data.
+
+        Optional kwargs:
+            "template" = path to a file previously built for the same
+                         filetype. Empty datasets in the template whose
+                         layout matches the new dataset are cloned from
+                         it with h5py copy.
+            "static_file" = path to the static file for the source and
+                            region. The lon and lat datasets are created
+                            as virtual datasets that read from it instead
+                            of writing lons and lats to every file.
+        """
+        template = kwargs.pop('template', None)
+        static_file = kwargs.pop('static_file', None)
 
         # initiaize file attributes
         self.initFileAttributes(**kwargs)
 
-        # build data groups
-        groups = self.filetype.get('groups',None)
-        if groups and build_groups:
-            if self.debug: print 'building file level groups'
-            for group_key in groups:
-                if not self.groupExists(group_key):
-                    self.open('a')
-                    self.buildGroup(group_key, build_datasets, **kwargs)
-                    self.close()
-
-        # build file-level datasets
-        datasets = self.filetype.get('datasets',None)
-        # initialze lat and lon datasets if the data was passed
-        if datasets and build_datasets:
-            if lons is not None and lats is not None:
-                self.initLonLatData(lons, lats)
-                datasets = list(datasets)
-                datasets.remove('lon')
-                datasets.remove('lat')
-        # test again, in case lats and lons were the only datasets in the list
-        if datasets and build_datasets:
-            if self.debug: print 'building file level datasets'
-            for dataset_key in datasets:
-                self.open('a')
-                self.buildDataset(dataset_key, **kwargs)
-                self.close()
+        self._beginBulkBuild(template)
+        try:
+            # build data groups
+            groups = self.filetype.get('groups',None)
+            if groups and build_groups:
+                if self.debug: print 'building file level groups'
+                for group_key in groups:
+                    if not self.groupExists(group_key):
+                        self.buildGroup(group_key, build_datasets, **kwargs)
+
+            # build file-level datasets
+            datasets = self.filetype.get('datasets',None)
+            # initialze lat and lon datasets if the data was passed
+            if datasets and build_datasets:
+                if static_file is not None or \
+                   (lons is not None and lats is not None):
+                    self.initLonLatData(lons, lats, static_file=static_file)
+                    datasets = list(datasets)
+                    datasets.remove('lon')
+                    datasets.remove('lat')
+            # test again, in case lats and lons were the only datasets
+            if datasets and build_datasets:
+                if self.debug: print 'building file level datasets'
+                for dataset_key in datasets:
+                    self.buildDataset(dataset_key, **kwargs)
+        finally:
+            self._endBulkBuild()
 
         # return with file open for updates
         self.open('a')
@@ -624,16 +807,16 @@ class GridFileBuildMethods(FileBuilderMethods):
         attrs = \
             self._resolveGroupBuildAttributes(group, group_keydict, **kwargs)
 
-        self.open('a')
+        self._openForBuild()
         self.createGroup(group_path, **attrs)
-        self.close()
+        self._closeForBuild()
 
         # build this group's sub-groups
         groups = group.get('groups', None)
         if groups:
             if self.debug: print 'building subgroups of', group_path
             for name in groups:
-                self.buildGroup(name, group_path, **kwargs)
+                self.buildGroup(name, build_datasets, group_path, **kwargs)
 
         # build this group's datasets
         datasets = group.get('datasets', None)
@@ -729,38 +912,45 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
 
     def build(self, build_groups=True, build_datasets=True, lons=None,
                     lats=None, **kwargs):
+        """ Builds all groups, datasets and provenance defined for the
+        filetype. See GridFileBuildMethods.build for the optional
+        "template" and "static_file" kwargs.
+        """
+        template = kwargs.pop('template', None)
+        static_file = kwargs.pop('static_file', None)
 
         # initiaize file attributes
         self.initFileAttributes(**kwargs)
 
-        # build data groups
-        groups = self.filetype.get('groups',None)
-        if groups and build_groups:
-            if self.debug: print 'building file level groups'
-            for group_key in groups:
-                if not self.groupExists(group_key):
-                    self.open('a')
-                    self.buildGroup(group_key, build_datasets, **kwargs)
-                    self.close()
-
-        # build file-level datasets
-        datasets = self.filetype.get('datasets',None)
-        # initialze lat and lon datasets if the data was passed
-        if datasets and build_datasets:
-            if lons is not None and lats is not None:
-                self.initLonLatData(lons, lats)
-                datasets = list(datasets)
-                datasets.remove('lon')
-                datasets.remove('lat')
-        # test again, in case lats and lons were the only datasets in the list
-        if datasets and build_datasets:
-            if self.debug: print 'building file level datasets'
-            for dataset_key in datasets:
-                self.open('a')
-                if 'provenance' in dataset_key:
-                    self.buildProvenance(dataset_key, **kwargs)
-                else: self.buildDataset(dataset_key, **kwargs)
-                self.close()
+        self._beginBulkBuild(template)
+        try:
+            # build data groups
+            groups = self.filetype.get('groups',None)
+            if groups and build_groups:
+                if self.debug: print 'building file level groups'
+                for group_key in groups:
+                    if not self.groupExists(group_key):
+                        self.buildGroup(group_key, build_datasets, **kwargs)
+
+            # build file-level datasets
+            datasets = self.filetype.get('datasets',None)
+            # initialze lat and lon datasets if the data was passed
+            if datasets and build_datasets:
+                if static_file is not None or \
+                   (lons is not None and lats is not None):
+                    self.initLonLatData(lons, lats, static_file=static_file)
+                    datasets = list(datasets)
+                    datasets.remove('lon')
+                    datasets.remove('lat')
+            # test again, in case lats and lons were the only datasets
+            if datasets and build_datasets:
+                if self.debug: print 'building file level datasets'
+                for dataset_key in datasets:
+                    if 'provenance' in dataset_key:
+                        self.buildProvenance(dataset_key, **kwargs)
+                    else: self.buildDataset(dataset_key, **kwargs)
+        finally:
+            self._endBulkBuild()
 
         # return with file open for updates
         self.open('a')
@@ -782,9 +972,9 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
         attrs = \
             self._resolveGroupBuildAttributes(group, group_keydict, **kwargs)
 
-        self.open('a')
+        self._openForBuild()
         self.createGroup(group_path, **attrs)
-        self.close()
+        self._closeForBuild()
 
         # build this group's sub-groups
         groups = group.get('groups', None)
@@ -815,8 +1005,9 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
         group_name = kwargs.get('group_name', None)
         group_path = kwargs.get('group_path', group_name)
         self.open('r')
-        if self.datasetExistsIn(dataset_name, group_path): return
-        self.close()
+        exists = self.datasetExistsIn(dataset_name, group_path)
+        self._closeForBuild()
+        if exists: return
 
         if group_path is not None:
             dataset_path = '%s.%s' % (group_path ,dataset_name)
@@ -837,10 +1028,10 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
         formats = prov_config.formats
         provenance = N.rec.fromrecords(records, shape=(len(records),),
                                        formats=formats, names=names)
-        self.open('a')
+        self._openForBuild()
         self.createDataset(dataset_path, provenance, raw=True)
         self.setDatasetAttributes(dataset_path, **attrs)
-        self.close()
+        self._closeForBuild()
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -53,7 +53,7 @@ class GridFileReaderMethods:
             elif isInteger(packed_missing): packed_missing = int(packed_missing)
             elif isNanString(packed_missing): packed_missing = N.nan
         multiplier = dataset.attrs.get('multiplier', None)
-        if multiplier and isinstance(multuplier, basestring):
+        if multiplier and isinstance(multiplier, basestring):
             if isFloat(multiplier): multiplier = float(multiplier)
             elif isInteger(multiplier): multiplier = int(multiplier)
         params = [ packed_dtype, packed_missing, multiplier ]
@@ -81,7 +81,12 @@ class GridFileReaderMethods:
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
     def _getUnpacker(self, dataset_name):
-        return self._unpackers.get(dataset_name, None)
+        unpack = self._unpackers.get(dataset_name, None)
+        if unpack is None:
+            # datasets with a declared packing mode are unpacked by it
+            packing = self._datasetPacking(dataset_name)
+            if packing is not None: return packing.unpack
+        return unpack
 
     def _postUnpack(self, dataset_path, data, **kwargs):
         to_units = kwargs.get('units', None)
@@ -103,7 +108,10 @@ class GridFileReaderMethods:
     def _unpackData(self, dataset_path, packed_data, **kwargs):
         # look for dataset-specific unpacker
         unpack = self._getUnpacker(dataset_path)
-        if unpack is not None: return unpack(packed_data)
+        if unpack is not None:
+            if getattr(unpack, 'accepts_options', False):
+                return unpack(packed_data, **kwargs)
+            return unpack(packed_data)
 
         # discover packing parameters for dataset, if they exist
         packed_dtype, packed_missing, multiplier, data_dtype, data_missing =\
@@ -245,14 +253,28 @@ class GridFileManagerMethods:
     # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
 
     def _getPacker(self, dataset_path):
-        return self._packers.get(dataset_path, None)
+        packer = self._packers.get(dataset_path, None)
+        if packer is None:
+            packing = self._datasetPacking(dataset_path)
+            if packing is not None: return packing.pack
+        return packer
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def _packData(self, dataset_path, data, **kwargs):
         # look for dataset-specific input data packer
         packer = self._getPacker(dataset_path)
-        if packer is not None: return packer(data)
+        if packer is not None:
+            if getattr(packer, 'accepts_options', False):
+                missing = kwargs.get('missing', None)
+                if missing is None:
+                    missing = self._getPackParams(
+                                   self.getDataset(dataset_path))[-1]
+                    # i.e. None or 'None' in the "unpack" attribute
+                    if missing is None or isinstance(missing, basestring):
+                        missing = N.nan
+                return packer(data, missing=missing)
+            return packer(data)
 
         # discover packing parameters for dataset, if they exist
         # NOTE: ignore_datatype is what the file thinks the OUTPUT
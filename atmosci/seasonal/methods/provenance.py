@@ -110,38 +110,49 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
 
     def build(self, build_groups=True, build_datasets=True, lons=None,
                     lats=None, kwarg_dict={}):
+        """ Builds all groups, datasets and provenance defined for the
+        filetype. kwarg_dict may contain the "template" and "static_file"
+        options described in GridFileBuildMethods.build.
+        """
+        kwarg_dict = dict(kwarg_dict)
+        template = kwarg_dict.pop('template', None)
+        static_file = kwarg_dict.pop('static_file', None)
 
         # initiaize file attributes
         self.initFileAttributes(**kwarg_dict)
 
-        # build data groups
-        groups = self.filetype.get('groups',None)
-        if groups and build_groups:
-            if self.debug: print 'building file level groups'
-            for group_key in groups:
-                if not self.groupExists(group_key):
-                    self.open('a')
-                    self.buildGroup(group_key, build_datasets, kwarg_dict)
-                    self.close()
-
-        # build file-level datasets
-        datasets = self.filetype.get('datasets',None)
-        # initialze lat and lon datasets if the data was passed
-        if datasets and build_datasets:
-            if lons is not None and lats is not None:
-                self.initLonLatData(lons, lats)
-                datasets = list(datasets)
-                datasets.remove('lon')
-                datasets.remove('lat')
-        # test again, in case lats and lons were the only datasets in the list
-        if datasets and build_datasets:
-            if self.debug: print 'building file level datasets'
-            for dataset_key in datasets:
-                self.open('a')
-                if 'provenance' in dataset_key:
-                    self.buildProvenance(dataset_key, kwarg_dict)
-                else: self.buildDataset(dataset_key, None, None, **kwarg_dict)
-                self.close()
+        self._beginBulkBuild(template)
+        try:
+            # build data groups
+            groups = self.filetype.get('groups',None)
+            if groups and build_groups:
+                if self.debug: print 'building file level groups'
+                for group_key in groups:
+                    if not self.groupExists(group_key):
+                        self.buildGroup(group_key, build_datasets, None,
+                                        kwarg_dict)
+
+            # build file-level datasets
+            datasets = self.filetype.get('datasets',None)
+            # initialze lat and lon datasets if the data was passed
+            if datasets and build_datasets:
+                if static_file is not None or \
+                   (lons is not None and lats is not None):
+                    self.initLonLatData(lons, lats, static_file=static_file)
+                    datasets = list(datasets)
+                    datasets.remove('lon')
+                    datasets.remove('lat')
+            # test again, in case lats and lons were the only datasets
+            if datasets and build_datasets:
+                if self.debug: print 'building file level datasets'
+                for dataset_key in datasets:
+                    if 'provenance' in dataset_key:
+                        self.buildProvenance(dataset_key, kwarg_dict)
+                    else:
+                        self.buildDataset(dataset_key, None, None,
+                                          **kwarg_dict)
+        finally:
+            self._endBulkBuild()
 
         # return with file open for updates
         self.open('a')
@@ -164,9 +175,9 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
         attrs = \
             self._resolveGroupBuildAttributes(group, group_keydict, kwarg_dict)
 
-        self.open('a')
+        self._openForBuild()
         self.createGroup(group_path, **attrs)
-        self.close()
+        self._closeForBuild()
 
         # build this group's sub-groups
         groups = group.get('groups', None)
@@ -217,10 +228,10 @@ class ProvenanceBuilderMethods(ProvenanceManagerMethods, FileBuilderMethods):
         formats = prov_type.formats
         provenance = N.rec.fromrecords(records, shape=(len(records),),
                                        formats=formats, names=names)
-        self.open('a')
+        self._openForBuild()
         self.createDataset(prov_path, provenance, raw=True)
         self.setDatasetAttributes(prov_path, **attrs)
-        self.close()
+        self._closeForBuild()
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -1,5 +1,6 @@
 
 import os, sys
+import datetime
 
 import numpy as N
 from scipy import stats as scipy_stats
@@ -9,7 +10,7 @@ except:
     nanmedian = scipy_stats.nanmedian
 
 from atmosci.utils.config import ConfigObject
-from atmosci.utils.timeutils import asAcisQueryDate
+from atmosci.utils.timeutils import asAcisQueryDate, asDatetimeDate
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
@@ -49,7 +50,6 @@ FUNCBASE.generators.doyaccum = doyAccumStatsProvenanceGenerator
 
 # record generator for date series statistics - no accumulation
 def dateStatsProvenanceGenerator(date, timestamp, data):
-        nanmedian(data,axis=None)
     return ( asAcisQueryDate(date), N.nanmin(data), N.nanmax(data),
              N.nanmean(data), nanmedian(data,axis=None), timestamp )
 FUNCBASE.generators.datestats = dateStatsProvenanceGenerator
@@ -74,6 +74,38 @@ def tempExtremesProvenanceGenerator(date, timestamp, mint, maxt, source):
              source, timestamp )
 FUNCBASE.generators.tempexts = tempExtremesProvenanceGenerator
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# provenance recorders
+#    fill a preallocated array of provenance records for a series of days
+#    using statistics calculated for all days at once along the time axis
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+ConfigObject('recorders', FUNCBASE)
+
+# min, max, mean and (optionally) median of each day in a 3D grid
+def dailyStatistics(data, median=False):
+    data = data.reshape((data.shape[0], -1))
+    stats = [ N.nanmin(data, axis=1), N.nanmax(data, axis=1),
+              N.nanmean(data, axis=1) ]
+    if median: stats.append(nanmedian(data, axis=1))
+    return stats
+
+# records for min/max temperature estremes group
+# median is only calculated when the record type has a median field
+def tempExtremesProvenanceRecorder(records, start_date, timestamp, mint, maxt,
+                                   source):
+    start_date = asDatetimeDate(start_date)
+    records['date'] = [ asAcisQueryDate(start_date+datetime.timedelta(days=day))
+                        for day in range(len(records)) ]
+    for name, data in (('mint',mint), ('maxt',maxt)):
+        median = 'median %s' % name in records.dtype.names
+        stats = dailyStatistics(data, median)
+        for stat, values in zip(('min','max','avg','median'), stats):
+            records['%s %s' % (stat,name)] = values
+    records['source'] = source
+    records['processed'] = timestamp
+    return records
+FUNCBASE.recorders.tempexts = tempExtremesProvenanceRecorder
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # dataset indexers
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -9,25 +9,125 @@ ONE_DAY = relativedelta(days=1)
 
 import numpy as N
 
+from atmosci.utils.pipeline import BuildOrchestrator, serviceSlot
 from atmosci.utils.timeutils import elapsedTime
 from atmosci.seasonal.factory import AcisProjectFactory
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-PERFORMANCE_MSG = 'completed build for %d in %s'
+PERFORMANCE_MSG = 'completed build for %s in %s'
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def downloadTemps(source_key, start_date, end_date, bbox, **kwargs):
+    with serviceSlot('acis'):
+        return factory.getAcisGridData(source_key, 'maxt,mint', start_date,
+                       end_date, False, bbox=bbox, debug=debug, **kwargs)
+
+def insertTemps(builder, source, start_date, data):
+    with serviceSlot('hdf5'):
+        builder.open('a')
+        builder.updateTempGroup(start_date, data['maxt'], data['mint'],
+                                source.tag)
+        builder.close()
+    if verbose: print '    inserted daily temperatures'
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def buildSourceFile(job):
+    """ Builds the source file for one (project, source, region, year)
+    job. Runs in the orchestrator's process pool.
+    """
+    project_name, source_key, region_key, target_year = job
+    year_start_time = datetime.datetime.now()
+
+    region = factory.getRegionConfig(region_key)
+    bbox = region.data
+    source = factory.getSourceConfig(source_key)
+    latest_available_date = factory.latestAvailableDate(source)
+
+    start_date = datetime.date(target_year,1,1)
+    end_date = datetime.date(target_year,12,31)
+    if end_date > latest_available_date:
+        max_end_date = latest_available_date
+        errmsg = '%s data is only available thru %s'
+        print errmsg % (source.tag, latest_available_date.isoformat())
+    else: max_end_date = end_date
+
+    # create a build and initialize the file
+    with serviceSlot('hdf5'):
+        builder = factory.getSourceFileBuilder(source, target_year, region,
+                                               'temps', bbox=bbox)
+        print 'building', builder.filepath
+        if verbose:
+            print '\nbuilder source :\n', builder.source
+            print '\nbuilder region :\n', builder.region
+
+        # build the groups and their datasets
+        for group_name in groups_in_file:
+            if verbose: print '    building group : %s' % group_name
+            builder.buildGroup(group_name, True)
+
+    # get first increment plus metadata
+    end_date = min(start_date + INCREMENT, max_end_date)
+    if verbose: print 'downloading', start_date, 'thru', end_date
+    data = downloadTemps(source_key, start_date, end_date, bbox, meta='ll')
+    # create lat,lon grids
+    if verbose: print '    creating lat/lon datasets'
+    with serviceSlot('hdf5'):
+        if link_static:
+            static_file = factory.staticGridFilepath(source, region)
+        else: static_file = None
+        builder.initLonLatData(data['lon'], data['lat'],
+                               static_file=static_file)
+    del data['lon']
+    del data['lat']
+
+    # insert temperature data for the first time sequence
+    insertTemps(builder, source, start_date, data)
+
+    # retrieve data for the rest of the year
+    start_date = end_date + ONE_DAY
+    while start_date <= max_end_date:
+        end_date = min(start_date + INCREMENT, max_end_date)
+        if verbose: print '\ndownloading', start_date, 'thru', end_date
+        data = downloadTemps(source_key, start_date, end_date, bbox)
+        insertTemps(builder, source, start_date, data)
+        del data
+
+        # incrment to next sequence of dates
+        start_date = end_date + ONE_DAY
+
+    elapsed_time = elapsedTime(year_start_time, True)
+    print PERFORMANCE_MSG % (':'.join([str(item) for item in job]),
+                             elapsed_time)
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 from optparse import OptionParser
 parser = OptionParser()
 
+parser.add_option('-c', action='store', dest='checkpoint', default=None,
+        help='Checkpoint file. Jobs completed in a previous run are skipped.')
 parser.add_option('-i', action='store', dest='increment', type='int',
                   default=10)
-parser.add_option('-r', action='store', dest='region', default=None)
-parser.add_option('-s', action='store', dest='source', default=None)
+parser.add_option('-r', action='store', dest='region', default=None,
+        help='Region or comma separated list of regions')
+parser.add_option('-s', action='store', dest='source', default=None,
+        help='Source or comma separated list of sources')
 parser.add_option('-v', action='store_true', dest='verbose', default=False)
+parser.add_option('-w', action='store', type=int, dest='workers', default=1,
+        help='Number of files to build at the same time')
 parser.add_option('-z', action='store_true', dest='debug', default=False)
 
+parser.add_option('--acis', action='store', type=int, dest='acis_limit',
+        default=2, help='Maximum number of concurrent ACIS downloads')
+parser.add_option('--hdf5', action='store', type=int, dest='hdf5_limit',
+        default=None, help='Maximum number of concurrent HDF5 writers')
+parser.add_option('--static', action='store_true', dest='link_static',
+        default=False, help='Link lon/lat to the static file instead of '
+                            'copying them into each file')
+
 options, args = parser.parse_args()
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -35,6 +135,7 @@ options, args = parser.parse_args()
 INCREMENT = relativedelta(days=options.increment-1)
 
 debug = options.debug
+link_static = options.link_static
 verbose = options.verbose
 
 factory = AcisProjectFactory()
@@ -42,23 +143,12 @@ project = factory.getProjectConfig()
 if verbose:
     print 'project :\n', project
 
-region_key = options.region
-if region_key is None: region_key = project.region
-if len(region_key) == 2: region_key = region_key.upper()
-region = factory.getRegionConfig(region_key)
-bbox = region.data
-if verbose:
-    print '\nregion :\n', region
+if options.region is None: region_keys = [project.region,]
+else: region_keys = options.region.split(',')
+region_keys = [key.upper() if len(key) == 2 else key for key in region_keys]
 
-source_key = options.source
-if source_key is None: source_key = project.source
-source = factory.getSourceConfig(source_key)
-if verbose:
-    print '\nsource :\n', source
-    print ' '
-latest_available_date = factory.latestAvailableDate(source)
-latest_available_time = \
-    factory.latestAvailableTime(source, latest_available_date)
+if options.source is None: source_keys = [project.source,]
+else: source_keys = options.source.split(',')
 
 current_year = BUILD_START_TIME.year
 if len(args) == 0:
@@ -78,82 +168,28 @@ else: target_years = [int(arg) for arg in args]
 filetpye = factory.getFiletypeConfig('source')
 groups_in_file = filetpye.groups
 
-for target_year in target_years:
-    year_start_time = datetime.datetime.now()
-
-    start_date = datetime.date(target_year,1,1)
-    if start_date > latest_available_date:
-        print '%s data is not available for %d' % (source.tag, target_year)
-        continue
-
-    end_date = datetime.date(target_year,12,31)
-    if end_date > latest_available_date:
-        max_end_date = latest_available_date
-        errmsg = '%s data is only available thru %s'
-        print errmsg % (source.tag, latest_available_date.isoformat())
-    else: max_end_date = end_date
-
-    # create a build and initialize the file
-    builder = factory.getSourceFileBuilder(source, target_year, region,
-                                           'temps', bbox=bbox)
-    print 'building', builder.filepath
-    if verbose:
-        print '\nbuilder source :\n', builder.source
-        print '\nbuilder region :\n', builder.region
-
-    # build the groups and their datasets
-    for group_name in groups_in_file:
-        if verbose: print '    building group : %s' % group_name
-        builder.buildGroup(group_name, True)
-
-    # get first month plus metadata
-    end_date = start_date + INCREMENT
-    if verbose: print 'downloading', start_date, 'thru', end_date
-    data = factory.getAcisGridData(source_key, 'maxt,mint', start_date,
-                   end_date, False, meta='ll', bbox=bbox, debug=debug)
-    # create lat,lon grids
-    if verbose: print '    creating lat/lon datasets'
-    builder.initLonLatData(data['lon'], data['lat'])
-    del data['lon']
-    del data['lat']
-
-    # insert temperature data for the next time sequence
-    builder.open('a')
-    builder.updateTempGroup(start_date, data['maxt'], data['mint'],
-                            source.tag)
-    builder.close()
-    if verbose: print '    inserted daily temperatures'
-
-    # retrieve data for the rest of the year
-    while end_date < max_end_date:
-        if verbose: print '\ndownloading', start_date, 'thru', end_date
-        data = factory.getAcisGridData(source_key, 'maxt,mint', start_date,
-                       end_date, False, bbox=bbox, debug=debug)
-        builder.open('a')
-        builder.updateTempGroup(start_date, data['maxt'], data['mint'],
-                                source.tag)
-        builder.close()
-        if verbose: print '    inserted daily temperatures'
-
-        # incrment to next sequence of dates
-        start_date = end_date + ONE_DAY
-        end_date = start_date + INCREMENT
-
-    # days left over, update them
-    if start_date < max_end_date:
-        if verbose: print '\ndownloading', start_date, 'thru', max_end_date
-        data = factory.getAcisGridData(source_key, 'maxt,mint', start_date,
-                       max_end_date, False, bbox=bbox, debug=debug)
-        builder.open('a')
-        builder.updateTempGroup(start_date, data['maxt'], data['mint'],
-                                source.tag)
-        builder.close()
-        if verbose: print '    inserted daily temperatures'
-        del data
-
-    elapsed_time = elapsedTime(year_start_time, True)
-    print PERFORMANCE_MSG % (target_year, elapsed_time)
+# build the matrix of jobs
+jobs = [ ]
+for source_key in source_keys:
+    source = factory.getSourceConfig(source_key)
+    if verbose: print '\nsource :\n', source
+    latest_available_date = factory.latestAvailableDate(source)
+    for region_key in region_keys:
+        for target_year in target_years:
+            if datetime.date(target_year,1,1) > latest_available_date:
+                print '%s data is not available for %d' % (source.tag,
+                                                           target_year)
+                continue
+            jobs.append(('seasonal', source_key, region_key, target_year))
+
+service_limits = {'acis':options.acis_limit, 'hdf5':options.hdf5_limit}
+orchestrator = BuildOrchestrator(buildSourceFile, options.workers,
+                                 service_limits, options.checkpoint)
+orchestrator.run(jobs)
+
+for key, errmsg in orchestrator.failed:
+    print '\nbuild failed for %s :\n%s' % (key, errmsg)
+print '\n'.join(orchestrator.report())
 
 elapsed_time = elapsedTime(BUILD_START_TIME, True)
-print 'completed build for %d years in %s' % (len(target_years), elapsed_time)
-
+print 'completed %d build jobs in %s' % (len(jobs), elapsed_time)
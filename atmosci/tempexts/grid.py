@@ -1,5 +1,6 @@
 
 import datetime
+import zlib
 
 import numpy as N
 
@@ -14,6 +15,41 @@ from atmosci.seasonal.grid import SeasonalGridFileReader, \
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+ONE_DAY = datetime.timedelta(days=1)
+TIMESTAMP = '%Y-%m-%d %H:%M:%S'
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def dayChecksums(*grids):
+    """ Returns an array with the CRC32 checksum of each day (i.e. the
+    first dimension) of one or more 3D grids. Zero is reserved to mean
+    "no checksum", so a checksum that happens to be zero is stored as 1.
+    """
+    num_days = grids[0].shape[0]
+    checksums = N.zeros((num_days,), dtype='<u4')
+    for day in range(num_days):
+        crc = 0
+        for grid in grids:
+            crc = zlib.crc32(N.ascontiguousarray(grid[day]).data, crc)
+        checksums[day] = (crc & 0xffffffff) or 1
+    return checksums
+
+def dayRuns(days, max_gap=0):
+    """ Coalesces a sorted sequence of day indexes into a list of
+    (first, last) tuples. Runs separated by max_gap days or less are
+    merged into a single run.
+    """
+    runs = [ ]
+    for day in days:
+        day = int(day)
+        if runs and day - runs[-1][1] <= max_gap + 1:
+            runs[-1][1] = day
+        else: runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
 class TempextAccessMethods:
     """ Temperature extremes data access methods
 
@@ -107,6 +143,15 @@ class TempextUpdateMethods(TempextAccessMethods):
         self.insertByDate(mint_path, mint, start_date, **kwargs)
         maxt_path = '%s.maxt' % temp_group
         self.insertByDate(maxt_path, maxt, start_date, **kwargs)
+
+        # checksums for these days no longer match the data
+        checksum_path = '%s.checksums' % temp_group
+        if self.hasDataset(checksum_path):
+            if mint.ndim == 3: num_days = mint.shape[0]
+            else: num_days = 1
+            start_index = self.indexFromDate(checksum_path, start_date)
+            dataset = self.getDataset(checksum_path)
+            dataset[start_index:start_index+num_days] = 0
         #if mint.ndim == 3:
         #    self.insertTimeSlice(mint_path, start_date, mint, **kwargs)
         #    self.insertTimeSlice(maxt_path, start_date, maxt, **kwargs)
@@ -157,34 +202,33 @@ class TempextUpdateMethods(TempextAccessMethods):
         start_index = self.indexFromDate(prov_path, start_date)
         timestamp = kwargs.get('timestamp', self.timestamp)
 
+        if mint.ndim == 2:
+            mint = mint.reshape((1,) + mint.shape)
+            maxt = maxt.reshape((1,) + maxt.shape)
+        num_days = mint.shape[0]
+        if isinstance(source_tag, (tuple,list)) \
+        and len(source_tag) != num_days:
+            errmsg = '%d source tags were passed for %d days.'
+            raise ValueError, errmsg % (len(source_tag), num_days)
+
         dataset = self.getDataset(prov_path)
         key = dataset.attrs.get('key', 'stats')
-        generate = self._getRegisteredFunction('generators.%s' % key)
-
-        if mint.ndim == 2:
-            num_days = 1
-            record = generate(start_date, timestamp, mint, maxt, source_tag)
-            records = [record,]
-        else:
-            records = [ ]
-            num_days = mint.shape[0]
-            if isinstance(source_tag, (tuple,list)):
-                for day in range(num_days):
-                    date = start_date + datetime.timedelta(days=day)
-                    record = generate(date, timestamp, mint[day], maxt[day],
-                                      source_tag[day])
-                    records.append(record)
-            else: # source is a single string
-                for day in range(num_days):
-                    date = start_date + datetime.timedelta(days=day)
-                    record = generate(date, timestamp, mint[day], maxt[day],
-                                      source_tag)
-                    records.append(record)
-        end_index = start_index + num_days
-        names, formats = zip(*dataset.dtype.descr)
-        provenance = N.rec.fromrecords(records, shape=(num_days,),
-                           formats=list(formats), names=list(names))
-        dataset[start_index:end_index] = provenance
+        # records for all days are written to the dataset at once
+        provenance = N.empty((num_days,), dtype=dataset.dtype)
+
+        record = self._getRegisteredFunction('recorders.%s' % key)
+        if record is not None:
+            record(provenance, start_date, timestamp, mint, maxt, source_tag)
+        else: # generate one record at a time
+            generate = self._getRegisteredFunction('generators.%s' % key)
+            for day in range(num_days):
+                date = start_date + datetime.timedelta(days=day)
+                if isinstance(source_tag, (tuple,list)): tag = source_tag[day]
+                else: tag = source_tag
+                provenance[day] = \
+                    generate(date, timestamp, mint[day], maxt[day], tag)
+
+        dataset[start_index:start_index+num_days] = provenance
 
         return prov_path
 
@@ -210,6 +254,17 @@ class TempextUpdateMethods(TempextAccessMethods):
                      for each item in the time dimension of the temperature
                      arrays.
 
+        Returns
+        --------------------------------------------------------------------
+        list of (first date, last date) tuples for each run of days whose
+        mint/maxt grids were rewritten
+
+        Only days whose data differs from what is already in the file
+        are written to the mint and maxt datasets. Days are compared
+        using a checksum of their packed mint and maxt grids, which is
+        saved in the "checksums" dataset of the temperature group. The
+        provenance and checksums of every day are always updated.
+
         IMPORTANT
         --------------------------------------------------------------------
         This function does not update the validity date attributes >>>
@@ -217,8 +272,117 @@ class TempextUpdateMethods(TempextAccessMethods):
         Use the "updateTempGroupe" method when an update of validity
         date tracking attributes is also required.
         """
-        self.insertTempData(start_date, mint, maxt, **kwargs)
+        if mint.ndim == 2:
+            mint = mint.reshape((1,) + mint.shape)
+            maxt = maxt.reshape((1,) + maxt.shape)
+
+        checksums = self._tempChecksums(mint, maxt, **kwargs)
+        stored = self.storedTempChecksums(start_date, mint.shape[0], **kwargs)
+
+        changed = [ ]
+        for first, last in dayRuns(N.where(checksums != stored)[0]):
+            date = start_date + datetime.timedelta(days=first)
+            self.insertTempData(date, mint[first:last+1], maxt[first:last+1],
+                                **kwargs)
+            changed.append((date, date + datetime.timedelta(days=last-first)))
+
         self.insertTempProvenance(start_date, mint, maxt, source_tag, **kwargs)
+        self._saveTempChecksums(start_date, checksums, **kwargs)
+        return changed
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def storedTempChecksums(self, start_date, num_days, **kwargs):
+        """ Returns the checksums of the mint/maxt grids stored in the
+        file for num_days beginning on start_date. Checksums that were
+        never saved (or were invalidated by insertTempData) are computed
+        from the packed data in the file.
+        """
+        temp_group = self._tempGroupPath(**kwargs)
+        checksum_path = '%s.checksums' % temp_group
+        if self.hasDataset(checksum_path):
+            start_index = self.indexFromDate(checksum_path, start_date)
+            dataset = self.getDataset(checksum_path)
+            checksums = dataset[start_index:start_index+num_days]
+        else: checksums = N.zeros((num_days,), dtype='<u4')
+
+        unknown = N.where(checksums == 0)[0]
+        if len(unknown) > 0:
+            start_index = self.indexFromDate('%s.mint' % temp_group,
+                                             start_date)
+            mint = self.getDataset('%s.mint' % temp_group)
+            maxt = self.getDataset('%s.maxt' % temp_group)
+            for first, last in dayRuns(unknown):
+                first_index = start_index + first
+                last_index = start_index + last + 1
+                checksums[first:last+1] = \
+                    dayChecksums(mint[first_index:last_index],
+                                 maxt[first_index:last_index])
+        return checksums
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def tempRefreshPlan(self, start_date, end_date, **kwargs):
+        """ Determines which days between start_date and end_date need
+        to be downloaded again, based on the processed timestamps in the
+        temperature group's provenance. A day needs to be refreshed when
+        it has never been processed or when it was processed before the
+        last time the source could have revised it.
+
+        Arguments
+        --------------------------------------------------------------------
+        start_date : datetime.date - first day to consider
+        end_date   : datetime.date - last day to consider
+        kwargs     : "available_time" = time of day that the source
+                                        publishes updates (datetime.time or
+                                        tuple). Default is midnight.
+                     "max_gap" = runs of stale days separated by this
+                                 number of current days or fewer are merged
+                                 into one request. Default is 2.
+                     "now" = time used to decide which updates have been
+                             published. Default is the current time.
+                     "revision_days" = number of days after a date that
+                                       the source continues to revise its
+                                       data. Default is 7.
+
+        Returns
+        --------------------------------------------------------------------
+        list of (first date, last date) tuples, one for each request
+        """
+        available_time = kwargs.get('available_time', datetime.time(0))
+        if isinstance(available_time, (tuple,list)):
+            available_time = datetime.time(*available_time)
+        max_gap = kwargs.get('max_gap', 2)
+        now = kwargs.get('now', datetime.datetime.now())
+        revision_days = datetime.timedelta(days=kwargs.get('revision_days',7))
+
+        # time of the most recent update published by the source
+        latest_update = datetime.datetime.combine(now.date(), available_time)
+        if latest_update > now: latest_update -= ONE_DAY
+
+        temp_group = self._tempGroupPath(**kwargs)
+        prov_path = '%s.provenance' % temp_group
+        start_index = self.indexFromDate(prov_path, start_date)
+        end_index = self.indexFromDate(prov_path, end_date)
+        dataset = self.getDataset(prov_path)
+        processed = dataset[start_index:end_index+1]['processed']
+
+        stale = [ ]
+        for day, timestamp in enumerate(processed):
+            timestamp = timestamp.strip()
+            if not timestamp:
+                stale.append(day)
+                continue
+            date = start_date + datetime.timedelta(days=day)
+            final = datetime.datetime.combine(date + revision_days,
+                                              available_time)
+            # timestamps have a fixed format, so they sort as strings
+            if timestamp < min(final, latest_update).strftime(TIMESTAMP):
+                stale.append(day)
+
+        return [ (start_date + datetime.timedelta(days=first),
+                  start_date + datetime.timedelta(days=last))
+                 for first, last in dayRuns(stale, max_gap) ]
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -250,6 +414,36 @@ class TempextUpdateMethods(TempextAccessMethods):
         self.setValidationDates( (prov_path, mint_path, maxt_path),
                                  start_date, mint, **kwargs)
 
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _saveTempChecksums(self, start_date, checksums, **kwargs):
+        temp_group = self._tempGroupPath(**kwargs)
+        checksum_path = '%s.checksums' % temp_group
+        if not self.hasDataset(checksum_path):
+            prov_path = '%s.provenance' % temp_group
+            prov_attrs = self.getDatasetAttributes(prov_path)
+            attrs = { 'description':'CRC32 checksums of daily mint/maxt grids',
+                      'period':'date', }
+            for name in ('start_date','end_date','scope'):
+                if name in prov_attrs: attrs[name] = prov_attrs[name]
+            num_days = self.getDataset(prov_path).shape[0]
+            self.createEmptyDataset(checksum_path, (num_days,),
+                                    N.dtype('<u4'), fill_value=0, **attrs)
+        start_index = self.indexFromDate(checksum_path, start_date)
+        dataset = self.getDataset(checksum_path)
+        dataset[start_index:start_index+len(checksums)] = checksums
+
+    def _tempChecksums(self, mint, maxt, **kwargs):
+        # checksums of the data exactly as it would be stored in the file
+        temp_group = self._tempGroupPath(**kwargs)
+        packed = [ ]
+        for name, data in (('mint',mint), ('maxt',maxt)):
+            path = '%s.%s' % (temp_group, name)
+            dtype = self.getDataset(path).dtype
+            data = self._processDataIn(path, data, **kwargs)
+            packed.append(N.asarray(data, dtype=dtype))
+        return dayChecksums(*packed)
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
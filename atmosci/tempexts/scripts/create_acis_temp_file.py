@@ -7,36 +7,98 @@ import datetime
 
 from atmosci.seasonal.factory import SeasonalStaticFileFactory
 from atmosci.tempexts.factory import TempextsProjectFactory
+from atmosci.utils.pipeline import BuildOrchestrator, serviceSlot
+from atmosci.utils.timeutils import elapsedTime
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+BUILD_START_TIME = datetime.datetime.now()
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def buildTempFile(job):
+    """ Builds the temperature file for one (project, source, region,
+    year) job. Runs in the orchestrator's process pool.
+    """
+    project_name, source_key, region_key, target_year = job
+    region = temps_factory.regionConfig(region_key)
+    source = temps_factory.sourceConfig(source_key)
+
+    start_date = datetime.date(target_year,1,1)
+    end_date = datetime.date(target_year,12,31)
+    if forecast_days > 0: end_date += datetime.timedelta(days=forecast_days)
+
+    # get a temperature data file manger
+    filepath = temps_factory.tempextsFilepath(target_year, source, region)
+    if debug: print 'filepath', os.path.exists(filepath), filepath
+    if os.path.exists(filepath): os.remove(filepath)
+
+    print 'building file :', filepath
+    if verbose: print 'file time span :', start_date, end_date
+    with serviceSlot('hdf5'):
+        builder = temps_factory.tempextsFileBuilder(target_year, source,
+                                region, start_date=start_date,
+                                end_date=end_date, bbox=region.data,
+                                debug=debug)
+        build_kwargs = { }
+        if template is not None: build_kwargs['template'] = template
+        if link_static:
+            build_kwargs['static_file'] = \
+                static_factory.staticGridFilepath(source, region)
+        builder.build(True, True, **build_kwargs)
+        if not link_static:
+            reader = static_factory.staticFileReader(source, region)
+            builder.initLonLatData(reader.lons, reader.lats)
+            reader.close()
+        builder.close()
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 from optparse import OptionParser
 parser = OptionParser()
 
+parser.add_option('-c', action='store', dest='checkpoint', default=None,
+        help='Checkpoint file. Jobs completed in a previous run are skipped.')
 parser.add_option('-d', action='store_true', dest='dev_env', default=False)
 parser.add_option('-f', action='store', dest='forecast_days', default=None)
-parser.add_option('-r', action='store', dest='region', default=None)
-parser.add_option('-s', action='store', dest='source', default=None)
+parser.add_option('-r', action='store', dest='region', default=None,
+        help='Region or comma separated list of regions')
+parser.add_option('-s', action='store', dest='source', default=None,
+        help='Source or comma separated list of sources')
+parser.add_option('-t', action='store', dest='template', default=None,
+        help='Previously built temperature file to clone empty datasets from')
 parser.add_option('-v', action='store_true', dest='verbose', default=False)
+parser.add_option('-w', action='store', type=int, dest='workers', default=1,
+        help='Number of files to build at the same time')
 parser.add_option('-z', action='store_true', dest='debug', default=False)
 
+parser.add_option('--hdf5', action='store', type=int, dest='hdf5_limit',
+        default=None, help='Maximum number of concurrent HDF5 writers')
+parser.add_option('--static', action='store_true', dest='link_static',
+        default=False, help='Link lon/lat to the static file instead of '
+                            'copying them into each file')
+
 options, args = parser.parse_args()
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 debug = options.debug
 dev_env = options.dev_env
+link_static = options.link_static
+template = options.template
 verbose = options.verbose or debug
-print '\ndownload_source_temp_grids.py', args
+print '\ncreate_acis_temp_file.py', args
 
 num_args = len(args)
 if num_args == 0:
     today = datetime.date.today()
     if today.month == 12 and today.day >= 30:
-        target_year = today.year + 1
+        target_years = [today.year + 1,]
     else: 
-        target_year = today.year
-else: target_year = int(args[0])
+        target_years = [today.year,]
+elif num_args == 2:
+    target_years = [year for year in range(int(args[0]),int(args[1])+1)]
+else: target_years = [int(arg) for arg in args]
 
 temps_factory = TempextsProjectFactory()
 if dev_env: temps_factory.useDevEnv()
@@ -45,31 +107,33 @@ project = temps_factory.projectConfig()
 static_factory = \
     SeasonalStaticFileFactory(temps_factory.config, temps_factory.registry)
 
-region = temps_factory.regionConfig(options.region)
-source = temps_factory.sourceConfig(options.source)
+if options.region is None: region_keys = [None,]
+else: region_keys = options.region.split(',')
+if options.source is None: source_keys = [None,]
+else: source_keys = options.source.split(',')
 
 if options.forecast_days is not None:
     forecast_days = int(options.forecast_days)
 else: forecast_days = project.get('forecast_days', 0)
 if debug: print 'forecast_days :', forecast_days
 
-start_date = datetime.date(target_year,1,1)
-end_date = datetime.date(target_year,12,31)
-if forecast_days > 0: end_date += datetime.timedelta(days=forecast_days)
-
-# get a temperature data file manger
-filepath = temps_factory.tempextsFilepath(target_year, source, region)
-if debug: print 'filepath', os.path.exists(filepath), filepath
-if os.path.exists(filepath): os.remove(filepath)
-
-print 'building file :', filepath
-if verbose: print 'file time span :', start_date, end_date
-builder = temps_factory.tempextsFileBuilder(target_year, source, region,
-                        start_date=start_date, end_date=end_date,
-                        bbox=region.data, debug=debug)
-builder.build(True, True)
-reader = static_factory.staticFileReader(source, region)
-builder.initLonLatData(reader.lons, reader.lats)
-reader.close()
-builder.close()
-
+# build the matrix of jobs, using the config names for defaults
+jobs = [ ]
+for source_key in source_keys:
+    source_key = temps_factory.sourceConfig(source_key).name
+    for region_key in region_keys:
+        region_key = temps_factory.regionConfig(region_key).name
+        for target_year in target_years:
+            jobs.append(('tempexts', source_key, region_key, target_year))
+
+orchestrator = BuildOrchestrator(buildTempFile, options.workers,
+                                 {'hdf5':options.hdf5_limit},
+                                 options.checkpoint)
+orchestrator.run(jobs)
+
+for key, errmsg in orchestrator.failed:
+    print '\nbuild failed for %s :\n%s' % (key, errmsg)
+print '\n'.join(orchestrator.report())
+
+elapsed_time = elapsedTime(BUILD_START_TIME, True)
+print 'completed %d build jobs in %s' % (len(jobs), elapsed_time)
@@ -20,6 +20,12 @@ parser.add_option('--nd', action='store', type='int', dest='num_days',
                   help='number of days to refresh after entered date',
                   default=None)
 
+parser.add_option('-a', action='store_true', dest='refresh_all',
+                  help='download every day in the time span, not just days'
+                       ' that are missing or stale', default=False)
+parser.add_option('-g', action='store', type='int', dest='max_gap',
+                  help='merge requests separated by this many current days',
+                  default=2)
 parser.add_option('-r', action='store', dest='region', default=None)
 parser.add_option('-s', action='store', dest='source', default=None)
 parser.add_option('-v', action='store_true', dest='verbose', default=False)
@@ -81,6 +87,7 @@ else:
 
 # get get temperature data file manger
 manager = factory.tempextsFileManager(start_date.year, source, region, 'r')
+if end_date is None: end_date = start_date
 print 'refreshing temperature extremes in :\n', manager.filepath
 # be sure to request data for the same grid that is already in the file
 acis_grid = manager.datasetAttribute('temps.maxt', 'acis_grid')
@@ -88,7 +95,7 @@ acis_grid = manager.datasetAttribute('temps.maxt', 'acis_grid')
 last_obs_date = manager.datasetAttribute('temps.maxt', 'last_obs_date')
 last_valid_date = manager.datasetAttribute('temps.maxt', 'last_valid_date')
 
-if end_date is not None:
+if end_date != start_date:
     # refresh start date cannot be earlier than first day in datasets
     # this is only relevant at the beginning of a new year
     data_limit = manager.dateAttribute('temps.maxt', 'start_date')
@@ -113,6 +120,17 @@ else:
         raise ValueError, errmsg % (str(start_date),target_date.year)
     print '    refreshing data for', str(start_date)
 
+# only request the days that are missing or may have been revised by ACIS
+if options.refresh_all: requests = [(start_date, end_date),]
+else:
+    requests = manager.tempRefreshPlan(start_date, end_date,
+                       available_time=source.earliest_available_time,
+                       max_gap=options.max_gap,
+                       revision_days=source.get('revision_days', 7))
+num_requested = sum([(last - first).days + 1 for first, last in requests])
+print '    requesting %d of %d days in %d requests' % (num_requested,
+                     (end_date - start_date).days + 1, len(requests))
+data_bbox = manager.data_bbox
 manager.close()
 
 # filter annoying numpy warnings
@@ -123,15 +141,23 @@ warnings.filterwarnings('ignore',"invalid value encountered in less")
 warnings.filterwarnings('ignore',"Mean of empty slice")
 # MUST ALSO TURN OFF WARNING FILTERS AT END OF SCRIPT !!!!!
 
-# download current ACIS mint,maxt for time span
-data = factory.getAcisGridData(int(acis_grid), 'mint,maxt', start_date,
-                               end_date, False, bbox=manager.data_bbox, 
-                               debug=debug)
-if debug: print 'temp data\n', data, '\n'
+for first_date, last_date in requests:
+    # download current ACIS mint,maxt for time span
+    if verbose: print '    downloading', first_date, 'thru', last_date
+    data = factory.getAcisGridData(int(acis_grid), 'mint,maxt', first_date,
+                                   last_date, False, bbox=data_bbox,
+                                   debug=debug)
+    if debug: print 'temp data\n', data, '\n'
+
+    # only days that have changed are written to the mint/maxt grids
+    manager.open('a')
+    changed = manager.refreshTempGroup(first_date, data['mint'],
+                                       data['maxt'], source.tag)
+    manager.close()
+    for first, last in changed:
+        print '    rewrote', first, 'thru', last
+    del data
 
-manager.open('a')
-manager.updateTempGroup(start_date, data['mint'], data['maxt'], source.tag)
-manager.close()
 # REFRESH MUST NEVER CHANGE ORIGINAL last_obs_date or last_valid_date !!
 manager.open('a')
 manager.setDatasetAttribute('temps.maxt', 'last_obs_date', last_obs_date)
@@ -6,8 +6,10 @@ from copy import deepcopy
 
 BOGUS_VALUE = "~!@#$%^&*()-+=|}{:;<>?"
 GETATTR_FAILED = hash('attribute/object path lookup failed')
-RESERVED = ('__ATTRIBUTES__', '__CHILDREN__', '__RESERVED__', 
+NOT_CACHED = object()
+RESERVED = ('__ATTRIBUTES__', '__CHILDREN__', '__PATHCACHE__', '__RESERVED__',
             'name', 'parent', 'proper_name')
+UNCACHEABLE = ('attributes', 'children', 'dict')
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -97,6 +99,7 @@ class ConfigObject(object):
         self.__dict__['isOrdered'] = False
         self.__dict__['__ATTRIBUTES__'] = { }
         self.__dict__['__CHILDREN__'] = { }
+        self.__dict__['__PATHCACHE__'] = None
         self.__dict__['__RESERVED__'] = RESERVED
 
         self._set_name_(name)
@@ -136,6 +139,8 @@ class ConfigObject(object):
             del self.__dict__['__CHILDREN__'][config_obj.name]
         self.__dict__['__CHILDREN__'][config_obj.name] = config_obj
         config_obj.__dict__['parent'] = self
+        self._tree_changed_()
+        if self.is_compiled: config_obj.compile()
 
     def addChildren(self, *children):
         for item in children:
@@ -146,6 +151,7 @@ class ConfigObject(object):
             else:
                 errmsg = '"%s" is an invalid type for a child of ConfigObject,'
                 TypeError, errmsg % type(item)
+        self._tree_changed_()
 
     def asDict(self):
         me = { 'name':self.name, }
@@ -161,6 +167,33 @@ class ConfigObject(object):
 
     def clear(self):
         self.__dict__['__CHILDREN__'].clear()
+        self._tree_changed_()
+
+    def compile(self):
+        """ Switch this config tree to compiled mode. Every path below
+        each object in the tree is flattened once into a path->value
+        dictionary so that find(), get(), item and attribute access are
+        simple dictionary lookups. The cache is rebuilt on demand after
+        any change to the tree.
+
+        Compiled mode is opt-in : call it on a config tree only after it
+        is complete. Changes made to a linked child do not clear the path
+        cache of the tree it is linked into.
+        """
+        self.__dict__['__PATHCACHE__'] = { }
+        for child in self.__dict__['__CHILDREN__'].values():
+            child.compile()
+        self._flatten_paths_('', self.__dict__['__PATHCACHE__'])
+
+    def decompile(self):
+        """ Turn off compiled mode and discard all cached paths """
+        self.__dict__['__PATHCACHE__'] = None
+        for child in self.__dict__['__CHILDREN__'].values():
+            child.decompile()
+
+    def _is_compiled_(self):
+        return self.__dict__.get('__PATHCACHE__', None) is not None
+    is_compiled = property(_is_compiled_)
 
     def copy(self, new_name=None, parent=None):
         if new_name is None: name = self.name
@@ -181,6 +214,24 @@ class ConfigObject(object):
             raise TypeError, "Invalid type for 'obj' argument : %s" % type(obj)
 
     def find(self, path, default=BOGUS_VALUE):
+        cache = self._path_cache_()
+        if cache is not None:
+            # flattened paths do not include my own name
+            _path = self._path_to_list_(path)
+            if self._is_my_name_(_path[0]): _path = _path[1:]
+            if _path and _path[-1] not in UNCACHEABLE + ('self',):
+                value = cache.get(self._path_to_key_(_path), NOT_CACHED)
+                if value is not NOT_CACHED: return value
+            # paths that are not in the tree are memoized on first use
+            key = ('find', self._path_to_key_(path))
+            value = cache.get(key, NOT_CACHED)
+            if value is not NOT_CACHED: return value
+            value = self._find_path_(path, default)
+            if self._is_cacheable_(path, value, default): cache[key] = value
+            return value
+        return self._find_path_(path, default)
+
+    def _find_path_(self, path, default=BOGUS_VALUE):
         _path = self._path_to_list_(path)
         # check to see if my own name is at the beginning of the path
         if self._is_my_name_(_path[0]):
@@ -233,6 +284,8 @@ class ConfigObject(object):
                 raise LookupError, errmsg % path
             else:
                 link_to.__dict__['__CHILDREN__'][link_name] = config.obj
+                link_to._tree_changed_()
+        self._tree_changed_()
 
     def merge(self, obj):
         if isinstance(obj, ConfigObject):
@@ -251,6 +304,7 @@ class ConfigObject(object):
                 self._ingest_(key, value)
         else:
             raise TypeError, "Invalid type for 'obj' argument : %s" % type(obj)
+        self._tree_changed_()
 
     def move(self, from_key, to_key):
         child = self.__dict__['__CHILDREN__'].get(from_key, None)
@@ -264,6 +318,7 @@ class ConfigObject(object):
             self.__dict__['__CHILDREN__'][to_key] = value
             self.__dict__['__CHILDREN__'][from_key] = None
             del self.__dict__['__CHILDREN__'][from_key]
+        self._tree_changed_()
 
     def newChild(self, path, obj=None):
         if '.' not in path:
@@ -424,7 +479,7 @@ class ConfigObject(object):
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def get(self, path, default=None):
-        return self._get_value_of_(self._path_to_list_(path), default)
+        return self._cached_value_of_(path, default)
 
     def set(self, **kwargs):
         for path, _value in kwargs.items():
@@ -473,11 +528,13 @@ class ConfigObject(object):
         if child is not None:
             child._delete_children_()
             del self.__dict__['__CHILDREN__'][name]
+            self._tree_changed_()
 
     def _delete_children_(self):
         for key, child in self.__dict__['__CHILDREN__'].items():
             child._delete_children_()
             del self.__dict__['__CHILDREN__'][key]
+        self._tree_changed_()
 
     def _delete_tree_(self, path):
         child = self.__dict__['__CHILDREN__'].get(path[0], None)
@@ -485,6 +542,7 @@ class ConfigObject(object):
             if len(path) > 1:
                 child._delete_tree_(path[1:])
             del self.__dict__['__CHILDREN__'][path[0]]
+            self._tree_changed_()
 
     def _dict_keys_(): return self.__dict__.keys()
     dict_keys = property(_dict_keys_)
@@ -536,6 +594,34 @@ class ConfigObject(object):
         errmsg = '"%s" does not correspond to any object'
         raise KeyError, errmsg % '.'.join(path)
 
+    def _cached_value_of_(self, path, default=GETATTR_FAILED):
+        cache = self._path_cache_()
+        if cache is None:
+            return self._get_value_of_(self._path_to_list_(path), default)
+        key = self._path_to_key_(path)
+        value = cache.get(key, NOT_CACHED)
+        if value is not NOT_CACHED: return value
+        value = self._get_value_of_(self._path_to_list_(path), default)
+        if self._is_cacheable_(path, value, default): cache[key] = value
+        return value
+
+    def _flatten_paths_(self, prefix, cache):
+        # None attributes are left out, lookups treat them as missing
+        for key, value in self.__dict__['__ATTRIBUTES__'].items():
+            if value is not None: cache['%s%s' % (prefix, key)] = value
+        for name, child in self.__dict__['__CHILDREN__'].items():
+            path = '%s%s' % (prefix, name)
+            cache[path] = child
+            child._flatten_paths_('%s.' % path, cache)
+
+    def _path_cache_(self):
+        # returns None when not compiled, flattens the tree again when a
+        # change has cleared the cache
+        cache = self.__dict__.get('__PATHCACHE__', None)
+        if cache is not None and not cache:
+            self._flatten_paths_('', cache)
+        return cache
+
     def _get_value_of_(self, path, default=GETATTR_FAILED):
         path_len = len(path)
         key = path[0]
@@ -562,6 +648,7 @@ class ConfigObject(object):
     def _ingest_(self, key, value, must_be_object=False):
         if key in self.__dict__['__RESERVED__']:
             raise KeyError, 'Path contains a reserved name key "%s"' % key
+        self._tree_changed_()
         if self.has_key(key): self._delete_child_(key)
 
         if isinstance(value, OrderedDict):
@@ -590,9 +677,21 @@ class ConfigObject(object):
     def _is_convertable_(self, obj):
         return isinstance(obj, (ConfigObject, OrderedDict, dict))
 
+    def _is_cacheable_(self, path, value, default):
+        if value is default: return False
+        key = self._path_to_key_(path)
+        if '*' in key: return False
+        return key.split('.')[-1] not in UNCACHEABLE
+
     def _is_my_name_(self, name):
         return name == self.name
 
+    def _path_to_key_(self, path):
+        if isinstance(path, basestring): return path
+        elif isinstance(path, (tuple,list)):
+            return '.'.join([str(key) for key in path])
+        return str(path)
+
     def _path_to_list_(self, path):
         if isinstance(path, basestring): return path.split('.')
         elif isinstance(path, (tuple,list)): return path
@@ -628,7 +727,17 @@ class ConfigObject(object):
         if self.parent is None: return self
         else: return self.parent._top_()
 
+    def _tree_changed_(self):
+        # a change anywhere in the tree invalidates every cached path
+        # from here up to the top of the tree
+        config = self
+        while config is not None:
+            if config.__dict__.get('__PATHCACHE__', None):
+                config.__dict__['__PATHCACHE__'] = { }
+            config = config.__dict__.get('parent', None)
+
     def _update_(self, obj):
+        self._tree_changed_()
         for key, child in obj.__dict__['__CHILDREN__'].items():
             if key in self.__dict__['__CHILDREN__']:
                 self.__dict__['__CHILDREN__'][key]._update_(child)
@@ -666,7 +775,7 @@ class ConfigObject(object):
         self._delete_tree_(self._path_to_list_(path))
 
     def __getattr__(self, path):
-        value = self._get_value_of_(self._path_to_list_(path), GETATTR_FAILED)
+        value = self._cached_value_of_(path, GETATTR_FAILED)
         try:
             if value != GETATTR_FAILED: return value
         except: # will get here if value is an 'object'
@@ -674,7 +783,7 @@ class ConfigObject(object):
         raise KeyError, '"%s" is an invalid key' % path
 
     def __getitem__(self, path):
-        value = self._get_value_of_(self._path_to_list_(path), None)
+        value = self._cached_value_of_(path, None)
         if value is not None: return value
         raise KeyError, '"%s" is an invalid key' % path
 
@@ -752,6 +861,7 @@ class OrderedConfigObject(ConfigObject):
         self.__dict__['isOrdered'] = True
         self.__dict__['__ATTRIBUTES__'] = OrderedDict()
         self.__dict__['__CHILDREN__'] = OrderedDict()
+        self.__dict__['__PATHCACHE__'] = None
         self.__dict__['__RESERVED__'] = RESERVED
 
         self._set_name_(name)
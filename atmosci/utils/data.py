@@ -1,4 +1,6 @@
 
+import operator
+
 import numpy as N
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -209,6 +211,115 @@ def listToWhere(list_or_tuple):
     if constraints is None: return None
     return 'N.where(%s)' % constraints
 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# criteria rules : evaluated directly as boolean masks, no eval required
+# a rule is either (dataset_name, operator, value) or a group of rules
+# (combine, (rule, rule, ...)) where combine is '&' or '|'
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+RULE_FUNCTIONS = { 'N.isnan':N.isnan, 'N.isinf':N.isinf,
+                   'N.isfinite':N.isfinite }
+RULE_OPERATORS = { '==':operator.eq, '!=':operator.ne, '<':operator.lt,
+                   '<=':operator.le, '>':operator.gt, '>=':operator.ge, }
+RULE_COMBINERS = { '&':'&', 'and':'&', '|':'|', 'or':'|' }
+
+def bboxToRules(bbox):
+    if isinstance(bbox, basestring): bbox = stringToBbox(bbox)
+    return [ ('lon', '>=', bbox[0]), ('lon', '<=', bbox[2]),
+             ('lat', '>=', bbox[1]), ('lat', '<=', bbox[3]) ]
+
+def dictToRules(_dict):
+    if _dict is None: return None
+
+    rules = [ ]
+    for key, constraint in _dict.items():
+        if constraint is None: continue
+
+        if key == 'bbox':
+            rules.extend(bboxToRules(constraint))
+        elif isinstance(constraint, basestring):
+            if constraint in RULE_FUNCTIONS:
+                rules.append((key, constraint, None))
+            else: rules.append((key, '==', constraint))
+        elif isinstance(constraint, (tuple,list)):
+            if len(constraint) == 1:
+                if constraint[0] in RULE_FUNCTIONS:
+                    rules.append((key, constraint[0], None))
+                else: rules.append((key, '==', constraint[0]))
+            else: # (operator, value) or (operator, value, format)
+                rules.append((key, constraint[0], constraint[1]))
+        else:
+            rules.append((key, '==', constraint))
+
+    if rules: return rules
+    return None
+
+def listToRules(list_or_tuple):
+    rules = [ ]
+
+    for constraint in list_or_tuple:
+        if constraint[0] == 'bbox':
+            rules.extend(bboxToRules(constraint[1]))
+        elif constraint[0] in RULE_COMBINERS:
+            group = listToRules(constraint[1])
+            if group: rules.append((RULE_COMBINERS[constraint[0]], group))
+        elif len(constraint) == 2:
+            if constraint[1] in RULE_FUNCTIONS:
+                rules.append((constraint[0], constraint[1], None))
+            else: rules.append((constraint[0], '==', constraint[1]))
+        elif len(constraint) in (3,4):
+            rules.append(tuple(constraint[:3]))
+
+    if rules: return rules
+    return None
+
+def criteriaToRules(criteria):
+    if isinstance(criteria, dict): return dictToRules(criteria)
+    elif isinstance(criteria, (list,tuple)): return listToRules(criteria)
+    errmsg = 'Invalid type for filter criteria : %s'
+    raise TypeError, errmsg % type(criteria)
+
+def ruleDatasets(rules):
+    """ returns a list of the dataset names referenced in rules """
+    names = [ ]
+    for rule in rules:
+        if rule[0] in RULE_COMBINERS: group = ruleDatasets(rule[1])
+        else: group = [rule[0],]
+        for name in group:
+            if name not in names: names.append(name)
+    return names
+
+def ruleToMask(rule, data):
+    name, _operator, value = rule
+    function = RULE_FUNCTIONS.get(_operator, None)
+    if function is not None: return function(data)
+    compare = RULE_OPERATORS.get(_operator, None)
+    if compare is None:
+        raise ValueError, 'Unsupported operator in rule : %s' % str(rule)
+    with N.errstate(invalid='ignore'):
+        return N.asarray(compare(data, value))
+
+def rulesToMask(rules, getData, combine='&'):
+    """ Evaluate rules as a boolean mask. getData is called with a
+    dataset name and must return the data to evaluate the rule against.
+    Evaluation stops as soon as the result can no longer change, so
+    datasets in later rules may never be requested.
+    """
+    mask = None
+    for rule in rules:
+        if rule[0] in RULE_COMBINERS:
+            rule_mask = rulesToMask(rule[1], getData, rule[0])
+        else: rule_mask = ruleToMask(rule, getData(rule[0]))
+
+        if mask is None: mask = rule_mask.copy()
+        elif combine == '&': N.logical_and(mask, rule_mask, mask)
+        else: N.logical_or(mask, rule_mask, mask)
+
+        if combine == '&':
+            if not mask.any(): break
+        elif mask.all(): break
+    return mask
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 def replaceInvalid(numpy_array, replace_with, missing_value=N.nan):
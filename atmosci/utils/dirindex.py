@@ -0,0 +1,92 @@
+""" Cached directory listings for answering file availability queries
+from memory instead of probing the file system once per file.
+"""
+
+import os
+import time
+
+import numpy as N
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class DirectoryIndex(object):
+    """ Lists each directory once and keeps the set of filenames in it.
+    A directory is only listed again when its modification time changes,
+    and the modification time itself is rechecked no more often than
+    once every max_age seconds. Directories that do not exist are cached
+    as empty and will be picked up once they are created.
+
+    Arguments:
+    ---------
+        max_age: seconds before a cached directory's mtime is rechecked.
+                 Use 0 to always recheck and None to never recheck.
+    """
+
+    def __init__(self, max_age=30.):
+        self.directories = { }
+        self.max_age = max_age
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def availableMask(self, filepaths):
+        """ Returns a boolean array that is True for each file in the
+        sequence of filepaths that exists.
+        """
+        return N.array([self.exists(path) for path in filepaths], dtype=bool)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def exists(self, filepath):
+        dirpath, filename = os.path.split(filepath)
+        return filename in self.filenames(dirpath)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def filenames(self, dirpath):
+        """ Returns a frozenset with the names of all files in dirpath.
+        """
+        now = time.time()
+        cached = self.directories.get(dirpath, None)
+        if cached is not None:
+            mtime, checked, filenames = cached
+            if self.max_age is None or (now - checked) < self.max_age:
+                return filenames
+            if self._mtime(dirpath) == mtime:
+                self.directories[dirpath] = (mtime, now, filenames)
+                return filenames
+        return self._listDirectory(dirpath, now)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def lastAvailable(self, filepaths):
+        """ Returns the index of the last file in the sequence of
+        filepaths that exists or None when none of them exist.
+        """
+        for indx in range(len(filepaths)-1, -1, -1):
+            if self.exists(filepaths[indx]): return indx
+        return None
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def refresh(self, dirpath=None):
+        """ Forces the directory (or all directories when dirpath is None)
+        to be listed again the next time it is used.
+        """
+        if dirpath is None: self.directories = { }
+        elif dirpath in self.directories: del self.directories[dirpath]
+
+    # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+    def _listDirectory(self, dirpath, now):
+        mtime = self._mtime(dirpath)
+        if mtime is None: filenames = frozenset()
+        else: filenames = frozenset(os.listdir(dirpath))
+        self.directories[dirpath] = (mtime, now, filenames)
+        return filenames
+
+    def _mtime(self, dirpath):
+        try:
+            return os.stat(dirpath).st_mtime
+        except OSError: # directory does not exist
+            return None
+
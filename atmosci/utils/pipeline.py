@@ -0,0 +1,452 @@
+""" Simple staged pipeline utilities : a pool of processes to do the
+expensive (CPU bound) work and a single writer thread per output file
+fed by a bounded queue, so that writes to any one file are serialized
+while work for other files proceeds in parallel.
+
+Also includes a build orchestrator that runs a matrix of independent
+file build jobs in a pool of processes, with a limit on the number of
+jobs using each external service at the same time and a checkpoint file
+so that a rerun skips jobs that have already been completed.
+"""
+
+import os
+import itertools
+import multiprocessing
+import threading
+import time
+import traceback
+import Queue
+
+from collections import OrderedDict
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+WRITER_DONE = '__writer_done__'
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class StageTimer(object):
+    """ Thread safe accumulator for the time spent in named pipeline
+    stages and the number of times each stage was entered.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = OrderedDict()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def add(self, stage, seconds, count=1):
+        self.lock.acquire()
+        try:
+            total, calls = self.stages.get(stage, (0., 0))
+            self.stages[stage] = (total + seconds, calls + count)
+        finally:
+            self.lock.release()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def report(self, indent='    '):
+        """ Returns a list of formatted lines, one per stage.
+        """
+        lines = [ ]
+        for stage, (total, calls) in self.stages.items():
+            if calls > 0: mean = total / calls
+            else: mean = 0.
+            info = (indent, stage, total, calls, mean)
+            lines.append('%s%-12s : %9.3f sec in %d calls (%.4f sec/call)' % info)
+        return lines
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def start(self):
+        return time.time()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def stop(self, stage, started, count=1):
+        elapsed = time.time() - started
+        self.add(stage, elapsed, count)
+        return elapsed
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class SerialWriter(threading.Thread):
+    """ Thread that passes each item placed in its bounded queue to
+    a single writer object, one at a time and in the order they were
+    queued.
+
+    The writer object must have a write(item) method and may have
+    idle() and close() methods. idle() is called whenever the queue
+    has been drained (a good time to close the file) and close() is
+    called once after the last item has been written.
+
+    Exceptions raised by the writer are saved (the queue continues to be
+    drained so that producers never block) and are available after
+    finish() as the errors attribute.
+    """
+
+    def __init__(self, key, writer, max_depth=4, timer=None):
+        threading.Thread.__init__(self, name='writer:%s' % str(key))
+        self.daemon = True
+        self.errors = [ ]
+        self.key = key
+        self.max_depth = max_depth
+        self.queue = Queue.Queue(max_depth)
+        if timer is None: self.timer = StageTimer()
+        else: self.timer = timer
+        self.writer = writer
+        # queue depth statistics
+        self.depth_max = 0
+        self.depth_samples = 0
+        self.depth_total = 0
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def depthStats(self):
+        """ Returns tuple of (maximum, mean) queue depth seen by put().
+        """
+        if self.depth_samples > 0:
+            mean = float(self.depth_total) / self.depth_samples
+        else: mean = 0.
+        return self.depth_max, mean
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def finish(self):
+        self.queue.put(WRITER_DONE)
+        self.join()
+        return self.errors
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def put(self, item):
+        depth = self.queue.qsize()
+        self.depth_max = max(self.depth_max, depth)
+        self.depth_samples += 1
+        self.depth_total += depth
+        if depth >= self.max_depth:
+            started = self.timer.start()
+            self.queue.put(item)
+            self.timer.stop('queue full', started)
+        else: self.queue.put(item)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is WRITER_DONE: break
+            if self.errors: continue # drain without writing
+            started = self.timer.start()
+            try:
+                self.writer.write(item)
+                if self.queue.empty() and hasattr(self.writer, 'idle'):
+                    self.writer.idle()
+            except Exception as e:
+                self.errors.append(e)
+            self.timer.stop('write', started)
+
+        if hasattr(self.writer, 'close'):
+            try:
+                self.writer.close()
+            except Exception as e:
+                self.errors.append(e)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class WriterPool(object):
+    """ Manages one SerialWriter per key (e.g. output file path). Writers
+    are created on demand by calling writerFactory(key).
+    """
+
+    def __init__(self, writerFactory, max_depth=4, timer=None):
+        self.max_depth = max_depth
+        if timer is None: self.timer = StageTimer()
+        else: self.timer = timer
+        self.writerFactory = writerFactory
+        self.writers = OrderedDict()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def depthReport(self, indent='    '):
+        lines = [ ]
+        for key, writer in self.writers.items():
+            max_depth, mean_depth = writer.depthStats()
+            info = (indent, key, max_depth, writer.max_depth, mean_depth)
+            lines.append('%s%s : max queue depth %d of %d, mean %.2f' % info)
+        return lines
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def finish(self):
+        """ Waits for all writers to finish. Returns a dictionary of
+        errors reported by each writer that failed.
+        """
+        errors = { }
+        for key, writer in self.writers.items():
+            writer_errors = writer.finish()
+            if writer_errors: errors[key] = writer_errors
+        return errors
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def put(self, key, item):
+        writer = self.writers.get(key, None)
+        if writer is None:
+            writer = SerialWriter(key, self.writerFactory(key),
+                                  self.max_depth, self.timer)
+            self.writers[key] = writer
+            writer.start()
+        writer.put(item)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def orderedMap(function, jobs, processes=1, timer=None):
+    """ Generator that returns function(job) for each job in the order
+    that the jobs were passed. When processes > 1, the function calls
+    run in a pool of worker processes. Otherwise, they run serially in
+    the current process.
+
+    When timer is passed, the time spent waiting for each result is
+    accumulated as the 'wait' stage.
+    """
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(function, jobs, 1)
+    else:
+        pool = None
+        results = itertools.imap(function, jobs)
+
+    completed = False
+    try:
+        while True:
+            if timer is not None: started = timer.start()
+            try:
+                result = results.next()
+            except StopIteration:
+                break
+            if timer is not None: timer.stop('wait', started)
+            yield result
+        completed = True
+    finally:
+        if pool is not None:
+            # abandon unfinished jobs when the consumer quits early
+            if completed: pool.close()
+            else: pool.terminate()
+            pool.join()
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# build job orchestration
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# per process state used by serviceSlot, initialized by BuildOrchestrator
+SERVICE_LIMITS = { }
+JOB_TIMER = StageTimer()
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class serviceSlot(object):
+    """ Context manager that limits the number of build jobs using an
+    external service (e.g. 'acis' downloads or 'hdf5' writes) at the
+    same time. The time spent waiting for the service and the time spent
+    using it are accumulated by the current job's timer.
+
+    Outside of a BuildOrchestrator, or for a service without a limit,
+    it only does the timing.
+
+        with serviceSlot('acis'):
+            data = factory.getAcisGridData(...)
+    """
+
+    def __init__(self, service):
+        self.semaphore = SERVICE_LIMITS.get(service, None)
+        self.service = service
+
+    def __enter__(self):
+        if self.semaphore is not None:
+            started = JOB_TIMER.start()
+            self.semaphore.acquire()
+            JOB_TIMER.stop('%s wait' % self.service, started)
+        self.started = JOB_TIMER.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        JOB_TIMER.stop(self.service, self.started)
+        if self.semaphore is not None: self.semaphore.release()
+        return False
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class BuildCheckpoint(object):
+    """ Keeps track of completed build jobs in a text file with the key
+    of one job per line. Each key is written as soon as its job is
+    completed, so the file is current even when a run is interrupted.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.completed = set()
+        if os.path.exists(filepath):
+            with open(filepath, 'r') as checkpoint:
+                for line in checkpoint:
+                    key = line.strip()
+                    if key: self.completed.add(key)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def __contains__(self, key):
+        return key in self.completed
+
+    def __len__(self):
+        return len(self.completed)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def record(self, key):
+        if key in self.completed: return
+        with open(self.filepath, 'a') as checkpoint:
+            checkpoint.write('%s\n' % key)
+        self.completed.add(key)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class BuildOrchestrator(object):
+    """ Runs a list of independent build jobs, each of which is a tuple
+    such as (project, source, region, year), in a pool of processes.
+
+    Arguments:
+    ---------
+        build_function: function that builds the file(s) for one job.
+                        It is passed the job tuple and must be defined
+                        at module level so the pool can find it. Wrap
+                        each use of an external service in serviceSlot.
+        processes: number of jobs to run at the same time. When it is 1,
+                   the jobs run serially in the current process.
+        service_limits: dictionary with the maximum number of jobs that
+                        may use each external service at the same time.
+                        e.g. {'acis':2, 'hdf5':4}
+        checkpoint: optional path to the checkpoint file. Jobs that are
+                    already in the file are skipped.
+    """
+
+    def __init__(self, build_function, processes=1, service_limits=None,
+                       checkpoint=None):
+        self.build_function = build_function
+        if checkpoint is not None:
+            self.checkpoint = BuildCheckpoint(checkpoint)
+        else: self.checkpoint = None
+        self.failed = [ ]
+        self.processes = max(int(processes), 1)
+        self.results = [ ]
+        if service_limits is None: self.service_limits = { }
+        else: self.service_limits = dict(service_limits)
+        self.skipped = [ ]
+        self.timer = StageTimer()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def jobKey(self, job):
+        return ':'.join([str(item) for item in job])
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def report(self, indent='    '):
+        """ Returns a list of formatted lines summarizing the run : the
+        time for each job plus the total time in each stage, including
+        the time jobs waited for each external service.
+        """
+        lines = [ ]
+        info = (len(self.results), len(self.failed), len(self.skipped))
+        lines.append('%d jobs run, %d failed, %d skipped' % info)
+        for key, elapsed, errmsg in self.results:
+            if errmsg is None:
+                lines.append('%s%-36s %9.3f sec' % (indent, key, elapsed))
+            else: lines.append('%s%-36s FAILED' % (indent, key))
+        lines.extend(self.timer.report(indent))
+        return lines
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def run(self, jobs, callback=None):
+        """ Runs the jobs and returns the list of (job key, elapsed
+        seconds, error message) for each job that was run. Results are
+        in the order the jobs finished. Error message is None for jobs
+        that succeeded.
+
+        When callback is passed, it is called with each result as soon
+        as the job finishes.
+        """
+        todo = [ ]
+        for job in jobs:
+            key = self.jobKey(job)
+            if self.checkpoint is not None and key in self.checkpoint:
+                self.skipped.append(key)
+            else: todo.append((key, job))
+        if not todo: return [ ]
+
+        limits = { }
+        for service, limit in self.service_limits.items():
+            if limit is not None and limit < self.processes:
+                limits[service] = multiprocessing.BoundedSemaphore(limit)
+
+        started = self.timer.start()
+        if self.processes > 1:
+            pool = multiprocessing.Pool(min(self.processes, len(todo)),
+                                        _initBuildWorker, (limits,))
+            results = pool.imap_unordered(_runBuildJob,
+                          [(self.build_function, key, job)
+                           for key, job in todo], 1)
+        else:
+            pool = None
+            _initBuildWorker(limits)
+            results = itertools.imap(_runBuildJob,
+                          [(self.build_function, key, job)
+                           for key, job in todo])
+
+        completed = False
+        try:
+            for key, elapsed, stages, errmsg in results:
+                for stage, (seconds, calls) in stages.items():
+                    self.timer.add(stage, seconds, calls)
+                if errmsg is None:
+                    self.timer.add('job', elapsed)
+                    if self.checkpoint is not None:
+                        self.checkpoint.record(key)
+                else: self.failed.append((key, errmsg))
+                result = (key, elapsed, errmsg)
+                self.results.append(result)
+                if callback is not None: callback(result)
+            completed = True
+        finally:
+            if pool is not None:
+                if completed: pool.close()
+                else: pool.terminate()
+                pool.join()
+            self.timer.stop('total', started)
+
+        return self.results
+
+
+# - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - # - - - #
+
+def _initBuildWorker(limits):
+    SERVICE_LIMITS.clear()
+    SERVICE_LIMITS.update(limits)
+
+def _runBuildJob(args):
+    build_function, key, job = args
+    JOB_TIMER.stages.clear()
+    started = time.time()
+    try:
+        build_function(job)
+        errmsg = None
+    except Exception:
+        errmsg = traceback.format_exc()
+    return key, time.time() - started, dict(JOB_TIMER.stages), errmsg
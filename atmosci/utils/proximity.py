@@ -4,6 +4,8 @@ import sys
 
 import numpy as N
 
+from atmosci.utils.windows import gridWindowRegistry, nodesInBBoxWindow
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 RELATIVE_INDEXES = {  9 : ( (-1, -1, -1,  0, 0, 0,  1, 1, 1),
@@ -74,19 +76,17 @@ def indexesOfNeighborNodes(target_lon, target_lat, relative_nodes,
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 def nodesInBBox(bbox, lons, lats, grid):
-    max_lon = max(bbox[0], bbox[2])
-    min_lon = min(bbox[0], bbox[2])
-    max_lat = max(bbox[1], bbox[3])
-    min_lat = min(bbox[1], bbox[3])
-    indexes = N.where( (lons >= min_lon) & (lats >= min_lat) &
-                        (lons <= max_lon) & (lats <= max_lat) )
-
-    # i/x is in indexes[0], j/y is in indexes[1]
-    indx_box = (min(indexes[0]), max(indexes[0])+1,
-                min(indexes[1]), max(indexes[1])+1)
-    if len(grid.shape) == 2:
-        return grid[indx_box[0]:indx_box[1],indx_box[2]:indx_box[3]]
-    return grid[:,indx_box[0]:indx_box[1],indx_box[2]:indx_box[3]]
+    # windows are cached, so the lon/lat grids are only scanned the first
+    # time a bbox is used
+    registry = gridWindowRegistry(lons, lats)
+    if registry is None: window = nodesInBBoxWindow(bbox, lons, lats)
+    else:
+        resolve = lambda bbox: nodesInBBoxWindow(bbox, lons, lats)
+        window = registry.bboxWindow(bbox, resolve, 'inside')
+
+    rows, columns = window.slices
+    if len(grid.shape) == 2: return grid[rows, columns]
+    return grid[:, rows, columns]
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
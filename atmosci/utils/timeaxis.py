@@ -0,0 +1,228 @@
+""" Vectorized hourly time axis functions based on numpy.datetime64.
+
+Hours are always stored as UTC in datetime64[h] arrays. Conversion to
+and from local time uses tables of UTC offsets derived from the pytz
+transition times, so arrays of thousands of hours can be shifted,
+tested for DST and formatted without creating a timezone aware
+datetime for each hour.
+"""
+
+import datetime
+
+import numpy as N
+import pytz
+
+from atmosci.utils import tzutils
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+HOUR_DTYPE = 'datetime64[h]'
+ONE_HOUR = N.timedelta64(1, 'h')
+
+TRANSITION_TABLES = { }
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# CONVERSION TO/FROM datetime64
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def asHour64(time_obj, timezone='UTC'):
+    """ Converts a datetime, hour string ('YYYY-MM-DD:HH') or datetime64
+    to a UTC datetime64[h]. Naive datetimes and strings are assumed to
+    be in timezone. datetime64 values are always assumed to be UTC.
+    """
+    if isinstance(time_obj, N.datetime64):
+        return time_obj.astype(HOUR_DTYPE)
+    hour = tzutils.asHourObject(time_obj)
+    if tzutils.isValidTzinfo(hour.tzinfo):
+        hour = hour.astimezone(pytz.UTC).replace(tzinfo=None)
+    elif not tzutils.isUtcTimezone(timezone):
+        hour = tzutils.asHourInTimezone(hour, timezone)
+        hour = hour.astimezone(pytz.UTC).replace(tzinfo=None)
+    return N.datetime64(hour, 'h')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def asDatetimes(hours, timezone='UTC'):
+    """ Converts an array of UTC datetime64 hours to a list of timezone
+    aware datetimes in timezone. Only intended for API boundaries that
+    still require datetime objects.
+    """
+    tzinfo = tzutils.asTzinfo(timezone)
+    utc_hours = N.asarray(hours, dtype=HOUR_DTYPE).tolist()
+    return [pytz.UTC.localize(hour).astimezone(tzinfo) for hour in utc_hours]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def epochHours(hours):
+    """ Returns an int64 array of hours since 1970-01-01:00 UTC.
+    """
+    return N.asarray(hours, dtype=HOUR_DTYPE).astype(N.int64)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def hourRange(start_time, end_time, timezone='UTC', step=1):
+    """ Returns a datetime64[h] array of the UTC hours from start_time
+    thru end_time (inclusive). Times may be any type accepted by
+    asHour64 and naive times are assumed to be in timezone.
+    """
+    start = asHour64(start_time, timezone)
+    end = asHour64(end_time, timezone)
+    return N.arange(start, end + ONE_HOUR, N.timedelta64(step, 'h'),
+                    dtype=HOUR_DTYPE)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def hoursInRange(start_time, end_time, timezone='UTC'):
+    """ Same as tzutils.hoursInTimespan without any datetime arithmetic.
+    """
+    start = asHour64(start_time, timezone)
+    end = asHour64(end_time, timezone)
+    return abs(int((end - start) / ONE_HOUR)) + 1
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TIME ZONE OFFSETS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def transitionTable(timezone):
+    """ Returns a tuple of 3 arrays for timezone : the UTC hours when
+    the timezone's offset changes, the UTC offset (in hours) that is in
+    effect beginning at each of those hours and the daylight savings
+    adjustment (in hours) included in each offset. Tables are built
+    from the pytz transition data once and cached.
+    """
+    tzinfo = tzutils.asTzinfo(timezone)
+    key = str(tzinfo)
+    table = TRANSITION_TABLES.get(key, None)
+    if table is not None: return table
+
+    if hasattr(tzinfo, '_utc_transition_times'):
+        # first transition time is datetime.min, clip to a usable date
+        times = [max(time_, datetime.datetime(1800,1,1))
+                 for time_ in tzinfo._utc_transition_times]
+        offsets = [ ]
+        dst = [ ]
+        for utcoffset, dst_delta, name in tzinfo._transition_info:
+            offsets.append(int(utcoffset.total_seconds()) // 3600)
+            dst.append(int(dst_delta.total_seconds()) // 3600)
+    else: # static timezones (UTC, EST, etc.)
+        time_ = datetime.datetime(1800,1,1)
+        utcoffset = tzinfo.utcoffset(time_)
+        if utcoffset is None: utcoffset = datetime.timedelta(0)
+        times = [time_]
+        offsets = [int(utcoffset.total_seconds()) // 3600]
+        dst = [0]
+
+    table = (N.array(times, dtype=HOUR_DTYPE),
+             N.array(offsets, dtype=N.int64), N.array(dst, dtype=N.int64))
+    TRANSITION_TABLES[key] = table
+    return table
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _transitionIndexes(hours, timezone):
+    times, offsets, dst = transitionTable(timezone)
+    indexes = N.searchsorted(times, N.asarray(hours, dtype=HOUR_DTYPE),
+                             side='right') - 1
+    return N.clip(indexes, 0, len(times)-1), offsets, dst
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def isDst(hours, timezone):
+    """ Returns a boolean array that is True where the UTC hours fall
+    within daylight savings time in timezone.
+    """
+    indexes, offsets, dst = _transitionIndexes(hours, timezone)
+    return dst[indexes] != 0
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def utcOffsets(hours, timezone):
+    """ Returns an int64 array with the UTC offset (in hours) in timezone
+    at each UTC hour.
+    """
+    indexes, offsets, dst = _transitionIndexes(hours, timezone)
+    return offsets[indexes]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def localToUtc(local_hours, timezone):
+    """ Converts an array of local (wall clock) hours in timezone to UTC.
+    Ambiguous hours at the end of DST resolve to standard time, the same
+    as pytz localize with is_dst=False. Hours skipped at the start of
+    DST resolve to the first hour of DST.
+    """
+    local_hours = N.asarray(local_hours, dtype=HOUR_DTYPE)
+    # first guess uses the standard offset in effect near each hour
+    indexes, offsets, dst = _transitionIndexes(local_hours, timezone)
+    guess = local_hours - (offsets[indexes] - dst[indexes]) * ONE_HOUR
+    utc_hours = local_hours - utcOffsets(guess, timezone) * ONE_HOUR
+    # skipped hours do not survive the round trip back to local time,
+    # the standard offset converts them to the first hour of DST
+    skipped = utcToLocal(utc_hours, timezone) != local_hours
+    return N.where(skipped, guess, utc_hours)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def utcToLocal(hours, timezone):
+    """ Converts an array of UTC hours to local (wall clock) hours in
+    timezone. The result is still a naive datetime64 array.
+    """
+    hours = N.asarray(hours, dtype=HOUR_DTYPE)
+    return hours + utcOffsets(hours, timezone) * ONE_HOUR
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# FORMATTED STRINGS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def hourStrings(hours, separator=':'):
+    """ Returns an array of 'YYYY-MM-DD:HH' strings for datetime64 hours.
+    """
+    strings = N.datetime_as_string(N.asarray(hours, dtype=HOUR_DTYPE))
+    return N.char.replace(strings, 'T', separator)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def timeStrings(hours, prefix='utc'):
+    """ Vectorized version of tzutils.tzaTimeStrings. Returns a dictionary
+    of string arrays with the same keys ('<prefix>_date', '_hour',
+    '_month', '_time' and '_year'). To get strings in local time, pass
+    the result of utcToLocal.
+    """
+    strings = N.datetime_as_string(N.asarray(hours, dtype=HOUR_DTYPE))
+    # 'YYYY-MM-DDTHH' -> 'YYYYMMDDHH'
+    compact = N.char.replace(N.char.replace(strings, '-', ''), 'T', '')
+    compact = compact.astype('S10')
+    hour_of_day = epochHours(hours) % 24
+    return { '%s_date' % prefix : compact.astype('S8'),
+             '%s_hour' % prefix : N.char.zfill(hour_of_day.astype('S2'), 2),
+             '%s_month' % prefix : compact.astype('S6'),
+             '%s_time' % prefix : compact,
+             '%s_year' % prefix : compact.astype('S4') }
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def formatStrings(template, hours, prefix='utc', **kwargs):
+    """ Fills a %(name)s style template (e.g. a file path template) for
+    every hour in hours. Time arguments are the same as those generated
+    by timeStrings and any additional template arguments may be passed
+    in kwargs. Returns a list of strings.
+    """
+    return formatTimeStrings(template, timeStrings(hours, prefix), **kwargs)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def formatTimeStrings(template, time_strings, **kwargs):
+    """ Same as formatStrings, using a dictionary of string arrays that
+    was previously generated by timeStrings (and possibly modified).
+    """
+    keys = time_strings.keys()
+    columns = [N.asarray(time_strings[key]).tolist() for key in keys]
+    arg_dict = dict(kwargs)
+    formatted = [ ]
+    for values in zip(*columns):
+        arg_dict.update(zip(keys, values))
+        formatted.append(template % arg_dict)
+    return formatted
+
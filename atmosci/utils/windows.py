@@ -0,0 +1,195 @@
+""" Registry of the index windows that cover lon/lat bounding boxes in
+a grid.
+
+Finding the grid nodes that bound an area requires a search of (or at
+least a calculation with) the lon/lat grids. Services that read the same
+few dozen county and state areas all day long only need to do that once
+for each area and can then read the data for any later request directly
+from the window of indexes.
+
+Windows for bounding boxes are kept in a least recently used cache that
+is shared by every file with the same lon/lat grids. Windows for named
+regions are never dropped from the cache and can be saved in (and
+loaded from) a grid's static file.
+"""
+
+from collections import OrderedDict, namedtuple
+
+import numpy as N
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# maximum number of bounding box windows cached for each grid
+DEFAULT_CACHE_SIZE = 256
+
+# bounding boxes are rounded to this number of decimal places in cache keys
+BBOX_PRECISION = 6
+
+GRID_WINDOW_REGISTRIES = { }
+
+# record used to save named region windows in a file
+WINDOW_RECORD_DTYPE = [ ('name','|S64'), ('min_lon','<f8'), ('min_lat','<f8'),
+                        ('max_lon','<f8'), ('max_lat','<f8'), ('y0','<i4'),
+                        ('y1','<i4'), ('x0','<i4'), ('x1','<i4'),
+                        ('mask','<i4') ]
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class GridWindow(namedtuple('GridWindow', ('y0','y1','x0','x1','mask'))):
+    """ Window of grid indexes. y0,x0 and y1,x1 are the indexes of the
+    first and last nodes in the window (i.e. y1 and x1 are inclusive).
+
+    mask is None when every node in the window is inside the area the
+    window was created for. Otherwise, it is a boolean array with the
+    shape of the window that is True for nodes inside the area.
+    """
+    __slots__ = ()
+
+    @property
+    def shape(self):
+        return (self.y1 - self.y0 + 1, self.x1 - self.x0 + 1)
+
+    @property
+    def slices(self):
+        return slice(self.y0, self.y1+1), slice(self.x0, self.x1+1)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def asGridWindow(window):
+    if isinstance(window, GridWindow): return window
+    if len(window) == 4: return GridWindow(*(tuple(window) + (None,)))
+    return GridWindow(*window)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def bboxKey(bbox, kind='nodes'):
+    return (kind,) + tuple([round(float(coord), BBOX_PRECISION)
+                            for coord in bbox])
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def nodesInBBoxWindow(bbox, lons, lats):
+    """ Returns a GridWindow for the smallest rectangle of nodes that
+    contains every node inside the bbox (min_lon, min_lat, max_lon,
+    max_lat). The window's mask identifies the nodes in the rectangle
+    that are actually inside the bbox.
+    """
+    min_lon = min(bbox[0], bbox[2])
+    max_lon = max(bbox[0], bbox[2])
+    min_lat = min(bbox[1], bbox[3])
+    max_lat = max(bbox[1], bbox[3])
+    inside = (lons >= min_lon) & (lats >= min_lat) & \
+             (lons <= max_lon) & (lats <= max_lat)
+    rows = N.nonzero(inside.any(axis=1))[0]
+    cols = N.nonzero(inside.any(axis=0))[0]
+    if len(rows) == 0:
+        errmsg = 'No grid nodes are inside bounding box %s.'
+        raise ValueError, errmsg % str(tuple(bbox))
+
+    y0, y1, x0, x1 = int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1])
+    mask = inside[y0:y1+1, x0:x1+1]
+    if mask.all(): mask = None
+    return GridWindow(y0, y1, x0, x1, mask)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class GridWindowRegistry(object):
+    """ Cache of the windows of grid indexes that cover bounding boxes
+    plus a registry of named regions.
+
+    Arguments:
+    ---------
+        max_windows: maximum number of bounding box windows to cache.
+                     The least recently used window is dropped when
+                     the cache is full.
+    """
+
+    def __init__(self, max_windows=DEFAULT_CACHE_SIZE):
+        self.max_windows = max_windows
+        self.hits = 0
+        self.misses = 0
+        # filepaths that named regions have been loaded from
+        self.sources = set()
+        self._regions = { }
+        self._windows = OrderedDict()
+
+    def __contains__(self, name):
+        return name in self._regions
+
+    def __len__(self):
+        return len(self._windows)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @property
+    def regions(self):
+        return tuple(sorted(self._regions.keys()))
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def bboxWindow(self, bbox, resolve, kind='nodes'):
+        """ Returns the cached GridWindow for a bbox. When there isn't
+        one, it is created by calling resolve(bbox) and added to the
+        cache. kind identifies the way resolve finds the nodes, so that
+        windows found in different ways are cached separately.
+        """
+        key = bboxKey(bbox, kind)
+        window = self._windows.pop(key, None)
+        if window is None:
+            self.misses += 1
+            window = asGridWindow(resolve(bbox))
+            if len(self._windows) >= self.max_windows:
+                self._windows.popitem(last=False)
+        else: self.hits += 1
+        self._windows[key] = window
+        return window
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def clear(self):
+        """ Empties the bbox window cache. Named regions are kept.
+        """
+        self._windows.clear()
+        self.hits = 0
+        self.misses = 0
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def region(self, name):
+        """ Returns a (bbox, GridWindow) tuple for a named region.
+        """
+        if name not in self._regions:
+            raise KeyError, '"%s" is not a registered region.' % name
+        return self._regions[name]
+
+    def regionWindow(self, name):
+        return self.region(name)[1]
+
+    def registerRegion(self, name, bbox, window):
+        self._regions[name] = (tuple(bbox), asGridWindow(window))
+
+    def unregisterRegion(self, name):
+        if name in self._regions: del self._regions[name]
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def gridSignature(lons, lats):
+    # repr keeps NaN corners comparable
+    return (lons.shape,) + tuple([repr(float(grid[indx]))
+                                  for grid in (lons, lats)
+                                  for indx in ((0,0), (-1,-1))])
+
+def gridWindowRegistry(lons, lats, max_windows=DEFAULT_CACHE_SIZE):
+    """ Returns the GridWindowRegistry shared by all grids that have the
+    same lons and lats. Returns None when lons and lats are not 2D.
+    """
+    if lons is None or lats is None: return None
+    if lons.ndim != 2 or lons.size == 0: return None
+    signature = gridSignature(lons, lats)
+    registry = GRID_WINDOW_REGISTRIES.get(signature, None)
+    if registry is None:
+        registry = GridWindowRegistry(max_windows)
+        GRID_WINDOW_REGISTRIES[signature] = registry
+    return registry
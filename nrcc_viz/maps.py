@@ -1,5 +1,7 @@
 
 import os, sys
+import copy
+import cPickle
 import warnings
 
 from dateutil.relativedelta import relativedelta
@@ -233,31 +235,208 @@ def contourBounds(data, num_bins, mult=None, missing=None):
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+HI_RES_FACTOR = 5
+RENDER_CONTEXTS = { }
+
+def linearWeights(coords, points):
+    # index of the coordinate at or below each point and the fractional
+    # distance to the next coordinate ... same as basemap.interp order=1
+    if coords[0] > coords[-1]:
+        # descending coordinates (e.g. north to south grid rows) : find
+        # weights in reversed coordinates and map them back, the weight
+        # is always the fraction toward the coordinate at index + 1
+        indexes, weights = linearWeights(coords[::-1], points)
+        return (len(coords) - 2) - indexes, 1. - weights
+    indexes = N.searchsorted(coords, points, side='right') - 1
+    indexes = N.clip(indexes, 0, len(coords)-2)
+    weights = (points - coords[indexes]) / (coords[indexes+1] - coords[indexes])
+    return indexes, N.clip(weights, 0., 1.)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
+
+class MapRenderContext(object):
+    """ Everything about a map that depends only on the map region and
+    the data grid : the basemap projection, the high resolution grid,
+    its projected x/y coordinates, the interpolation weights and the
+    ocean mask. Each piece is built once, on first use, and may be saved
+    to disk so that subsequent maps only interpolate and draw their data.
+    """
+
+    def __init__(self, name, lats, lons, **map_options):
+        self.name = name
+        self.grid_shape = lats.shape
+        self.resolution = map_options['shape_resolution']
+        self.mask_coastlines = map_options.get('mask_coastlines', True)
+
+        if map_options['area'].find("gulfmaine") < 0:
+            self.corners = ( float(N.nanmin(lons)), float(N.nanmin(lats)),
+                             float(N.nanmax(lons)), float(N.nanmax(lats)) )
+        else: self.corners = (-77.0, 41.2, -59.0, 49.5)
+
+        self._basemap = None
+        self._grid_lons = N.array(lons[0], dtype=float)
+        self._grid_lats = N.array(lats[:,0], dtype=float)
+        self._lons = lons
+        self._lats = lats
+        self._modified = False
+        self.hi_res = None
+        self.native_xy = None
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @property
+    def basemap(self):
+        if self._basemap is None:
+            lon_min, lat_min, lon_max, lat_max = self.corners
+            self._basemap = Basemap(llcrnrlon=lon_min, llcrnrlat=lat_min, 
+                                    urcrnrlon=lon_max, urcrnrlat=lat_max,
+                                    projection='merc',
+                                    resolution=self.resolution,
+                                    lat_ts=(lat_max+lat_min)/2.0)
+            self._modified = True
+        return self._basemap
+
+    def figureBasemap(self):
+        """ returns a copy of the basemap for use in a single figure.
+        Drawing on a basemap sets attributes on it (e.g. the axes), so
+        figures must not share the cached instance. The copy still shares
+        the projection and coastline data, which are never modified.
+        """
+        return copy.copy(self.basemap)
+
+    @property
+    def xy_extremes(self):
+        lon_min, lat_min, lon_max, lat_max = self.corners
+        x_max, y_max = self.basemap(lon_max,lat_max)
+        x_min, y_min = self.basemap(lon_min,lat_min)
+        return (x_min, x_max, y_min, y_max)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def hiResGrid(self):
+        """ returns the high resolution grid dictionary, building it on
+        first use
+        """
+        if self.hi_res is None:
+            grid_lons = self._grid_lons
+            grid_lats = self._grid_lats
+            nlats = HI_RES_FACTOR * self.grid_shape[0]
+            nlons = HI_RES_FACTOR * self.grid_shape[1]
+            interp_lons = N.linspace(grid_lons.min(), grid_lons.max(), nlons)
+            interp_lats = N.linspace(grid_lats.min(), grid_lats.max(), nlats)
+            col_indexes, col_weights = linearWeights(grid_lons, interp_lons)
+            row_indexes, row_weights = linearWeights(grid_lats, interp_lats)
+            interp_lons, interp_lats = N.meshgrid(interp_lons, interp_lats)
+            x, y = self.basemap(interp_lons, interp_lats)
+
+            hi_res = { 'lons':interp_lons, 'lats':interp_lats, 'x':x, 'y':y,
+                       'col_indexes':col_indexes, 'col_weights':col_weights,
+                       'row_indexes':row_indexes, 'row_weights':row_weights, }
+            if self.mask_coastlines:
+                from mpl_toolkits.basemap import maskoceans
+                zeros = N.zeros(interp_lons.shape, dtype=float)
+                masked = maskoceans(interp_lons, interp_lats, zeros,
+                                    resolution=self.resolution,
+                                    grid=1.25, inlands=False)
+                hi_res['ocean_mask'] = N.ma.getmaskarray(masked)
+            self.hi_res = hi_res
+            self._modified = True
+        return self.hi_res
+
+    def interpolate(self, grid):
+        """ bilinear interpolation of a data grid to the high resolution
+        grid, with nodes in the ocean masked when mask_coastlines is set
+        """
+        hi_res = self.hiResGrid()
+        rows = hi_res['row_indexes']
+        row_weights = hi_res['row_weights'][:,N.newaxis]
+        cols = hi_res['col_indexes']
+        col_weights = hi_res['col_weights']
+
+        grid = N.asarray(grid, dtype=float)
+        by_row = (grid[rows] * (1. - row_weights)) + (grid[rows+1] * row_weights)
+        interp_grid = by_row[:,cols] * (1. - col_weights)
+        interp_grid += by_row[:,cols+1] * col_weights
+
+        if 'ocean_mask' in hi_res:
+            interp_grid[interp_grid == -999] = N.nan
+            interp_grid = N.ma.masked_array(interp_grid, mask=hi_res['ocean_mask'])
+        return interp_grid
+
+    def nativeXY(self):
+        """ projected x/y coordinates of the data grid nodes """
+        if self.native_xy is None:
+            self.native_xy = self.basemap(self._lons, self._lats)
+        return self.native_xy
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def load(self, dirpath):
+        filepath = os.path.join(dirpath, '%s.pickle' % self.name)
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as _file_:
+                self._basemap = cPickle.load(_file_)
+        filepath = os.path.join(dirpath, '%s.npz' % self.name)
+        if os.path.exists(filepath):
+            arrays = N.load(filepath)
+            self.hi_res = dict([(key, arrays[key]) for key in arrays.files])
+        self._modified = False
+        return self
+
+    def save(self, dirpath):
+        # only write when something was built since the last load/save
+        if not self._modified: return
+        if not os.path.exists(dirpath): os.makedirs(dirpath)
+        if self._basemap is not None:
+            filepath = os.path.join(dirpath, '%s.pickle' % self.name)
+            with open(filepath, 'wb') as _file_:
+                cPickle.dump(self._basemap, _file_, cPickle.HIGHEST_PROTOCOL)
+        if self.hi_res is not None:
+            filepath = os.path.join(dirpath, '%s.npz' % self.name)
+            N.savez(filepath, **self.hi_res)
+        self._modified = False
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
+
+def renderContext(lats, lons, **map_options):
+    """ Returns the cached render context for the map region and data
+    grid. When the 'render_cache_dir' option is set, contexts are loaded
+    from and saved to that directory.
+    """
+    area = map_options.get('area', 'map')
+    mask_coastlines = map_options.get('mask_coastlines', True)
+    key = (area, lats.shape, map_options['shape_resolution'], mask_coastlines,
+           round(float(N.nanmin(lons)),4), round(float(N.nanmin(lats)),4),
+           round(float(N.nanmax(lons)),4), round(float(N.nanmax(lats)),4))
+    context = RENDER_CONTEXTS.get(key, None)
+    if context is None:
+        # bounds are in the name so grids with the same shape in the
+        # same area but covering different extents never share files
+        name = '%s-%dx%d-%s-%s-%s' % (area, lats.shape[0], lats.shape[1],
+                                   map_options['shape_resolution'],
+                                   ('unmasked','masked')[int(mask_coastlines)],
+                                   '_'.join(['%.4f' % coord
+                                             for coord in key[-4:]]))
+        context = MapRenderContext(name, lats, lons, **map_options)
+        cache_dir = map_options.get('render_cache_dir', None)
+        if cache_dir is not None: context.load(cache_dir)
+        RENDER_CONTEXTS[key] = context
+    return context
+
+def saveRenderContexts(dirpath):
+    for context in RENDER_CONTEXTS.values(): context.save(dirpath)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
 def basemapSetup(lats, lons, **map_options):
     # setup plot figure
     fig = pyplot.figure(figsize=(map_options['size_tup']))
     axes = fig.gca()
 
-    # initialize basmap
-    if map_options['area'].find("gulfmaine") < 0:
-        lon_min = N.nanmin(lons)
-        lat_min = N.nanmin(lats)
-        lat_max = N.nanmax(lats)
-        lon_max = N.nanmax(lons)
-    else:
-        lon_min = -77.0
-        lat_min = 41.2
-        lat_max = 49.5
-        lon_max = -59.0
-
-    _base_map_ = Basemap(llcrnrlon=lon_min, llcrnrlat=lat_min, 
-                         urcrnrlon=lon_max, urcrnrlat=lat_max,
-                         projection='merc',
-                         resolution=map_options['shape_resolution'],
-                         lat_ts=(lat_max+lat_min)/2.0)
-    x_max, y_max = _base_map_(lon_max,lat_max)
-    x_min, y_min = _base_map_(lon_min,lat_min)
-    xy_extremes = (x_min, x_max, y_min, y_max)
+    # basemap is only built once per map region, each figure gets a copy
+    context = renderContext(lats, lons, **map_options)
+    _base_map_ = context.figureBasemap()
+    xy_extremes = context.xy_extremes
 
     return _base_map_, fig, axes, xy_extremes
 
@@ -285,37 +464,26 @@ def hiResMap(grid, lats, lons, **options):
     map_options, _basemap_, fig, axes, xy_extremes = \
     mapSetup(options, lats, lons)
 
-    _lons_, _lats_, _grid_ = highResolutionGrid(lats, lons, grid, **options)
-    x, y = _basemap_(_lons_, _lats_)
+    context = renderContext(lats, lons, **map_options)
+    _grid_ = context.interpolate(grid)
+    hi_res = context.hiResGrid()
+    x, y = hi_res['x'], hi_res['y']
+    cache_dir = map_options.get('render_cache_dir', None)
+    if cache_dir is not None: context.save(cache_dir)
 
     return map_options, _basemap_, fig, axes, xy_extremes, x, y, _grid_
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 
 def highResolutionGrid(lats, lons, grid, **options):
-    from mpl_toolkits.basemap import interp
-    from mpl_toolkits.basemap import maskoceans
     # interpolate data to higher resolution grid in order to better match
     # the builtin land/sea mask. Output looks less 'blocky' near coastlines.
-    ##      rbf = Rbf(lons[0], lats[:,0], map_val, epsilon=2)       ##
-    nlats = 5 * lats.shape[0]
-    nlons = 5 * lats.shape[1]
-    interp_lons = N.linspace(N.min(lons), N.max(lons),nlons)
-    interp_lats = N.linspace(N.min(lats), N.max(lats),nlats)
-    interp_lons, interp_lats = N.meshgrid(interp_lons, interp_lats)
-
-    # interpolated high resolution data grid
-    interp_grid = interp(grid, lons[0], lats[:,0], interp_lons, interp_lats)
-    ##map_val to rbf
-
-    # interpolate land/sea mask to data grid, then mask nodes in ocean
-    if options.get('mask_coastlines', True):
-        interp_grid = maskoceans(interp_lons, interp_lats, interp_grid,
-                                 resolution=options['shape_resolution'],
-                                 grid=1.25, inlands=False)
-        interp_grid[interp_grid == -999] = N.nan
-
-    return interp_lons, interp_lats, interp_grid
+    # The grid coordinates, interpolation weights and land/sea mask are
+    # cached in the region's render context.
+    map_options = resolveMapOptions(**options)
+    context = renderContext(lats, lons, **map_options)
+    hi_res = context.hiResGrid()
+    return hi_res['lons'], hi_res['lats'], context.interpolate(grid)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 